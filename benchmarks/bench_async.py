@@ -0,0 +1,171 @@
+"""
+Sync Flask server vs asyncio server against a stand-in model server.
+
+Starts benchmarks/stub_model_server.py, then each app under gunicorn
+exactly as flask/start.sh runs it (one worker; the Flask app on the sync
+worker, async_app.py on the aiohttp worker) with the remote backend
+pointed at the stub, and drives /predict with a fixed number of
+concurrent clients for a fixed duration.
+
+    python benchmarks/bench_async.py --concurrency 200 --duration 10 \
+        --rows 10 --model-latency-ms 20
+"""
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import aiohttp
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+FLASK_DIR = os.path.join(ROOT, "flask")
+STUB = os.path.join(ROOT, "benchmarks", "stub_model_server.py")
+
+SERVERS = {
+    "sync": ["flask_app:app"],
+    "async": ["--worker-class", "aiohttp.GunicornWebWorker", "async_app:app"],
+}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_ready(url, proc, timeout=60.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"{url} exited with {proc.returncode}")
+        try:
+            with socket.create_connection(
+                ("127.0.0.1", int(url.rsplit(":", 1)[1])), timeout=1
+            ):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"{url} did not start within {timeout}s")
+
+
+async def drive(url, concurrency, duration, rows):
+    rng = np.random.default_rng(0)
+    payload = {
+        "instances": rng.normal(size=(rows, 33)).tolist(),
+        "true_class": rng.integers(0, 2, size=rows).tolist(),
+    }
+    latencies = []
+    errors = 0
+    stop_at = time.perf_counter() + duration
+
+    async def client(session):
+        nonlocal errors
+        while time.perf_counter() < stop_at:
+            start = time.perf_counter()
+            try:
+                async with session.post(url + "/predict", json=payload) as r:
+                    await r.read()
+                    ok = r.status == 200
+            except aiohttp.ClientError:
+                ok = False
+            if ok:
+                latencies.append(time.perf_counter() - start)
+            else:
+                errors += 1
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    timeout = aiohttp.ClientTimeout(total=60)
+    async with aiohttp.ClientSession(
+        connector=connector, timeout=timeout
+    ) as session:
+        start = time.perf_counter()
+        await asyncio.gather(*(client(session) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    ms = 1000.0 * np.array(latencies or [0.0])
+    return {
+        "requests_per_s": len(latencies) / elapsed,
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p99_ms": float(np.percentile(ms, 99)),
+        "errors": errors,
+    }
+
+
+def run(mode, stub_url, args):
+    port = free_port()
+    url = f"http://127.0.0.1:{port}"
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(
+            os.environ,
+            INFERENCE_BACKEND="remote",
+            TF_SERVING_URL=stub_url + "/v1/models/fraud_model:predict",
+            MONITORING_DB=os.path.join(tmp, "monitoring.db"),
+            TENSORBOARD_LOGDIR=os.path.join(tmp, "tensorboard"),
+        )
+        cmd = [
+            sys.executable,
+            "-m",
+            "gunicorn",
+            "-w",
+            "1",
+            "-b",
+            f"127.0.0.1:{port}",
+            "--backlog",
+            "2048",
+            "--log-level",
+            "warning",
+            *SERVERS[mode],
+        ]
+        proc = subprocess.Popen(cmd, cwd=FLASK_DIR, env=env)
+        try:
+            wait_ready(url, proc)
+            result = asyncio.run(
+                drive(url, args.concurrency, args.duration, args.rows)
+            )
+        finally:
+            proc.terminate()
+            proc.wait(timeout=30)
+    return {"mode": mode, **result}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--rows", type=int, default=10)
+    parser.add_argument("--model-latency-ms", type=float, default=20.0)
+    args = parser.parse_args()
+
+    stub_port = free_port()
+    stub_url = f"http://127.0.0.1:{stub_port}"
+    stub = subprocess.Popen(
+        [
+            sys.executable,
+            STUB,
+            "--port",
+            str(stub_port),
+            "--latency-ms",
+            str(args.model_latency_ms),
+        ]
+    )
+    try:
+        wait_ready(stub_url, stub)
+        for mode in ("sync", "async"):
+            result = run(mode, stub_url, args)
+            print(
+                f"{result['mode']:>6}: {result['requests_per_s']:8.1f} req/s "
+                f"| p50 {result['p50_ms']:8.2f} ms p99 "
+                f"{result['p99_ms']:8.2f} ms | errors {result['errors']}"
+            )
+    finally:
+        stub.terminate()
+        stub.wait(timeout=30)
+
+
+if __name__ == "__main__":
+    main()
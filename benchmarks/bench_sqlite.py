@@ -0,0 +1,148 @@
+"""
+Concurrent-load benchmark for the monitoring.db storage layer.
+
+Compares the original setup (one shared connection, rollback journal,
+one INSERT per row) with flask/storage.py (WAL, per-thread connections,
+executemany, read-only dashboard connection) while a dashboard thread
+keeps querying the logs table.
+
+    python benchmarks/bench_sqlite.py --threads 8 --requests 200 --rows 20
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "flask")
+)
+from storage import SCHEMA, connect, init_db  # noqa: E402
+
+INSERT_LOG_SQL = """
+INSERT INTO logs (
+    timestamp, latency, prediction, probability, true_class
+) VALUES (?, ?, ?, ?, ?)
+"""
+
+DASHBOARD_QUERIES = [
+    "SELECT * FROM logs LIMIT 50",
+    "SELECT COUNT(*) FROM logs WHERE true_class IS NOT NULL",
+    "SELECT COUNT(*) FROM logs WHERE timestamp >= '2000-01-01'",
+]
+
+
+def make_rows(rng, n):
+    probs = rng.random(n)
+    labels = np.where(probs > 0.5, "Fraud", "Not Fraud").tolist()
+    classes = rng.integers(0, 2, size=n).tolist()
+    ts = datetime.utcnow().isoformat()
+    return [
+        (ts, 0.01, lbl, float(p), tc)
+        for lbl, p, tc in zip(labels, probs.tolist(), classes)
+    ]
+
+
+def run(mode, db_path, threads, requests, rows):
+    if mode == "legacy":
+        shared = sqlite3.connect(db_path, check_same_thread=False)
+        for statement in SCHEMA[:4]:  # original schema had no indexes
+            shared.execute(statement)
+        shared.commit()
+    else:
+        init_db(db_path).close()
+
+    stop = threading.Event()
+    read_latencies = []
+    errors = []
+
+    def writer(seed):
+        rng = np.random.default_rng(seed)
+        conn = shared if mode == "legacy" else connect(db_path)
+        try:
+            for _ in range(requests):
+                batch = make_rows(rng, rows)
+                if mode == "legacy":
+                    cursor = conn.cursor()
+                    for row in batch:
+                        cursor.execute(INSERT_LOG_SQL, row)
+                    conn.commit()
+                else:
+                    with conn:
+                        conn.executemany(INSERT_LOG_SQL, batch)
+        except sqlite3.Error as e:
+            errors.append(repr(e))
+
+    def dashboard():
+        if mode == "legacy":
+            conn = shared
+        else:
+            conn = connect(db_path, readonly=True)
+        while not stop.is_set():
+            for query in DASHBOARD_QUERIES:
+                start = time.perf_counter()
+                try:
+                    conn.execute(query).fetchall()
+                except sqlite3.Error as e:
+                    errors.append(repr(e))
+                read_latencies.append(time.perf_counter() - start)
+            time.sleep(0.005)
+
+    reader = threading.Thread(target=dashboard)
+    workers = [
+        threading.Thread(target=writer, args=(i,)) for i in range(threads)
+    ]
+
+    reader.start()
+    start = time.perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    elapsed = time.perf_counter() - start
+    stop.set()
+    reader.join()
+
+    read_ms = 1000.0 * np.array(read_latencies or [0.0])
+    total = threads * requests
+    return {
+        "mode": mode,
+        "requests_per_s": total / elapsed,
+        "rows_per_s": total * rows / elapsed,
+        "dashboard_p50_ms": float(np.percentile(read_ms, 50)),
+        "dashboard_p99_ms": float(np.percentile(read_ms, 99)),
+        "errors": len(errors),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--rows", type=int, default=20)
+    args = parser.parse_args()
+
+    for mode in ("legacy", "storage"):
+        with tempfile.TemporaryDirectory() as tmp:
+            result = run(
+                mode,
+                os.path.join(tmp, "monitoring.db"),
+                args.threads,
+                args.requests,
+                args.rows,
+            )
+        print(
+            f"{result['mode']:>8}: {result['requests_per_s']:8.1f} req/s "
+            f"{result['rows_per_s']:10.1f} rows/s | dashboard p50 "
+            f"{result['dashboard_p50_ms']:6.2f} ms p99 "
+            f"{result['dashboard_p99_ms']:7.2f} ms | errors {result['errors']}"
+        )
+
+
+if __name__ == "__main__":
+    main()
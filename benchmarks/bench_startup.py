@@ -0,0 +1,130 @@
+"""
+Cold-start cost of the Flask API: import time and first-request latency.
+
+Each run is a fresh interpreter that imports flask_app.py and sends one
+/predict through the Flask test client, with the remote backend pointed
+at benchmarks/stub_model_server.py. The working tree is compared with
+the flask/ directory of a git revision (e.g. the commit before a
+startup change), extracted with ``git archive``.
+
+    python benchmarks/bench_startup.py --ref HEAD~1 --runs 5
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tarfile
+import tempfile
+
+import numpy as np
+from bench_async import FLASK_DIR, ROOT, STUB, free_port, wait_ready
+
+# Runs inside the measured interpreter; prints one JSON line
+CHILD = """
+import sys, time
+start = time.perf_counter()
+sys.path.insert(0, sys.argv[1])
+import flask_app
+imported = time.perf_counter()
+client = flask_app.app.test_client()
+response = client.post("/predict", json={"instances": [[0.0] * 33]})
+first = time.perf_counter()
+assert response.status_code == 200, response.get_data(as_text=True)
+print(__import__("json").dumps({
+    "import_seconds": imported - start,
+    "first_request_seconds": first - imported,
+    "heavy_modules": sorted(
+        name for name in ("tensorflow", "pandas", "pyarrow", "sklearn")
+        if name in sys.modules
+    ),
+}))
+sys.stdout.flush()
+__import__("os")._exit(0)
+"""
+
+
+def extract(ref, directory):
+    """Write the flask/ directory of ``ref`` below ``directory``."""
+    archive = os.path.join(directory, "flask.tar")
+    subprocess.run(
+        ["git", "archive", "--format=tar", "-o", archive, ref, "flask"],
+        cwd=ROOT,
+        check=True,
+    )
+    with tarfile.open(archive) as tar:
+        tar.extractall(directory)
+    return os.path.join(directory, "flask")
+
+
+def measure(flask_dir, stub_url, runs):
+    samples = []
+    for _ in range(runs):
+        with tempfile.TemporaryDirectory() as tmp:
+            env = dict(
+                os.environ,
+                INFERENCE_BACKEND="remote",
+                TF_SERVING_URL=stub_url + "/v1/models/fraud_model:predict",
+                MONITORING_DB=os.path.join(tmp, "monitoring.db"),
+                TENSORBOARD_LOGDIR=os.path.join(tmp, "tensorboard"),
+            )
+            out = subprocess.run(
+                [sys.executable, "-c", CHILD, flask_dir],
+                cwd=tmp,
+                env=env,
+                check=True,
+                capture_output=True,
+                text=True,
+            ).stdout
+            samples.append(json.loads(out.strip().splitlines()[-1]))
+
+    result = {"runs": runs, "heavy_modules": samples[-1]["heavy_modules"]}
+    for key in ("import_seconds", "first_request_seconds"):
+        values = np.array([sample[key] for sample in samples])
+        result[key] = float(np.median(values))
+        result[key.replace("seconds", "min_seconds")] = float(values.min())
+    result["total_seconds"] = (
+        result["import_seconds"] + result["first_request_seconds"]
+    )
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--ref", help="git revision to compare against")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--output", help="write the results as JSON")
+    args = parser.parse_args()
+
+    stub_port = free_port()
+    stub_url = f"http://127.0.0.1:{stub_port}"
+    stub = subprocess.Popen(
+        [sys.executable, STUB, "--port", str(stub_port), "--latency-ms", "1"]
+    )
+    results = {}
+    try:
+        wait_ready(stub_url, stub)
+        with tempfile.TemporaryDirectory() as tmp:
+            trees = [("working tree", FLASK_DIR)]
+            if args.ref:
+                trees.insert(0, (args.ref, extract(args.ref, tmp)))
+            for name, flask_dir in trees:
+                results[name] = measure(flask_dir, stub_url, args.runs)
+    finally:
+        stub.terminate()
+        stub.wait(timeout=30)
+
+    for name, result in results.items():
+        print(
+            f"{name:>14}: import {result['import_seconds']:6.3f} s | "
+            f"first request {result['first_request_seconds']:6.3f} s | "
+            f"total {result['total_seconds']:6.3f} s | "
+            f"loaded: {', '.join(result['heavy_modules']) or '-'}"
+        )
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,399 @@
+"""
+End-to-end load test of /predict against a stand-in model server.
+
+Starts benchmarks/stub_model_server.py with the given latency and jitter,
+serves flask_app.py (or async_app.py) through flask/gunicorn.conf.py as
+flask/start.sh does, with the remote backend pointed at the stub, and
+replays transactions at a fixed rate (open loop) or as fast as the
+clients allow (closed loop). Rows come from a CSV in the 33-feature
+format of the Streamlit UI (``Time, V1..V28, Amount, log_amount, hour,
+is_night`` and an optional ``Class``) or are synthetic.
+
+Reports throughput and p50/p95/p99 latency per batch size, and writes
+the results as JSON; ``--compare`` checks them against an earlier run
+and exits with status 1 on a regression.
+
+    python benchmarks/loadtest.py --batch-sizes 1,10,100 --qps 200 \
+        --concurrency 64 --duration 20 --model-latency-ms 20 \
+        --model-jitter-ms 10 --output loadtest.json
+    python benchmarks/loadtest.py ... --compare loadtest.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import aiohttp
+import numpy as np
+from bench_async import FLASK_DIR, ROOT, STUB, free_port, wait_ready
+
+NUM_FEATURES = 33
+# Distinct request bodies per batch size, cycled through during a run
+PAYLOADS_PER_SIZE = 64
+ARROW_CONTENT_TYPE = "application/vnd.apache.arrow.stream"
+
+SERVERS = {
+    "sync": ["flask_app:app"],
+    "async": ["--worker-class", "aiohttp.GunicornWebWorker", "async_app:app"],
+}
+
+# Lower is better for latencies, higher for throughput
+COMPARED = {
+    "p50_ms": "lower",
+    "p95_ms": "lower",
+    "p99_ms": "lower",
+    "requests_per_s": "higher",
+}
+
+
+def load_rows(path, rng, count=10000, fraud_rate=0.002):
+    """
+    ``(features, labels)``: the CSV rows (``Class`` becomes the labels),
+    or ``count`` standard-normal rows with ``fraud_rate`` positives.
+    """
+    if path is None:
+        features = rng.normal(size=(count, NUM_FEATURES))
+        labels = (rng.random(count) < fraud_rate).astype(np.int64)
+        return features.astype(np.float32), labels
+
+    import pandas as pd
+
+    df = pd.read_csv(path)
+    labels = None
+    if "Class" in df.columns:
+        labels = df.pop("Class").to_numpy(np.int64)
+    features = df.apply(pd.to_numeric, errors="coerce").fillna(0.0)
+    if features.shape[1] != NUM_FEATURES:
+        raise SystemExit(
+            f"{path}: expected {NUM_FEATURES} feature columns, "
+            f"got {features.shape[1]}"
+        )
+    return features.to_numpy(np.float32), labels
+
+
+def encode(features, labels, fmt):
+    """``(body, content type)`` as sent by the Streamlit UI."""
+    if fmt == "json":
+        payload = {"instances": features.tolist()}
+        if labels is not None:
+            payload["true_class"] = labels.tolist()
+        return json.dumps(payload).encode(), "application/json"
+
+    import pyarrow as pa
+
+    table = pa.table(
+        {f"f{i}": features[:, i] for i in range(features.shape[1])}
+    )
+    if labels is not None:
+        table = table.append_column("true_class", pa.array(labels))
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes(), ARROW_CONTENT_TYPE
+
+
+def make_payloads(features, labels, batch_size, fmt, rng):
+    payloads = []
+    for _ in range(PAYLOADS_PER_SIZE):
+        idx = rng.integers(0, len(features), size=batch_size)
+        batch_labels = None if labels is None else labels[idx]
+        payloads.append(encode(features[idx], batch_labels, fmt))
+    return payloads
+
+
+async def drive(url, payloads, qps, concurrency, duration, warmup):
+    """
+    Send requests for ``warmup + duration`` seconds; only the last
+    ``duration`` seconds are measured.
+
+    With ``qps > 0`` requests are scheduled at a fixed rate and latency
+    counts from the scheduled send time, so queueing in front of a
+    saturated server is included (no coordinated omission). With
+    ``qps == 0`` each of the ``concurrency`` clients sends back to back.
+    """
+    latencies = []
+    statuses = {}
+    errors = 0
+    start = time.perf_counter()
+    measure_from = start + warmup
+    stop_at = measure_from + duration
+
+    async def send(session, i, scheduled):
+        nonlocal errors
+        body, content_type = payloads[i % len(payloads)]
+        try:
+            async with session.post(
+                url + "/predict",
+                data=body,
+                headers={"Content-Type": content_type},
+            ) as r:
+                await r.read()
+                status = r.status
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            status = None
+        if scheduled < measure_from:
+            return
+        if status is None:
+            errors += 1
+            return
+        statuses[status] = statuses.get(status, 0) + 1
+        if status == 200:
+            latencies.append(time.perf_counter() - scheduled)
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    timeout = aiohttp.ClientTimeout(total=60)
+    async with aiohttp.ClientSession(
+        connector=connector, timeout=timeout
+    ) as session:
+        if qps > 0:
+            tasks = []
+            i = 0
+            while True:
+                scheduled = start + i / qps
+                if scheduled >= stop_at:
+                    break
+                delay = scheduled - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                tasks.append(
+                    asyncio.ensure_future(send(session, i, scheduled))
+                )
+                i += 1
+            await asyncio.gather(*tasks)
+        else:
+            counter = iter(range(1 << 62))
+
+            async def client():
+                while time.perf_counter() < stop_at:
+                    await send(session, next(counter), time.perf_counter())
+
+            await asyncio.gather(*(client() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - measure_from
+
+    ok = len(latencies)
+    ms = 1000.0 * np.array(latencies or [np.nan])
+    return {
+        "requests": errors + sum(statuses.values()),
+        "ok": ok,
+        "errors": errors,
+        "statuses": {str(k): v for k, v in sorted(statuses.items())},
+        "requests_per_s": ok / elapsed,
+        "mean_ms": float(np.mean(ms)),
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p95_ms": float(np.percentile(ms, 95)),
+        "p99_ms": float(np.percentile(ms, 99)),
+        "max_ms": float(np.max(ms)),
+    }
+
+
+def start_server(args, stub_url, tmp):
+    port = free_port()
+    env = dict(
+        os.environ,
+        WEB_CONCURRENCY=str(args.workers),
+        INFERENCE_BACKEND="remote",
+        TF_SERVING_URL=stub_url + "/v1/models/fraud_model:predict",
+        MONITORING_DB=os.path.join(tmp, "monitoring.db"),
+        TENSORBOARD_LOGDIR=os.path.join(tmp, "tensorboard"),
+        METRICS_MULTIPROC_DIR=os.path.join(tmp, "metrics"),
+    )
+    cmd = [
+        sys.executable,
+        "-m",
+        "gunicorn",
+        "-c",
+        "gunicorn.conf.py",
+        "--bind",
+        f"127.0.0.1:{port}",
+        "--backlog",
+        "2048",
+        "--log-level",
+        "warning",
+        *SERVERS[args.server],
+    ]
+    proc = subprocess.Popen(cmd, cwd=FLASK_DIR, env=env)
+    url = f"http://127.0.0.1:{port}"
+    try:
+        wait_ready(url, proc)
+    except Exception:
+        proc.terminate()
+        raise
+    return url, proc
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT,
+            stderr=subprocess.DEVNULL,
+            text=True,
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_path, tolerance):
+    """Print per-metric changes; returns the regressions found."""
+    with open(baseline_path) as f:
+        baseline = {r["batch_size"]: r for r in json.load(f)["results"]}
+    regressions = []
+    for result in results:
+        before = baseline.get(result["batch_size"])
+        if before is None:
+            continue
+        for metric, better in COMPARED.items():
+            old, new = before[metric], result[metric]
+            if not old or np.isnan(old) or np.isnan(new):
+                continue
+            change = (new - old) / old
+            worse = (
+                change > tolerance
+                if better == "lower"
+                else (change < -tolerance)
+            )
+            flag = "REGRESSION" if worse else ""
+            print(
+                f"  batch {result['batch_size']:>5} {metric:>14}: "
+                f"{old:10.2f} -> {new:10.2f} ({change:+7.1%}) {flag}"
+            )
+            if worse:
+                regressions.append((result["batch_size"], metric, change))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--batch-sizes",
+        default="1,10,100",
+        help="comma-separated rows per request",
+    )
+    parser.add_argument(
+        "--qps",
+        type=float,
+        default=0.0,
+        help="target requests/s (0 = closed loop)",
+    )
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--warmup", type=float, default=2.0)
+    parser.add_argument("--csv", help="rows in the Streamlit CSV format")
+    parser.add_argument("--format", choices=("json", "arrow"), default="json")
+    parser.add_argument("--server", choices=tuple(SERVERS), default="sync")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--url", help="existing server (no stub is started)")
+    parser.add_argument("--model-latency-ms", type=float, default=20.0)
+    parser.add_argument("--model-jitter-ms", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the results as JSON")
+    parser.add_argument("--compare", help="results JSON of an earlier run")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.10,
+        help="relative change counted as a regression",
+    )
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    features, labels = load_rows(args.csv, rng)
+    batch_sizes = [int(size) for size in args.batch_sizes.split(",")]
+
+    procs = []
+    with tempfile.TemporaryDirectory() as tmp:
+        try:
+            url = args.url
+            if url is None:
+                stub_port = free_port()
+                stub_url = f"http://127.0.0.1:{stub_port}"
+                procs.append(
+                    subprocess.Popen(
+                        [
+                            sys.executable,
+                            STUB,
+                            "--port",
+                            str(stub_port),
+                            "--latency-ms",
+                            str(args.model_latency_ms),
+                            "--jitter-ms",
+                            str(args.model_jitter_ms),
+                        ]
+                    )
+                )
+                wait_ready(stub_url, procs[0])
+                url, server = start_server(args, stub_url, tmp)
+                procs.append(server)
+
+            results = []
+            for batch_size in batch_sizes:
+                payloads = make_payloads(
+                    features, labels, batch_size, args.format, rng
+                )
+                result = asyncio.run(
+                    drive(
+                        url,
+                        payloads,
+                        args.qps,
+                        args.concurrency,
+                        args.duration,
+                        args.warmup,
+                    )
+                )
+                result = {
+                    "batch_size": batch_size,
+                    **result,
+                    "rows_per_s": result["requests_per_s"] * batch_size,
+                }
+                results.append(result)
+                print(
+                    f"batch {batch_size:>5}: "
+                    f"{result['requests_per_s']:8.1f} req/s "
+                    f"{result['rows_per_s']:10.1f} rows/s | p50 "
+                    f"{result['p50_ms']:8.2f} p95 {result['p95_ms']:8.2f} "
+                    f"p99 {result['p99_ms']:8.2f} ms | "
+                    f"non-200 {result['requests'] - result['ok']}"
+                )
+        finally:
+            for proc in reversed(procs):
+                proc.terminate()
+                proc.wait(timeout=30)
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "host": {
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+        },
+        "config": {
+            key: value
+            for key, value in vars(args).items()
+            if key not in ("output", "compare")
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+
+    if args.compare:
+        print(f"Compared with {args.compare}:")
+        regressions = compare(results, args.compare, args.tolerance)
+        if regressions:
+            print(
+                f"{len(regressions)} regression(s) beyond "
+                f"{args.tolerance:.0%}"
+            )
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+Local stand-in for the TF Serving REST API.
+
+Answers ``POST /v1/models/fraud_model:predict`` after a configurable
+delay with deterministic probabilities (sigmoid of the row mean), and
+``GET /v1/models/fraud_model`` with an AVAILABLE version 1, so the
+Flask and asyncio apps can be benchmarked without a real model server.
+
+    python benchmarks/stub_model_server.py --port 8501 --latency-ms 20
+"""
+import argparse
+import asyncio
+import random
+
+import numpy as np
+from aiohttp import web
+
+MODEL_PATH = "/v1/models/fraud_model"
+
+
+def make_app(latency_ms=20.0, jitter_ms=0.0):
+    async def predict(request):
+        payload = await request.json()
+        instances = np.asarray(payload["instances"], dtype=np.float32)
+        delay = latency_ms + random.uniform(0.0, jitter_ms)
+        await asyncio.sleep(delay / 1000.0)
+        probs = 1.0 / (1.0 + np.exp(-instances.mean(axis=1)))
+        return web.json_response(
+            {"predictions": [[p] for p in probs.tolist()]}
+        )
+
+    async def status(request):
+        return web.json_response(
+            {"model_version_status": [{"version": "1", "state": "AVAILABLE"}]}
+        )
+
+    app = web.Application(client_max_size=64 * 1024 * 1024)
+    app.router.add_post(MODEL_PATH + ":predict", predict)
+    app.router.add_get(MODEL_PATH, status)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8501)
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    args = parser.parse_args()
+
+    web.run_app(
+        make_app(args.latency_ms, args.jitter_ms),
+        host=args.host,
+        port=args.port,
+        print=None,
+    )
+
+
+if __name__ == "__main__":
+    main()
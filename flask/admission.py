@@ -0,0 +1,425 @@
+import asyncio
+import math
+import os
+import threading
+import time
+from collections import deque
+
+import numpy as np
+from resilience import DegradedScores
+from telemetry import ADMISSION_REJECTIONS, ADMISSION_WAIT_SECONDS
+
+# -----------------------------
+# Admission control and priority lanes
+# -----------------------------
+# Model calls of a worker go through a fixed number of slots. Requests of
+# up to INTERACTIVE_MAX_ROWS rows (single transactions, small batches)
+# wait in the interactive lane, larger ones in the bulk lane, and a free
+# slot always goes to the interactive lane first. Bulk requests are
+# scored in chunks of ADMISSION_CHUNK_ROWS that queue again for a slot,
+# so an interactive request waits for one chunk at most. Each lane holds
+# at most ADMISSION_QUEUE_SIZE waiting requests; beyond that, or after
+# ADMISSION_QUEUE_TIMEOUT seconds in the queue, the request gets a 429
+# with Retry-After.
+#
+# In the Flask app a waiting request holds a gunicorn thread, and lanes
+# only apply to requests that got one. Bulk requests holding or waiting
+# for a slot are therefore capped at GUNICORN_THREADS minus
+# ADMISSION_RESERVED_THREADS; beyond that they get a 429 at once, so an
+# interactive request always finds a thread. Off by default: the slots
+# sit in front of the micro-batcher, so they also bound how many
+# requests it can coalesce.
+ADMISSION = os.environ.get("ADMISSION", "0") == "1"
+# Larger requests get a 413 (0 = no limit), with or without ADMISSION
+MAX_INSTANCES = int(os.environ.get("MAX_INSTANCES", "0"))
+# Concurrent model calls per worker; unset: one per gunicorn thread
+# (Flask), 64 (asyncio app)
+GUNICORN_THREADS = int(os.environ.get("GUNICORN_THREADS", "4"))
+ADMISSION_SLOTS = int(os.environ.get("ADMISSION_SLOTS", "0"))
+# Slots bulk chunks may hold at once; unset: all but one
+ADMISSION_BULK_SLOTS = int(os.environ.get("ADMISSION_BULK_SLOTS", "0"))
+# Flask threads bulk requests may not occupy, holding or waiting
+ADMISSION_RESERVED_THREADS = int(
+    os.environ.get("ADMISSION_RESERVED_THREADS", "1")
+)
+# Waiting requests per lane; unset: what the threads left after the
+# slots can hold (Flask), 64 (asyncio app)
+ADMISSION_QUEUE_SIZE = int(os.environ.get("ADMISSION_QUEUE_SIZE", "0"))
+ADMISSION_QUEUE_TIMEOUT = float(os.environ.get("ADMISSION_QUEUE_TIMEOUT", "5"))
+INTERACTIVE_MAX_ROWS = int(os.environ.get("INTERACTIVE_MAX_ROWS", "32"))
+ADMISSION_CHUNK_ROWS = int(os.environ.get("ADMISSION_CHUNK_ROWS", "1024"))
+
+RETRY_AFTER_HEADER = "Retry-After"
+# Bounds of the Retry-After estimate, in seconds
+RETRY_AFTER_MIN, RETRY_AFTER_MAX = 1, 60
+
+INTERACTIVE, BULK = "interactive", "bulk"
+# Scheduling order: a free slot goes to the first lane with a waiter
+LANES = (INTERACTIVE, BULK)
+
+
+class AdmissionError(Exception):
+    """A scoring request that is not admitted; carries the HTTP status."""
+
+    status = 503
+    retry_after = None
+
+
+class RequestTooLarge(AdmissionError):
+    status = 413
+
+
+class Overloaded(AdmissionError):
+    status = 429
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def error_headers(error):
+    """Response headers of an ``AdmissionError`` (Retry-After on 429)."""
+    if error.retry_after is None:
+        return {}
+    return {RETRY_AFTER_HEADER: str(error.retry_after)}
+
+
+class _Admission:
+    """
+    Slot accounting, lanes and stats shared by the Flask and asyncio
+    variants. Waiters are queued per lane; ``_grant`` hands freed slots
+    out in ``LANES`` order.
+    """
+
+    default_slots = 64
+    # Bulk requests holding or waiting for a slot; None: no limit
+    bulk_threads = None
+
+    def __init__(
+        self,
+        enabled=ADMISSION,
+        max_instances=MAX_INSTANCES,
+        slots=ADMISSION_SLOTS,
+        bulk_slots=ADMISSION_BULK_SLOTS,
+        queue_size=ADMISSION_QUEUE_SIZE,
+        queue_timeout=ADMISSION_QUEUE_TIMEOUT,
+        interactive_max_rows=INTERACTIVE_MAX_ROWS,
+        chunk_rows=ADMISSION_CHUNK_ROWS,
+    ):
+        self.enabled = enabled
+        self.max_instances = max_instances
+        self.slots = slots or self.default_slots
+        self.bulk_slots = bulk_slots or max(1, self.slots - 1)
+        self.queue_size = queue_size or self._default_queue_size()
+        self.queue_timeout = queue_timeout
+        self.interactive_max_rows = interactive_max_rows
+        self.chunk_rows = chunk_rows
+
+        self._active = dict.fromkeys(LANES, 0)
+        self._waiting = {lane: deque() for lane in LANES}
+        self._admitted = dict.fromkeys(LANES, 0)
+        self._rejected = {}
+        # Moving average of how long a model call holds a slot
+        self._hold_seconds = None
+
+    def _default_queue_size(self):
+        return 64
+
+    def lane(self, rows):
+        return INTERACTIVE if rows <= self.interactive_max_rows else BULK
+
+    def check_size(self, rows):
+        if self.max_instances and rows > self.max_instances:
+            self._count_rejection(self.lane(rows), "too_large")
+            raise RequestTooLarge(
+                f"Too many instances: {rows} (limit {self.max_instances}); "
+                "split the batch or use /predict/stream"
+            )
+
+    def _chunks(self, data, lane):
+        if lane == INTERACTIVE or len(data) <= self.chunk_rows:
+            return [data]
+        return [
+            data[i : i + self.chunk_rows]
+            for i in range(0, len(data), self.chunk_rows)
+        ]
+
+    @staticmethod
+    def _merge(results):
+        if len(results) == 1:
+            return results[0]
+        probs = np.concatenate(
+            [np.asarray(result).view(np.ndarray) for result in results]
+        )
+        # One fallback-scored chunk makes the whole response degraded
+        if any(isinstance(result, DegradedScores) for result in results):
+            return probs.view(DegradedScores)
+        return probs
+
+    def _free(self, lane):
+        if sum(self._active.values()) >= self.slots:
+            return False
+        return lane == INTERACTIVE or self._active[BULK] < self.bulk_slots
+
+    def _ahead(self, lane):
+        """Waiters that must be served before a new ``lane`` request."""
+        if self._waiting[lane]:
+            return True
+        return lane == BULK and bool(self._waiting[INTERACTIVE])
+
+    def _try_take(self, lane):
+        if self._ahead(lane) or not self._free(lane):
+            return False
+        self._active[lane] += 1
+        return True
+
+    def _check_queue(self, lane, admitted):
+        # Later chunks of an admitted bulk request are never turned away
+        if admitted:
+            return
+        if (
+            lane == BULK
+            and self.bulk_threads is not None
+            and self._active[BULK] + len(self._waiting[BULK])
+            >= self.bulk_threads
+        ):
+            self._reject(lane, "threads_full")
+        if len(self._waiting[lane]) >= self.queue_size:
+            self._reject(lane, "queue_full")
+
+    def _grant(self):
+        """Pop the waiters that get a slot now, interactive lane first."""
+        granted = []
+        for lane in LANES:
+            waiting = self._waiting[lane]
+            while waiting and self._free(lane):
+                self._active[lane] += 1
+                granted.append(waiting.popleft())
+        return granted
+
+    def _released(self, lane, held):
+        self._active[lane] -= 1
+        if held is None:
+            return
+        self._hold_seconds = (
+            held
+            if self._hold_seconds is None
+            else 0.9 * self._hold_seconds + 0.1 * held
+        )
+
+    def _admit(self, lane, waited):
+        self._admitted[lane] += 1
+        ADMISSION_WAIT_SECONDS.observe(waited, (lane,))
+
+    def retry_after(self, lane):
+        """Seconds until the lane's queue has likely drained, rounded up."""
+        hold = self._hold_seconds or 0.0
+        waiting = len(self._waiting[INTERACTIVE])
+        if lane == BULK:
+            waiting += len(self._waiting[BULK])
+        seconds = math.ceil((waiting + 1) * hold / self.slots)
+        return min(max(seconds, RETRY_AFTER_MIN), RETRY_AFTER_MAX)
+
+    def _count_rejection(self, lane, reason):
+        key = (lane, reason)
+        self._rejected[key] = self._rejected.get(key, 0) + 1
+        ADMISSION_REJECTIONS.inc(labels=key)
+
+    def _reject(self, lane, reason):
+        self._count_rejection(lane, reason)
+        raise Overloaded(
+            f"Server busy ({lane} lane: {reason.replace('_', ' ')}), "
+            "retry later",
+            self.retry_after(lane),
+        )
+
+    def register_metrics(self, registry):
+        registry.callback(
+            "fraud_admission_queue_depth",
+            "gauge",
+            "Requests waiting for a model call slot, by lane.",
+            lambda: {(lane,): len(self._waiting[lane]) for lane in LANES},
+            labelnames=("lane",),
+        )
+        registry.callback(
+            "fraud_admission_active",
+            "gauge",
+            "Model call slots in use, by lane.",
+            lambda: {(lane,): self._active[lane] for lane in LANES},
+            labelnames=("lane",),
+        )
+        registry.callback(
+            "fraud_admission_slots",
+            "gauge",
+            "Model call slots per worker, summed over workers.",
+            lambda: self.slots if self.enabled else 0,
+        )
+
+    def stats(self):
+        return {
+            "enabled": self.enabled,
+            "max_instances": self.max_instances,
+            "slots": self.slots,
+            "bulk_slots": self.bulk_slots,
+            "bulk_threads": self.bulk_threads,
+            "queue_size": self.queue_size,
+            "queue_timeout_secs": self.queue_timeout,
+            "interactive_max_rows": self.interactive_max_rows,
+            "chunk_rows": self.chunk_rows,
+            "hold_seconds": self._hold_seconds,
+            "lanes": {
+                lane: {
+                    "active": self._active[lane],
+                    "queue_depth": len(self._waiting[lane]),
+                    "admitted": self._admitted[lane],
+                    "rejected": {
+                        reason: count
+                        for (rejected_lane, reason), count in sorted(
+                            self._rejected.items()
+                        )
+                        if rejected_lane == lane
+                    },
+                }
+                for lane in LANES
+            },
+        }
+
+
+class _Waiter:
+    __slots__ = ("event", "granted")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.granted = False
+
+
+class Admission(_Admission):
+    """
+    Admission control for the threaded Flask app.
+
+    Slots default to the worker's ``threads``. Bulk requests may occupy
+    ``threads - reserved_threads`` of them, whether holding a slot or
+    waiting, and get a 429 beyond that. The queue bound defaults to the
+    waiters the threads not covered by slots can hold, keeping one free
+    to answer with the 429.
+    """
+
+    def __init__(
+        self,
+        threads=GUNICORN_THREADS,
+        reserved_threads=ADMISSION_RESERVED_THREADS,
+        slots=ADMISSION_SLOTS,
+        **kwargs,
+    ):
+        self.threads = threads
+        super().__init__(slots=slots or threads, **kwargs)
+        self.bulk_threads = max(1, threads - reserved_threads)
+        self.bulk_slots = min(self.bulk_slots, self.bulk_threads)
+        self._lock = threading.Lock()
+
+    def _default_queue_size(self):
+        return max(1, self.threads - self.slots - 1)
+
+    def score(self, predict_fn, data, lane=None, admitted=False):
+        """
+        ``predict_fn(data)`` once a slot is free; bulk requests chunk by
+        chunk. ``admitted=True`` skips the queue bound and timeout (later
+        chunks of a stream). Raises ``AdmissionError``.
+        """
+        self.check_size(len(data))
+        if not self.enabled:
+            return predict_fn(data)
+        lane = lane or self.lane(len(data))
+        results = []
+        for i, chunk in enumerate(self._chunks(data, lane)):
+            self.acquire(lane, admitted or i > 0)
+            start = time.perf_counter()
+            try:
+                results.append(predict_fn(chunk))
+            finally:
+                self.release(lane, time.perf_counter() - start)
+        return self._merge(results)
+
+    def acquire(self, lane, admitted=False):
+        start = time.perf_counter()
+        with self._lock:
+            if self._try_take(lane):
+                self._admit(lane, 0.0)
+                return
+            self._check_queue(lane, admitted)
+            waiter = _Waiter()
+            self._waiting[lane].append(waiter)
+
+        timeout = None if admitted else self.queue_timeout
+        waiter.event.wait(timeout)
+        with self._lock:
+            if not waiter.granted:
+                self._waiting[lane].remove(waiter)
+                self._reject(lane, "queue_timeout")
+            self._admit(lane, time.perf_counter() - start)
+
+    def release(self, lane, held=None):
+        with self._lock:
+            self._released(lane, held)
+            for waiter in self._grant():
+                waiter.granted = True
+                waiter.event.set()
+
+    def stats(self):
+        with self._lock:
+            return super().stats()
+
+
+class AsyncAdmission(_Admission):
+    """
+    Admission control for the asyncio app: waiters are futures on the
+    event loop, so no locking is needed. A request here only holds a
+    coroutine, hence the larger default slot count.
+    """
+
+    async def score(self, predict_fn, data, lane=None, admitted=False):
+        """Awaitable variant of ``Admission.score``."""
+        self.check_size(len(data))
+        if not self.enabled:
+            return await predict_fn(data)
+        lane = lane or self.lane(len(data))
+        results = []
+        for i, chunk in enumerate(self._chunks(data, lane)):
+            await self.acquire(lane, admitted or i > 0)
+            start = time.perf_counter()
+            try:
+                results.append(await predict_fn(chunk))
+            finally:
+                self.release(lane, time.perf_counter() - start)
+        return self._merge(results)
+
+    async def acquire(self, lane, admitted=False):
+        start = time.perf_counter()
+        if self._try_take(lane):
+            self._admit(lane, 0.0)
+            return
+        self._check_queue(lane, admitted)
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiting[lane].append(waiter)
+
+        timeout = None if admitted else self.queue_timeout
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), timeout)
+        except asyncio.TimeoutError:
+            # Granted in the same loop iteration as the timeout: keep it
+            if not waiter.done():
+                self._waiting[lane].remove(waiter)
+                self._reject(lane, "queue_timeout")
+        except asyncio.CancelledError:
+            # Client went away: give back a slot granted meanwhile
+            if waiter.done():
+                self.release(lane)
+            else:
+                self._waiting[lane].remove(waiter)
+            raise
+        self._admit(lane, time.perf_counter() - start)
+
+    def release(self, lane, held=None):
+        self._released(lane, held)
+        for waiter in self._grant():
+            waiter.set_result(None)
@@ -0,0 +1,317 @@
+import os
+import threading
+import time
+import traceback
+
+from storage import connect
+from telemetry import span
+
+# -----------------------------
+# Alert evaluation configuration
+# -----------------------------
+ALERT_EVAL_SECS = float(os.environ.get("ALERT_EVAL_SECS", "15"))
+# A breach must last this long before the alert fires
+ALERT_FOR_SECS = float(os.environ.get("ALERT_FOR_SECS", "60"))
+# A firing alert is not resolved earlier than this
+ALERT_MIN_FIRING_SECS = float(os.environ.get("ALERT_MIN_FIRING_SECS", "300"))
+
+OK, PENDING, FIRING, RESOLVED = "ok", "pending", "firing", "resolved"
+
+UPSERT_ALERT_STATE_SQL = """
+INSERT OR REPLACE INTO alert_state (
+    metric, state, since, fired_at, value, threshold, updated
+) VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
+
+
+def hysteresis(metric, default):
+    """``<METRIC>_ALERT_HYSTERESIS`` or ``default``."""
+    return float(os.environ.get(f"{metric.upper()}_ALERT_HYSTERESIS", default))
+
+
+class AlertRule:
+    """
+    Threshold rule with a hysteresis band.
+
+    Breached when the value crosses ``threshold`` (below it, or above it
+    with ``above=True``); a firing alert only recovers once the value is
+    ``band`` past the threshold on the healthy side, so a metric hovering
+    at the threshold does not flap.
+    """
+
+    def __init__(self, metric, threshold, action, above=False, band=0.0):
+        self.metric = metric
+        self.threshold = threshold
+        self.action = action
+        self.above = above
+        self.band = band
+
+    def breached(self, value):
+        if self.above:
+            return value > self.threshold
+        return value < self.threshold
+
+    def recovered(self, value):
+        if self.above:
+            return value <= self.threshold - self.band
+        return value >= self.threshold + self.band
+
+
+class AlertEvaluator:
+    """
+    Background alert state machine, one state per rule.
+
+    Every ``interval`` seconds ``metrics_fn()`` returns the current
+    aggregated ``{metric: value}`` (``None`` when there is nothing to
+    judge yet, which leaves the state unchanged). A breach moves a rule
+    from ok to pending; after ``for_seconds`` of continuous breach it
+    fires. A firing rule is resolved once the value recovers past the
+    hysteresis band and it has fired for ``min_firing_seconds``.
+
+    ``alerts`` gets one row per firing and per resolution (and
+    ``actions`` one per firing), never one per request. States are kept
+    in ``alert_state``, so a newly elected writer carries on where the
+    previous one stopped.
+    """
+
+    def __init__(
+        self,
+        db_path,
+        rules,
+        metrics_fn,
+        interval=ALERT_EVAL_SECS,
+        for_seconds=ALERT_FOR_SECS,
+        min_firing_seconds=ALERT_MIN_FIRING_SECS,
+    ):
+        self.db_path = db_path
+        self.rules = {rule.metric: rule for rule in rules}
+        self.metrics_fn = metrics_fn
+        self.interval = interval
+        self.for_seconds = for_seconds
+        self.min_firing_seconds = min_firing_seconds
+
+        # metric -> {"state", "since", "fired_at", "value"}
+        self._states = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+        self._evaluations = 0
+        self._transitions = 0
+        self._last_evaluation = None
+
+    def start(self):
+        if self.interval <= 0 or self._thread is not None:
+            return
+        self._thread = threading.Thread(
+            target=self._run, name="alert-evaluator", daemon=True
+        )
+        self._thread.start()
+
+    def close(self, timeout=10.0):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join(timeout=timeout)
+        self._thread = None
+
+    def _run(self):
+        conn = connect(self.db_path)
+        try:
+            self.load(conn)
+            while not self._stop.wait(self.interval):
+                # One bad pass must not end alerting for good
+                try:
+                    self.evaluate(conn)
+                except Exception:
+                    traceback.print_exc()
+        finally:
+            conn.close()
+
+    def load(self, conn):
+        """Restore rule states persisted by a previous writer."""
+        rows = conn.execute(
+            "SELECT metric, state, since, fired_at, value FROM alert_state"
+        ).fetchall()
+        with self._lock:
+            for metric, state, since, fired_at, value in rows:
+                if metric in self.rules:
+                    self._states[metric] = {
+                        "state": state,
+                        "since": since,
+                        "fired_at": fired_at,
+                        "value": value,
+                    }
+
+    def evaluate(self, conn, now=None):
+        """
+        One pass over all rules; writes transitions in one transaction.
+
+        New states are computed on copies and only kept once the
+        transaction has committed, so a failed write leaves memory as
+        it was and the next pass retries the transitions.
+
+        Returns ``[(metric, new state, value), ...]`` for the rules
+        whose state changed.
+        """
+        now = time.time() if now is None else now
+        with span("alerts"):
+            values = self.metrics_fn()
+            updated = {}
+            changes = []
+            with self._lock:
+                for metric, rule in self.rules.items():
+                    value = values.get(metric)
+                    if value is None:
+                        continue
+                    state = dict(
+                        self._states.get(metric)
+                        or {
+                            "state": OK,
+                            "since": None,
+                            "fired_at": None,
+                            "value": None,
+                        }
+                    )
+                    state["value"] = value
+                    new = self._next_state(rule, state, value, now)
+                    if new is not None:
+                        state["state"] = new
+                        changes.append((metric, new, value, state))
+                    updated[metric] = state
+
+            if changes:
+                self._write(conn, changes, now)
+            with self._lock:
+                self._states.update(updated)
+                self._evaluations += 1
+                self._transitions += len(changes)
+                self._last_evaluation = now
+        return [(metric, new, value) for metric, new, value, _ in changes]
+
+    def _next_state(self, rule, state, value, now):
+        current = state["state"]
+        if current in (OK, RESOLVED):
+            if not rule.breached(value):
+                return None
+            state["since"] = now
+            if self.for_seconds > 0:
+                return PENDING
+            state["fired_at"] = now
+            return FIRING
+        if current == PENDING:
+            if not rule.breached(value):
+                state["since"] = None
+                return OK
+            if now - state["since"] >= self.for_seconds:
+                state["fired_at"] = now
+                return FIRING
+            return None
+        # Firing
+        if (
+            rule.recovered(value)
+            and now - state["fired_at"] >= self.min_firing_seconds
+        ):
+            state["since"] = now
+            return RESOLVED
+        return None
+
+    def _write(self, conn, changes, now):
+        alerts = []
+        actions = []
+        states = []
+        for metric, new, value, state in changes:
+            rule = self.rules[metric]
+            states.append(
+                (
+                    metric,
+                    new,
+                    state["since"],
+                    state["fired_at"],
+                    float(value),
+                    rule.threshold,
+                    now,
+                )
+            )
+            if new in (FIRING, RESOLVED):
+                alerts.append((metric, float(value), rule.threshold, new))
+            if new == FIRING:
+                actions.append((metric, rule.action))
+
+        with conn:
+            conn.executemany(UPSERT_ALERT_STATE_SQL, states)
+            conn.executemany(
+                "INSERT INTO alerts (metric, value, threshold, state) "
+                "VALUES (?, ?, ?, ?)",
+                alerts,
+            )
+            conn.executemany(
+                "INSERT INTO actions (metric, action) VALUES (?, ?)", actions
+            )
+
+    def running(self):
+        return self._thread is not None
+
+    def firing(self):
+        """``{metric: 1 if firing else 0}`` for every known rule state."""
+        with self._lock:
+            return {
+                metric: int(state["state"] == FIRING)
+                for metric, state in self._states.items()
+            }
+
+    def stats(self):
+        with self._lock:
+            return {
+                "running": self.running(),
+                "interval_secs": self.interval,
+                "for_secs": self.for_seconds,
+                "min_firing_secs": self.min_firing_seconds,
+                "evaluations": self._evaluations,
+                "transitions": self._transitions,
+                "last_evaluation": self._last_evaluation,
+                "rules": {
+                    metric: {
+                        "threshold": rule.threshold,
+                        "direction": "above" if rule.above else "below",
+                        "hysteresis": rule.band,
+                    }
+                    for metric, rule in self.rules.items()
+                },
+            }
+
+
+def read_alerts(conn, limit=50):
+    """Persisted rule states and the most recent transitions."""
+    states = [
+        {
+            "metric": metric,
+            "state": state,
+            "since": since,
+            "fired_at": fired_at,
+            "value": value,
+            "threshold": threshold,
+            "updated": updated,
+        }
+        for metric, state, since, fired_at, value, threshold, updated in (
+            conn.execute(
+                "SELECT metric, state, since, fired_at, value, threshold, "
+                "updated FROM alert_state ORDER BY metric"
+            ).fetchall()
+        )
+    ]
+    transitions = [
+        {
+            "metric": metric,
+            "state": state,
+            "value": value,
+            "threshold": threshold,
+            "timestamp": timestamp,
+        }
+        for metric, state, value, threshold, timestamp in conn.execute(
+            "SELECT metric, state, value, threshold, timestamp FROM alerts "
+            "ORDER BY id DESC LIMIT ?",
+            (limit,),
+        ).fetchall()
+    ]
+    return {"states": states, "transitions": transitions}
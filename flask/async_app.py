@@ -0,0 +1,464 @@
+import asyncio
+import json
+import time
+import traceback
+
+import numpy as np
+from admission import BULK, AdmissionError, AsyncAdmission, error_headers
+from aiohttp import web
+from decision import request_threshold
+from feedback import decode_feedback
+from inference import InferenceError, load_async_backend
+from monitoring import PredictionMonitor
+from preprocessing import RAW_COLUMNS, Preprocessor, raw_instances
+from resilience import (
+    DEGRADED_HEADER,
+    RESILIENCE,
+    AsyncResilientBackend,
+    load_fallback,
+    split_degraded,
+)
+from storage import DB_PATH
+from streaming import (
+    NDJSON_CONTENT_TYPE,
+    ChunkDecoder,
+    encode_error,
+    encode_results,
+)
+from telemetry import (
+    INFERENCE_ERRORS,
+    PROMETHEUS_CONTENT_TYPE,
+    REGISTRY,
+    REQUEST_ROWS,
+    REQUEST_SECONDS,
+    REQUESTS,
+    span,
+)
+from tensor_codec import (
+    BINARY_CONTENT_TYPES,
+    JSON_CONTENT_TYPE,
+    LATENCY_HEADER,
+    RESPONSE_CONTENT_TYPES,
+    DecodeError,
+    UnsupportedFormatError,
+    decode_json,
+    decode_request,
+    encode_response,
+)
+from warmup import Warmup, health
+from werkzeug.datastructures import MIMEAccept
+from werkzeug.http import parse_accept_header
+
+# -----------------------------
+# asyncio variant of flask_app.py
+# -----------------------------
+# Same routes and payload contract as the Flask app, but a request waiting
+# on TF Serving only holds a coroutine, so one process keeps hundreds of
+# model calls in flight over a pooled keep-alive client:
+#
+#   gunicorn async_app:app -b :8080 --worker-class aiohttp.GunicornWebWorker
+#
+# Local backends ("local", "numpy") run on the loop's thread pool.
+backend = load_async_backend()
+
+# Deadlines, hedging, circuit breaker and fallback model for TF Serving
+# (see resilience.py)
+resilient = None
+if RESILIENCE and backend.name == "remote":
+    resilient = backend = AsyncResilientBackend(backend, load_fallback())
+
+# Request size limit, in-flight model calls and priority lanes
+# (see admission.py)
+admission = AsyncAdmission()
+
+# Feature engineering and scaling for /predict/raw (see preprocessing.py)
+preprocessor = Preprocessor()
+
+monitor = PredictionMonitor(DB_PATH)
+monitor.register_metrics(REGISTRY)
+admission.register_metrics(REGISTRY)
+if resilient is not None:
+    resilient.register_metrics(REGISTRY)
+
+# One dummy model call once the loop runs, before /healthz reports ready
+warmup = Warmup(backend.predict)
+
+
+def error(message, status):
+    return web.json_response({"error": message}, status=status)
+
+
+@web.middleware
+async def count_request(request, handler):
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await handler(request)
+        status = response.status
+        return response
+    except web.HTTPException as e:
+        status = e.status
+        raise
+    finally:
+        # Handler name, as Flask's request.endpoint in flask_app.py
+        endpoint = "unknown"
+        if request.match_info.http_exception is None:
+            endpoint = request.match_info.handler.__name__
+        REQUEST_SECONDS.observe(time.perf_counter() - start, (endpoint,))
+        REQUESTS.inc(labels=(endpoint, str(status)))
+
+
+# -----------------------------
+# Prediction endpoints
+# -----------------------------
+async def predict(request):
+    return await _predict(request, raw=False)
+
+
+# Raw Time, V1..V28, Amount rows: features engineered and scaled here
+async def predict_raw(request):
+    if not preprocessor.available:
+        return error(
+            f"Raw scoring needs the scaler parameters ({preprocessor.path}, "
+            "see SCALER_PATH)",
+            503,
+        )
+    return await _predict(request, raw=True)
+
+
+async def _predict(request, raw):
+    # Raw rows are decoded as float64, like the training pipeline's
+    # DataFrame, and converted to float32 after scaling
+    dtype = np.float64 if raw else np.float32
+    columns = RAW_COLUMNS if raw else None
+    try:
+        # -----------------------------
+        # Input validation
+        # -----------------------------
+        body = await request.read()
+        with span("decode"):
+            if request.content_type in BINARY_CONTENT_TYPES:
+                try:
+                    data, true_class = decode_request(
+                        request.content_type,
+                        body,
+                        request.headers,
+                        request.query,
+                        dtype,
+                        columns,
+                    )
+                    threshold = request_threshold(
+                        request.query.get("threshold")
+                    )
+                except UnsupportedFormatError as e:
+                    return error(str(e), 415)
+                except DecodeError as e:
+                    return error(str(e), 400)
+            else:
+                if request.content_type != JSON_CONTENT_TYPE:
+                    return error("Request must be JSON", 400)
+                try:
+                    payload = json.loads(body)
+                except ValueError:
+                    payload = None
+                try:
+                    if raw:
+                        payload = raw_instances(payload)
+                    data, true_class = decode_json(payload, dtype)
+                    threshold = payload.get(
+                        "threshold", request.query.get("threshold")
+                    )
+                    threshold = request_threshold(threshold)
+                except DecodeError as e:
+                    return error(str(e), 400)
+
+            # Binary bodies are read-only views: only copy when cleaning
+            # is needed
+            if not np.isfinite(data).all():
+                data = np.nan_to_num(data)
+        if raw:
+            with span("preprocess"):
+                try:
+                    data = preprocessor.transform(data)
+                except DecodeError as e:
+                    return error(str(e), 400)
+        REQUEST_ROWS.observe(len(data))
+
+        # -----------------------------
+        # Call the model backend
+        # -----------------------------
+        start = time.time()
+        try:
+            with span("model"):
+                probs = await admission.score(backend.predict, data)
+        except AdmissionError as e:
+            return web.json_response(
+                {"error": str(e)}, status=e.status, headers=error_headers(e)
+            )
+        except InferenceError as e:
+            INFERENCE_ERRORS.inc()
+            return error(str(e), 500)
+        latency = time.time() - start
+        # Fallback-model scores are served, but flagged
+        probs, degraded = split_degraded(probs)
+
+        # Only enqueues; blocks the loop solely under log-queue backpressure
+        with span("record"):
+            labels, prediction_ids = monitor.record(
+                probs, latency, true_class, threshold, degraded
+            )
+
+        with span("encode"):
+            accept = parse_accept_header(
+                request.headers.get("Accept"), MIMEAccept
+            )
+            response_type = accept.best_match(
+                RESPONSE_CONTENT_TYPES, default=JSON_CONTENT_TYPE
+            )
+            if response_type != JSON_CONTENT_TYPE:
+                body, headers = encode_response(
+                    response_type, labels, probs, prediction_ids
+                )
+                headers[LATENCY_HEADER] = repr(latency)
+                if degraded:
+                    headers[DEGRADED_HEADER] = "1"
+                return web.Response(
+                    body=body, content_type=response_type, headers=headers
+                )
+
+            return web.json_response(
+                {
+                    "predictions": labels,
+                    "probabilities": probs.tolist(),
+                    "latency": latency,
+                    "prediction_ids": prediction_ids,
+                    "degraded": degraded,
+                }
+            )
+
+    except Exception as e:
+        traceback.print_exc()
+        return error(str(e), 500)
+
+
+# -----------------------------
+# Streaming NDJSON prediction endpoint
+# -----------------------------
+async def predict_stream(request):
+    try:
+        threshold = request_threshold(request.query.get("threshold"))
+    except DecodeError as e:
+        return error(str(e), 400)
+
+    response = web.StreamResponse(
+        headers={"Content-Type": NDJSON_CONTENT_TYPE}
+    )
+    await response.prepare(request)
+
+    # Only one chunk of rows is in memory; results go out per chunk
+    decoder = ChunkDecoder()
+    admitted = False
+    try:
+        while True:
+            # Lines longer than the reader's buffer raise ValueError
+            line = await request.content.readline()
+            chunk = decoder.feed(line) if line else decoder.finish()
+            if chunk is not None:
+                data, true_class = chunk
+                REQUEST_ROWS.observe(len(data))
+                start = time.time()
+                with span("model"):
+                    # Stream chunks are bulk work; only the first one can
+                    # be turned away
+                    probs = await admission.score(
+                        backend.predict, data, BULK, admitted
+                    )
+                admitted = True
+                latency = time.time() - start
+                probs, degraded = split_degraded(probs)
+                with span("record"):
+                    labels, prediction_ids = monitor.record(
+                        probs, latency, true_class, threshold, degraded
+                    )
+                with span("encode"):
+                    lines = encode_results(
+                        labels, probs, prediction_ids, degraded
+                    )
+                await response.write(lines)
+            if not line:
+                break
+    except InferenceError as e:
+        INFERENCE_ERRORS.inc()
+        await response.write(encode_error(str(e)))
+    except (AdmissionError, ValueError) as e:
+        await response.write(encode_error(str(e)))
+    except Exception as e:
+        traceback.print_exc()
+        await response.write(encode_error(str(e)))
+
+    await response.write_eof()
+    return response
+
+
+# -----------------------------
+# Delayed-label feedback endpoint
+# -----------------------------
+async def feedback(request):
+    try:
+        if request.content_type != JSON_CONTENT_TYPE:
+            return error("Request must be JSON", 400)
+        try:
+            payload = json.loads(await request.read())
+        except ValueError:
+            payload = None
+        try:
+            prediction_ids, true_classes = decode_feedback(payload)
+        except DecodeError as e:
+            return error(str(e), 400)
+
+        # Flushes the log writer and updates SQLite: off the event loop
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(
+            None, monitor.feedback, prediction_ids, true_classes
+        )
+        # Pending ids may not be written yet: the client resends them
+        return web.json_response(
+            {**result, "metrics": monitor.accumulator.metrics()},
+            status=202 if result["pending"] else 200,
+        )
+
+    except Exception as e:
+        traceback.print_exc()
+        return error(str(e), 500)
+
+
+# -----------------------------
+# Debug / Monitor endpoint
+# -----------------------------
+async def debug_monitor(request):
+    loop = asyncio.get_running_loop()
+    html = await loop.run_in_executor(None, monitor.monitor_html)
+    return web.Response(text=html, content_type="text/html")
+
+
+# -----------------------------
+# Rollup endpoint (hourly / daily aggregates of logs)
+# -----------------------------
+async def debug_rollups(request):
+    granularity = request.query.get("granularity", "hourly")
+    if granularity not in ("hourly", "daily"):
+        return error("granularity must be hourly or daily", 400)
+    try:
+        limit = int(request.query.get("limit", "48"))
+    except ValueError:
+        limit = 48
+    loop = asyncio.get_running_loop()
+    rollups = await loop.run_in_executor(
+        None, monitor.rollups, granularity, limit
+    )
+    return web.json_response(
+        {
+            "granularity": granularity,
+            "rollups": rollups,
+            "compactor": monitor.compactor.stats(),
+        }
+    )
+
+
+# -----------------------------
+# Prometheus metrics endpoint
+# -----------------------------
+async def metrics(request):
+    return web.Response(
+        body=REGISTRY.render().encode(),
+        headers={"Content-Type": PROMETHEUS_CONTENT_TYPE},
+    )
+
+
+# -----------------------------
+# Windowed metrics, drift and TensorBoard pipeline stats endpoints
+# -----------------------------
+async def debug_windows(request):
+    return web.json_response(monitor.window_metrics())
+
+
+async def debug_drift(request):
+    return web.json_response(monitor.drift.stats())
+
+
+async def debug_alerts(request):
+    try:
+        limit = int(request.query.get("limit", "50"))
+    except ValueError:
+        limit = 50
+    loop = asyncio.get_running_loop()
+    status = await loop.run_in_executor(None, monitor.alert_status, limit)
+    return web.json_response(status)
+
+
+async def debug_summaries(request):
+    return web.json_response(monitor.summaries.stats())
+
+
+async def debug_admission(request):
+    return web.json_response(admission.stats())
+
+
+async def debug_resilience(request):
+    if resilient is None:
+        return web.json_response({"enabled": False})
+    return web.json_response({"enabled": True, **resilient.stats()})
+
+
+async def healthz(request):
+    body, status = health(
+        warmup, LOADED_AT, STARTUP_CPU_SECONDS, monitor.summaries
+    )
+    return web.json_response(body, status=status)
+
+
+async def on_startup(app):
+    await backend.start()
+    app["warmup"] = asyncio.get_running_loop().create_task(warmup.run_async())
+
+
+async def on_cleanup(app):
+    await backend.close()
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(None, monitor.close)
+
+
+def create_app():
+    app = web.Application(
+        client_max_size=64 * 1024 * 1024, middlewares=[count_request]
+    )
+    app.router.add_post("/predict", predict)
+    app.router.add_post("/predict/raw", predict_raw)
+    app.router.add_post("/predict/stream", predict_stream)
+    app.router.add_post("/feedback", feedback)
+    app.router.add_get("/metrics", metrics)
+    app.router.add_get("/debug/monitor", debug_monitor)
+    app.router.add_get("/debug/rollups", debug_rollups)
+    app.router.add_get("/debug/windows", debug_windows)
+    app.router.add_get("/debug/drift", debug_drift)
+    app.router.add_get("/debug/alerts", debug_alerts)
+    app.router.add_get("/debug/summaries", debug_summaries)
+    app.router.add_get("/debug/resilience", debug_resilience)
+    app.router.add_get("/debug/admission", debug_admission)
+    app.router.add_get("/healthz", healthz)
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+    return app
+
+
+app = create_app()
+
+# Startup cost reported by /healthz
+LOADED_AT = time.time()
+STARTUP_CPU_SECONDS = time.process_time()
+
+# -----------------------------
+# Run aiohttp
+# -----------------------------
+if __name__ == "__main__":
+    web.run_app(app, host="0.0.0.0", port=5000)
@@ -0,0 +1,242 @@
+import os
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import numpy as np
+from inference import InvalidInputError
+from telemetry import (
+    MODEL_BATCH_REQUESTS,
+    MODEL_BATCH_ROWS,
+    MODEL_BATCH_WAIT_SECONDS,
+)
+from tensor_codec import DecodeError
+
+# -----------------------------
+# Micro-batching configuration
+# -----------------------------
+MICRO_BATCHING = os.environ.get("MICRO_BATCHING", "0") == "1"
+BATCH_WINDOW_MS = float(os.environ.get("BATCH_WINDOW_MS", "2"))
+BATCH_MAX_SIZE = int(os.environ.get("BATCH_MAX_SIZE", "256"))
+# Batches scored at once; while all are in flight, requests keep queueing
+# and join the next batch
+BATCH_MAX_IN_FLIGHT = int(os.environ.get("BATCH_MAX_IN_FLIGHT", "2"))
+
+
+class MicroBatcher:
+    """
+    Coalesce concurrent scoring requests into one model call.
+
+    The first queued request opens a window of ``window_ms``; every request
+    that arrives before the window closes (or until ``max_batch_size`` rows
+    are collected) is scored in the same ``predict_fn`` call and gets its
+    own slice of the result back. Up to ``max_in_flight`` batches are
+    scored concurrently, so the round-trips of a remote backend overlap
+    instead of queueing behind one another.
+
+    A malformed request must not fail its co-batched callers: with a known
+    ``input_dim`` the width is checked in ``submit``, requests of different
+    widths never share a call, and a batch rejected by the model server
+    as invalid is rescored request by request.
+    """
+
+    def __init__(
+        self,
+        predict_fn,
+        window_ms=BATCH_WINDOW_MS,
+        max_batch_size=BATCH_MAX_SIZE,
+        input_dim=None,
+        max_in_flight=BATCH_MAX_IN_FLIGHT,
+    ):
+        self.predict_fn = predict_fn
+        self.window_ms = window_ms
+        self.max_batch_size = max_batch_size
+        self.input_dim = input_dim
+        self.max_in_flight = max(1, max_in_flight)
+
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        # A batch is only collected once one of the slots is free
+        self._slots = threading.BoundedSemaphore(self.max_in_flight)
+        self._pool = ThreadPoolExecutor(
+            max_workers=self.max_in_flight, thread_name_prefix="micro-batch"
+        )
+
+        self._stats_lock = threading.Lock()
+        self._batches = 0
+        self._requests = 0
+        self._rows = 0
+        self._wait_seconds = 0.0
+        self._requests_per_batch = Counter()
+        self._in_flight = 0
+
+    def submit(self, data):
+        """
+        Queue a 2D float32 batch and block until its probabilities return.
+        """
+        if data.ndim != 2 or (
+            self.input_dim is not None and data.shape[1] != self.input_dim
+        ):
+            raise DecodeError(
+                f"Expected instances with {self.input_dim or 'N'} features, "
+                f"got shape {data.shape}"
+            )
+        self._ensure_started()
+        future = Future()
+        self._queue.put((data, future, time.perf_counter()))
+        return future.result()
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="micro-batcher", daemon=True
+                )
+                self._thread.start()
+
+    def _collect(self):
+        items = [self._queue.get()]
+        rows = len(items[0][0])
+        deadline = time.perf_counter() + self.window_ms / 1000.0
+
+        while rows < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            items.append(item)
+            rows += len(item[0])
+        return items
+
+    def _run(self):
+        while True:
+            self._slots.acquire()
+            items = self._collect()
+            dispatched = time.perf_counter()
+
+            rows = sum(len(data) for data, _, _ in items)
+            waits = [dispatched - queued for _, _, queued in items]
+            MODEL_BATCH_ROWS.observe(rows)
+            MODEL_BATCH_REQUESTS.observe(len(items))
+            for wait in waits:
+                MODEL_BATCH_WAIT_SECONDS.observe(wait)
+            with self._stats_lock:
+                self._batches += 1
+                self._requests += len(items)
+                self._rows += rows
+                self._wait_seconds += sum(waits)
+                self._requests_per_batch[len(items)] += 1
+                self._in_flight += 1
+            self._pool.submit(self._score, items)
+
+    def _score(self, items):
+        try:
+            # Requests of different widths cannot share a model call
+            groups = {}
+            for item in items:
+                groups.setdefault(item[0].shape[1], []).append(item)
+            for group in groups.values():
+                self._dispatch(group)
+        finally:
+            with self._stats_lock:
+                self._in_flight -= 1
+            self._slots.release()
+
+    def _dispatch(self, items):
+        try:
+            if len(items) == 1:
+                results = [self.predict_fn(items[0][0])]
+            else:
+                sizes = [len(data) for data, _, _ in items]
+                probs = self.predict_fn(
+                    np.concatenate([data for data, _, _ in items])
+                )
+                if len(probs) != sum(sizes):
+                    raise ValueError(
+                        f"Model returned {len(probs)} predictions "
+                        f"for {sum(sizes)} instances"
+                    )
+                results = np.split(probs, np.cumsum(sizes)[:-1])
+        except InvalidInputError as e:
+            if len(items) == 1:
+                items[0][1].set_exception(e)
+                return
+            # Rescore one by one so only the offending caller gets the error
+            for item in items:
+                self._dispatch([item])
+        except Exception as e:
+            for _, future, _ in items:
+                future.set_exception(e)
+        else:
+            for (_, future, _), result in zip(items, results):
+                future.set_result(result)
+
+    def register_metrics(self, registry):
+        registry.callback(
+            "fraud_batcher_queue_depth",
+            "gauge",
+            "Requests waiting for the micro-batcher.",
+            self._queue.qsize,
+        )
+        registry.callback(
+            "fraud_batcher_in_flight",
+            "gauge",
+            "Micro-batches being scored.",
+            lambda: self._in_flight,
+        )
+        # Settings are the same in every worker
+        registry.callback(
+            "fraud_batcher_window_seconds",
+            "gauge",
+            "Time the first queued request waits for others to join.",
+            lambda: self.window_ms / 1000.0,
+            aggregate="max",
+        )
+        registry.callback(
+            "fraud_batcher_max_batch_rows",
+            "gauge",
+            "Rows that close a micro-batch before its window expires.",
+            lambda: self.max_batch_size,
+            aggregate="max",
+        )
+        registry.callback(
+            "fraud_batcher_max_in_flight",
+            "gauge",
+            "Micro-batches each worker scores at once.",
+            lambda: self.max_in_flight,
+            aggregate="max",
+        )
+
+    def stats(self):
+        with self._stats_lock:
+            batches = self._batches
+            return {
+                "window_ms": self.window_ms,
+                "max_batch_size": self.max_batch_size,
+                "max_in_flight": self.max_in_flight,
+                "in_flight": self._in_flight,
+                "queue_depth": self._queue.qsize(),
+                "batches": batches,
+                "requests": self._requests,
+                "rows": self._rows,
+                "avg_requests_per_batch": (
+                    self._requests / batches if batches else 0.0
+                ),
+                "avg_rows_per_batch": self._rows / batches if batches else 0.0,
+                "avg_queue_wait_ms": (
+                    1000.0 * self._wait_seconds / self._requests
+                    if self._requests
+                    else 0.0
+                ),
+                "requests_per_batch": dict(
+                    sorted(self._requests_per_batch.items())
+                ),
+            }
@@ -0,0 +1,86 @@
+import json
+import os
+
+import numpy as np
+from tensor_codec import DecodeError
+
+# -----------------------------
+# Decision threshold (fraud if probability >= threshold)
+# -----------------------------
+# Without a configured threshold the original API's rule applies:
+# fraud if probability > 0.5 (strict).
+DECISION_THRESHOLD_PATH = os.environ.get(
+    "DECISION_THRESHOLD_PATH",
+    os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "decision_threshold.json"
+    ),
+)
+# Explicit value, takes precedence over the artifact
+DECISION_THRESHOLD = os.environ.get("DECISION_THRESHOLD")
+DEFAULT_THRESHOLD = 0.5
+
+# Index 1 = fraud; logs store the index, responses the name. An object
+# array hands out the same two str objects, so tolist() does not build
+# new strings per row.
+LABEL_NAMES = np.array(["Not Fraud", "Fraud"], dtype=object)
+
+
+def load_decision_threshold(
+    path=DECISION_THRESHOLD_PATH, override=DECISION_THRESHOLD
+):
+    """
+    Resolve the serving threshold: ``DECISION_THRESHOLD``, else the
+    artifact written by ``save_decision_threshold`` in model_training.py,
+    else 0.5.
+
+    Returns ``{"threshold", "source", "version", "strict"}``; ``strict``
+    (``probability > threshold``) only for the 0.5 default.
+    """
+    if override is not None:
+        return {
+            "threshold": parse_threshold(override),
+            "source": "DECISION_THRESHOLD",
+            "version": None,
+            "strict": False,
+        }
+    if not os.path.exists(path):
+        return {
+            "threshold": DEFAULT_THRESHOLD,
+            "source": "default",
+            "version": None,
+            "strict": True,
+        }
+
+    with open(path) as f:
+        artifact = json.load(f)
+    return {
+        "threshold": parse_threshold(artifact["threshold"]),
+        "source": path,
+        "version": artifact.get("version"),
+        "strict": False,
+    }
+
+
+def parse_threshold(value):
+    """A threshold from config or a request: a number in [0, 1]."""
+    try:
+        threshold = float(value)
+    except (TypeError, ValueError):
+        raise DecodeError("'threshold' must be a number") from None
+    if not 0.0 <= threshold <= 1.0:
+        raise DecodeError("'threshold' must be between 0 and 1")
+    return threshold
+
+
+def request_threshold(value):
+    """Per-request override (JSON ``threshold`` or ``?threshold=``)."""
+    return None if value is None else parse_threshold(value)
+
+
+def classify(probs, threshold, strict=False):
+    """
+    Vectorized labels: ``(fraud mask, label names list)``. Fraud is
+    ``probs >= threshold``, or ``probs > threshold`` with ``strict``.
+    """
+    fraud = probs > threshold if strict else probs >= threshold
+    return fraud, LABEL_NAMES[fraud.view(np.int8)].tolist()
@@ -0,0 +1,205 @@
+import json
+import os
+import time
+
+import numpy as np
+from shared import SharedSlot, shared_array, shared_lock
+
+# -----------------------------
+# Label-free prediction drift configuration
+# -----------------------------
+DRIFT_REFERENCE_PATH = os.environ.get(
+    "DRIFT_REFERENCE_PATH",
+    os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "reference_histogram.json"
+    ),
+)
+DRIFT_WINDOW_MINUTES = float(os.environ.get("DRIFT_WINDOW_MINUTES", "60"))
+DRIFT_MIN_SAMPLES = int(os.environ.get("DRIFT_MIN_SAMPLES", "500"))
+PSI_THRESHOLD = float(os.environ.get("PSI_THRESHOLD", "0.2"))
+KS_THRESHOLD = float(os.environ.get("KS_THRESHOLD", "0.1"))
+
+# Without a reference the histogram still runs on equal-width bins
+DEFAULT_BINS = 20
+# Floor for empty bins so PSI stays finite
+PSI_EPSILON = 1e-4
+
+DRIFT_METRICS = ("psi", "ks")
+DRIFT_ACTIONS = {
+    "psi": "Investigate prediction drift (score distribution shifted).",
+    "ks": "Investigate prediction drift (score CDF shifted).",
+}
+
+
+def load_reference(path=DRIFT_REFERENCE_PATH):
+    """
+    Read the reference histogram written by ``save_reference_histogram``
+    in model_training.py: ``{"bin_edges": [...], "counts": [...]}``.
+
+    Returns ``(edges, counts)`` or ``None`` if the file does not exist.
+    """
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        reference = json.load(f)
+    edges = np.asarray(reference["bin_edges"], dtype=np.float64)
+    counts = np.asarray(reference["counts"], dtype=np.float64)
+    if len(edges) != len(counts) + 1 or np.any(np.diff(edges) <= 0):
+        raise ValueError(f"Malformed reference histogram: {path}")
+    return edges, counts
+
+
+def psi(counts, reference):
+    """Population stability index of two histograms over the same bins."""
+    p = np.maximum(counts / counts.sum(), PSI_EPSILON)
+    q = np.maximum(reference / reference.sum(), PSI_EPSILON)
+    return float(np.sum((p - q) * np.log(p / q)))
+
+
+def ks_distance(counts, reference):
+    """
+    Largest gap between the two binned CDFs: the KS statistic evaluated
+    at the bin edges (a lower bound of the exact one).
+    """
+    p = np.cumsum(counts) / counts.sum()
+    q = np.cumsum(reference) / reference.sum()
+    return float(np.max(np.abs(p - q)))
+
+
+class DriftMonitor:
+    """
+    Streaming histogram of served probabilities per tumbling time window.
+
+    Bins are fixed by the reference histogram, so an update is one
+    ``searchsorted`` + ``bincount`` over the batch and PSI / KS are
+    O(bins) at any time. Only the current and the previous window are
+    kept. The distances are judged by the alert evaluator (see
+    alerting.py) once the window has ``min_samples`` predictions.
+    Histograms live in shared memory, so forked workers (see shared.py)
+    fill the same windows.
+    """
+
+    _window_start = SharedSlot("_scalars", 0)
+    _sum = SharedSlot("_scalars", 1)
+    _previous_start = SharedSlot("_scalars", 2)
+    _previous_sum = SharedSlot("_scalars", 3)
+
+    def __init__(
+        self,
+        reference_path=DRIFT_REFERENCE_PATH,
+        window_minutes=DRIFT_WINDOW_MINUTES,
+        min_samples=DRIFT_MIN_SAMPLES,
+        psi_threshold=PSI_THRESHOLD,
+        ks_threshold=KS_THRESHOLD,
+    ):
+        self.reference_path = reference_path
+        self.window_seconds = window_minutes * 60.0
+        self.min_samples = min_samples
+        self.thresholds = {"psi": psi_threshold, "ks": ks_threshold}
+
+        loaded = load_reference(reference_path)
+        if loaded is None:
+            self.edges = np.linspace(0.0, 1.0, DEFAULT_BINS + 1)
+            self.reference = None
+        else:
+            self.edges, self.reference = loaded
+        # Interior edges: bin i holds edges[i] <= p < edges[i + 1]
+        self._inner = self.edges[1:-1]
+
+        bins = len(self.edges) - 1
+        self._scalars = shared_array(4)
+        self._counts = shared_array(bins, np.int64)
+        self._previous_counts = shared_array(bins, np.int64)
+        self._window_start = None
+        self._previous_start = None
+        self._lock = shared_lock()
+
+    def update(self, probs):
+        """Add a batch of probabilities to the current window."""
+        if len(probs) == 0:
+            return
+        counts = np.bincount(
+            np.searchsorted(self._inner, probs, side="right"),
+            minlength=len(self._counts),
+        )
+        total = float(np.sum(probs))
+
+        with self._lock:
+            self._roll(time.time())
+            self._counts += counts
+            self._sum += total
+
+    def metrics(self):
+        """Distances of the current window (``None`` without a reference)."""
+        with self._lock:
+            self._roll(time.time())
+            return self._distances(self._counts)
+
+    def alert_metrics(self):
+        """
+        Distances of the current window for alerting: ``None`` until it
+        holds ``min_samples`` predictions.
+        """
+        with self._lock:
+            self._roll(time.time())
+            if self._counts.sum() < self.min_samples:
+                return {metric: None for metric in DRIFT_METRICS}
+            return self._distances(self._counts)
+
+    def stats(self):
+        loaded = self.reference is not None
+        with self._lock:
+            self._roll(time.time())
+            return {
+                "reference": self.reference_path if loaded else None,
+                "reference_samples": (
+                    int(self.reference.sum()) if loaded else 0
+                ),
+                "bin_edges": self.edges.tolist(),
+                "window_minutes": self.window_seconds / 60.0,
+                "min_samples": self.min_samples,
+                "thresholds": self.thresholds,
+                "current": self._summary(
+                    self._window_start, self._counts, self._sum
+                ),
+                "previous": self._summary(
+                    self._previous_start,
+                    self._previous_counts,
+                    self._previous_sum,
+                ),
+            }
+
+    def _roll(self, now):
+        """Start a new window when ``now`` is past the current one."""
+        start = now - now % self.window_seconds
+        if self._window_start is None:
+            self._window_start = start
+        elif start > self._window_start:
+            self._previous_counts[:] = self._counts
+            self._previous_start = self._window_start
+            self._previous_sum = self._sum
+            self._window_start = start
+            self._counts[:] = 0
+            self._sum = 0.0
+
+    def _distances(self, counts):
+        if self.reference is None or not counts.sum():
+            return {"psi": None, "ks": None}
+        return {
+            "psi": psi(counts, self.reference),
+            "ks": ks_distance(counts, self.reference),
+        }
+
+    def _summary(self, window_start, counts, total):
+        if window_start is None:
+            return None
+        n = int(counts.sum())
+        return {
+            "window_start": time.strftime(
+                "%Y-%m-%dT%H:%M:%S", time.gmtime(window_start)
+            ),
+            "count": n,
+            "mean_probability": total / n if n else None,
+            "counts": counts.tolist(),
+            **self._distances(counts),
+        }
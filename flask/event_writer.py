@@ -0,0 +1,142 @@
+import os
+import socket
+import struct
+import time
+
+# -----------------------------
+# TensorFlow-free TensorBoard event files
+# -----------------------------
+# Scalars are written as `Event` protocol buffers framed as TFRecords,
+# the format `tf.summary.create_file_writer` produces, so TensorBoard
+# reads them unchanged. Only the handful of protobuf fields needed for
+# scalar summaries are encoded by hand, which keeps `import tensorflow`
+# (several seconds) off the cold-start path.
+FILE_VERSION = b"brain.Event:2"
+
+
+def _crc32c_table():
+    table = []
+    for i in range(256):
+        crc = i
+        for _ in range(8):
+            crc = (crc >> 1) ^ 0x82F63B78 if crc & 1 else crc >> 1
+        table.append(crc)
+    return table
+
+
+_CRC32C_TABLE = _crc32c_table()
+
+
+def crc32c(data):
+    """CRC-32C (Castagnoli), as used by the TFRecord framing."""
+    crc = 0xFFFFFFFF
+    table = _CRC32C_TABLE
+    for byte in data:
+        crc = table[(crc ^ byte) & 0xFF] ^ (crc >> 8)
+    return crc ^ 0xFFFFFFFF
+
+
+def masked_crc32c(data):
+    crc = crc32c(data)
+    return (((crc >> 15) | (crc << 17)) + 0xA282EAD8) & 0xFFFFFFFF
+
+
+def _varint(value):
+    out = bytearray()
+    while True:
+        bits = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(bits | 0x80)
+        else:
+            out.append(bits)
+            return bytes(out)
+
+
+def _length_delimited(field, payload):
+    return _varint(field << 3 | 2) + _varint(len(payload)) + payload
+
+
+def encode_event(wall_time, step=None, scalars=None, file_version=None):
+    """
+    Serialized ``tensorflow.Event``: ``wall_time`` (1), ``step`` (2),
+    ``file_version`` (3) and a ``Summary`` (5) of ``simple_value``
+    scalars ``{tag: value}``.
+    """
+    event = b"\x09" + struct.pack("<d", wall_time)
+    if step is not None:
+        event += b"\x10" + _varint(step & 0xFFFFFFFFFFFFFFFF)
+    if file_version is not None:
+        event += _length_delimited(3, file_version)
+    if scalars:
+        summary = b"".join(
+            _length_delimited(
+                1,
+                _length_delimited(1, tag.encode())
+                + b"\x15"
+                + struct.pack("<f", value),
+            )
+            for tag, value in scalars.items()
+        )
+        event += _length_delimited(5, summary)
+    return event
+
+
+def encode_record(data):
+    """TFRecord framing: length, masked CRCs of length and data."""
+    length = struct.pack("<Q", len(data))
+    return (
+        length
+        + struct.pack("<I", masked_crc32c(length))
+        + data
+        + struct.pack("<I", masked_crc32c(data))
+    )
+
+
+class EventFileWriter:
+    """
+    Append scalar events to one ``events.out.tfevents.*`` file in a
+    local ``logdir``. The file is created on the first write.
+    """
+
+    def __init__(self, logdir):
+        self.logdir = logdir
+        self.path = None
+        self._file = None
+
+    def _open(self):
+        os.makedirs(self.logdir, exist_ok=True)
+        now = time.time()
+        self.path = os.path.join(
+            self.logdir,
+            f"events.out.tfevents.{int(now)}.{socket.gethostname()}"
+            f".{os.getpid()}.v2",
+        )
+        self._file = open(self.path, "ab")
+        self._file.write(
+            encode_record(encode_event(now, file_version=FILE_VERSION))
+        )
+
+    def write(self, points):
+        """Write ``(tag, value, step)`` points, one event per step."""
+        if self._file is None:
+            self._open()
+        by_step = {}
+        for tag, value, step in points:
+            by_step.setdefault(step, {})[tag] = value
+        now = time.time()
+        self._file.write(
+            b"".join(
+                encode_record(encode_event(now, step, scalars))
+                for step, scalars in by_step.items()
+            )
+        )
+
+    def flush(self):
+        if self._file is not None:
+            self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
@@ -0,0 +1,242 @@
+import os
+import time
+import uuid
+
+import numpy as np
+from tensor_codec import DecodeError
+
+# -----------------------------
+# Delayed-label feedback (/feedback)
+# -----------------------------
+FEEDBACK_MAX_IDS = int(os.environ.get("FEEDBACK_MAX_IDS", "100000"))
+# Unknown ids scored more recently than this may still be queued in some
+# worker's write-behind log writer: reported as pending, not not_found
+FEEDBACK_PENDING_SECS = float(os.environ.get("FEEDBACK_PENDING_SECS", "60"))
+# How late a label may arrive (chargebacks take weeks); raw logs must be
+# kept at least this long, see rollup.LOG_RETENTION_DAYS
+FEEDBACK_WINDOW_DAYS = float(os.environ.get("FEEDBACK_WINDOW_DAYS", "120"))
+# Leading hex digits of a prediction id prefix: scoring time in ms
+ID_TIME_DIGITS = 11
+
+# Scratch table for one feedback batch (per connection, never persisted)
+CREATE_FEEDBACK_BATCH_SQL = """
+CREATE TEMP TABLE IF NOT EXISTS feedback_batch (
+    prediction_id TEXT PRIMARY KEY,
+    true_class INTEGER NOT NULL
+)
+"""
+
+# Joined through the unique idx_logs_prediction_id index
+SELECT_FEEDBACK_ROWS_SQL = """
+SELECT
+    l.id, l.timestamp, l.prediction = 1, l.latency,
+    l.true_class, f.true_class, l.degraded, l.prediction_id
+FROM feedback_batch f
+JOIN logs l ON l.prediction_id = f.prediction_id
+"""
+
+ADJUST_ROLLUP_SQL = """
+UPDATE {table}
+SET num_labelled = num_labelled + ?,
+    tp = tp + ?, fp = fp + ?, tn = tn + ?, fn = fn + ?,
+    labelled_latency_sum = labelled_latency_sum + ?
+WHERE bucket = ?
+"""
+
+TP, FP, TN, FN, LATENCY = range(5)
+
+
+def _cell(true_class, fraud):
+    if true_class == 1:
+        return TP if fraud else FN
+    return FP if fraud else TN
+
+
+def _add(totals, key, delta):
+    current = totals.setdefault(key, [0, 0, 0, 0, 0.0, 0])
+    for i, value in enumerate(delta):
+        current[i] += value
+
+
+def prediction_prefix():
+    """
+    Id prefix for one scored batch: the scoring time in milliseconds
+    (``ID_TIME_DIGITS`` hex digits) followed by random hex digits.
+    """
+    return (
+        f"{int(time.time() * 1000):0{ID_TIME_DIGITS}x}"
+        f"{uuid.uuid4().hex[ID_TIME_DIGITS:]}"
+    )
+
+
+def scored_at(prediction_id):
+    """Scoring time (epoch seconds) of a prediction id, or ``None``."""
+    try:
+        return int(prediction_id[:ID_TIME_DIGITS], 16) / 1000.0
+    except ValueError:
+        return None
+
+
+def pending_ids(prediction_ids, now=None, pending_secs=FEEDBACK_PENDING_SECS):
+    """Unknown ids recent enough to still be on their way to SQLite."""
+    now = time.time() if now is None else now
+    pending = []
+    for prediction_id in prediction_ids:
+        scored = scored_at(prediction_id)
+        if scored is not None and now - pending_secs <= scored <= now + 1.0:
+            pending.append(prediction_id)
+    return pending
+
+
+def epoch_seconds(timestamps):
+    """Epoch seconds of ``logs.timestamp`` values (naive UTC ISO 8601)."""
+    return np.array(timestamps, dtype="datetime64[us]").astype(np.int64) / 1e6
+
+
+def decode_feedback(payload):
+    """
+    Validate ``{"prediction_ids": [...], "true_class": [...] | 0 | 1}``.
+
+    Returns ``(prediction_ids, true_classes)`` as equal-length lists.
+    """
+    if payload is None:
+        raise DecodeError("Invalid JSON payload")
+    if "prediction_ids" not in payload or "true_class" not in payload:
+        raise DecodeError("Missing 'prediction_ids' or 'true_class' field")
+
+    prediction_ids = payload["prediction_ids"]
+    true_class = payload["true_class"]
+    if not isinstance(prediction_ids, list) or not prediction_ids:
+        raise DecodeError("'prediction_ids' must be a non-empty list")
+    if len(prediction_ids) > FEEDBACK_MAX_IDS:
+        raise DecodeError(
+            f"At most {FEEDBACK_MAX_IDS} prediction ids per request"
+        )
+    if not all(isinstance(pid, str) for pid in prediction_ids):
+        raise DecodeError("'prediction_ids' must be strings")
+
+    if isinstance(true_class, list):
+        if len(true_class) != len(prediction_ids):
+            raise DecodeError("'true_class' must have one label per id")
+        true_classes = true_class
+    else:
+        true_classes = [true_class] * len(prediction_ids)
+    if any(isinstance(tc, bool) or tc not in (0, 1) for tc in true_classes):
+        raise DecodeError("'true_class' labels must be 0 or 1")
+    return prediction_ids, true_classes
+
+
+def apply_labels(conn, prediction_ids, true_classes):
+    """
+    Attach labels to logged predictions in one IMMEDIATE transaction.
+
+    Updates ``logs.true_class`` by primary key, adds the confusion delta
+    to ``metric_state`` and, for rows already folded into the rollups,
+    to their ``logs_hourly`` / ``logs_daily`` buckets. Re-sending a label
+    is a no-op; a different label replaces the old one. Rows scored by
+    the fallback model (``degraded``) get the label but stay out of the
+    confusion counts, as in ``PredictionMonitor.record``.
+
+    Ids not in ``logs`` yet but scored in the last
+    ``FEEDBACK_PENDING_SECS`` are returned as ``pending_ids`` (another
+    worker may not have written them yet; resend their labels later);
+    older unknown ids count as ``not_found``.
+
+    Returns ``(result, delta, newly_labelled)``: counts for the response,
+    the ``(tp, fp, tn, fn, latency_sum)`` delta for the in-memory
+    accumulator, and ``(true_class, fraud, latency, timestamp)`` of rows
+    that had no label before (``timestamp`` as logged at prediction),
+    both for non-degraded rows only.
+    """
+    conn.execute(CREATE_FEEDBACK_BATCH_SQL)
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute("DELETE FROM feedback_batch")
+        conn.executemany(
+            "INSERT OR REPLACE INTO feedback_batch VALUES (?, ?)",
+            zip(prediction_ids, true_classes),
+        )
+        rows = conn.execute(SELECT_FEEDBACK_ROWS_SQL).fetchall()
+        watermark = conn.execute(
+            "SELECT last_log_id FROM rollup_state WHERE id = 1"
+        ).fetchone()[0]
+
+        delta = [0, 0, 0, 0, 0.0]
+        buckets = {}  # hour -> [tp, fp, tn, fn, latency, num_labelled]
+        updates = []
+        newly_labelled = []
+        labelled = relabelled = unchanged = 0
+
+        for log_id, timestamp, fraud, latency, old, new, degraded, _ in rows:
+            if old == new:
+                unchanged += 1
+                continue
+            updates.append((new, log_id))
+            if old is None:
+                labelled += 1
+            else:
+                relabelled += 1
+            if degraded:
+                continue
+            row_delta = [0, 0, 0, 0, 0.0, 0]
+            latency = latency or 0.0
+            if old is not None:
+                row_delta[_cell(old, fraud)] -= 1
+                row_delta[LATENCY] -= latency
+                row_delta[5] -= 1
+            else:
+                newly_labelled.append((new, bool(fraud), latency, timestamp))
+            row_delta[_cell(new, fraud)] += 1
+            row_delta[LATENCY] += latency
+            row_delta[5] += 1
+
+            for i in range(5):
+                delta[i] += row_delta[i]
+            if log_id <= watermark and timestamp:
+                _add(buckets, timestamp[:13], row_delta)
+
+        conn.executemany(
+            "UPDATE logs SET true_class = ? WHERE id = ?", updates
+        )
+        if any(delta):
+            conn.execute(
+                """
+                UPDATE metric_state
+                SET tp = tp + ?, fp = fp + ?, tn = tn + ?, fn = fn + ?,
+                    latency_sum = latency_sum + ?
+                WHERE id = 1
+                """,
+                delta,
+            )
+
+        days = {}
+        for hour, row_delta in buckets.items():
+            _add(days, hour[:10], row_delta)
+        for table, totals in (("logs_hourly", buckets), ("logs_daily", days)):
+            conn.executemany(
+                ADJUST_ROLLUP_SQL.format(table=table),
+                [
+                    (d[5], d[TP], d[FP], d[TN], d[FN], d[LATENCY], key)
+                    for key, d in totals.items()
+                ],
+            )
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+
+    matched = {row[-1] for row in rows}
+    pending = pending_ids(
+        pid for pid in dict.fromkeys(prediction_ids) if pid not in matched
+    )
+    result = {
+        "received": len(prediction_ids),
+        "matched": len(rows),
+        "labelled": labelled,
+        "relabelled": relabelled,
+        "unchanged": unchanged,
+        "pending": len(pending),
+        "not_found": len(set(prediction_ids)) - len(rows) - len(pending),
+        "pending_ids": pending,
+    }
+    return result, tuple(delta), newly_labelled
@@ -1,274 +1,454 @@
-import sqlite3
-import threading
+import atexit
 import time
 import traceback
-from datetime import datetime
 
 import numpy as np
-import pandas as pd
-import requests
-import tensorflow as tf
-from sklearn.metrics import (accuracy_score, f1_score, precision_score,
-                             recall_score)
+from admission import BULK, Admission, AdmissionError, error_headers
+from batching import MICRO_BATCHING, MicroBatcher
+from decision import request_threshold
+from feedback import decode_feedback
+from inference import InferenceError, load_backend
+from monitoring import PredictionMonitor
+from prediction_cache import PREDICTION_CACHE, PredictionCache
+from preprocessing import RAW_COLUMNS, Preprocessor, raw_instances
+from resilience import (
+    DEGRADED_HEADER,
+    RESILIENCE,
+    ResilientBackend,
+    load_fallback,
+    split_degraded,
+)
+from shared import on_worker_start
+from storage import DB_PATH
+from streaming import (
+    NDJSON_CONTENT_TYPE,
+    STREAM_MAX_LINE_BYTES,
+    ChunkDecoder,
+    encode_error,
+    encode_results,
+)
+from telemetry import (
+    INFERENCE_ERRORS,
+    PROMETHEUS_CONTENT_TYPE,
+    REGISTRY,
+    REQUEST_ROWS,
+    REQUEST_SECONDS,
+    REQUESTS,
+    span,
+)
+from tensor_codec import (
+    BINARY_CONTENT_TYPES,
+    JSON_CONTENT_TYPE,
+    LATENCY_HEADER,
+    RESPONSE_CONTENT_TYPES,
+    DecodeError,
+    UnsupportedFormatError,
+    decode_json,
+    decode_request,
+    encode_response,
+)
+from warmup import Warmup, health
 
-from flask import Flask, jsonify, request
+from flask import Flask, g, jsonify, request
 
 # -----------------------------
-# TF Serving endpoint
+# Model backend (TF Serving or in-process, see INFERENCE_BACKEND)
 # -----------------------------
-TF_SERVING_URL = "https://fraud-serving-447240734112.us-central1.run.app/v1/models/fraud_model:predict"
+backend = load_backend()
+
+# Deadlines, hedging, circuit breaker and fallback model for TF Serving
+# (see resilience.py)
+resilient = None
+if RESILIENCE and backend.name == "remote":
+    resilient = backend = ResilientBackend(backend, load_fallback())
+
+# Optional request coalescing in front of the backend (see MICRO_BATCHING)
+batcher = None
+if MICRO_BATCHING:
+    batcher = MicroBatcher(
+        backend.predict, input_dim=getattr(backend, "input_dim", None)
+    )
+score = batcher.submit if batcher is not None else backend.predict
+
+# Optional LRU cache in front of the model call (see PREDICTION_CACHE)
+cache = None
+if PREDICTION_CACHE:
+    cache = PredictionCache(backend.model_version)
+    score = cache.wrap(score)
+
+# Request size limit, model call slots and priority lanes (see admission.py)
+admission = Admission()
+
+# Feature engineering and scaling for /predict/raw (see preprocessing.py)
+preprocessor = Preprocessor()
 
 app = Flask(__name__)
 
 # -----------------------------
-# TensorBoard setup
+# Logging, metrics, alerts and TensorBoard (see monitoring.py)
 # -----------------------------
-LOGDIR = "gs://credit2025-tensorboard-logs/tensorboard"
-writer = tf.summary.create_file_writer(LOGDIR)
+monitor = PredictionMonitor(DB_PATH)
+atexit.register(monitor.close)
 
-global_step = 0
-step_lock = threading.Lock()  # ensures thread-safe increments
+# Queue depths and counters sampled by /metrics
+monitor.register_metrics(REGISTRY)
+admission.register_metrics(REGISTRY)
+if batcher is not None:
+    batcher.register_metrics(REGISTRY)
+if cache is not None:
+    cache.register_metrics(REGISTRY)
+if resilient is not None:
+    resilient.register_metrics(REGISTRY)
 
-# -----------------------------
-# Initialize SQLite DB
-# -----------------------------
-conn = sqlite3.connect("monitoring.db", check_same_thread=False)
-cursor = conn.cursor()
+# One dummy model call per worker before /healthz reports ready
+warmup = Warmup(backend.predict)
+on_worker_start(warmup.start)
 
-cursor.execute(
-    """
-CREATE TABLE IF NOT EXISTS logs (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    timestamp TEXT,
-    latency REAL,
-    prediction TEXT,
-    probability REAL,
-    true_class INTEGER
-)
-"""
-)
-
-cursor.execute(
-    """
-CREATE TABLE IF NOT EXISTS batch_metrics (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-    num_samples INTEGER,
-    avg_probability REAL,
-    accuracy REAL,
-    precision REAL,
-    recall REAL,
-    f1_score REAL
-)
-"""
-)
-
-cursor.execute(
-    """
-CREATE TABLE IF NOT EXISTS alerts (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    metric TEXT,
-    value REAL,
-    threshold REAL,
-    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-)
-"""
-)
 
-cursor.execute(
-    """
-CREATE TABLE IF NOT EXISTS actions (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    metric TEXT,
-    action TEXT,
-    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-)
-"""
-)
+@app.before_request
+def start_timer():
+    g.request_start = time.perf_counter()
 
-conn.commit()
 
-# -----------------------------
-# Thresholds
-# -----------------------------
-ACCURACY_THRESHOLD = 0.90
-PRECISION_THRESHOLD = 0.75
-RECALL_THRESHOLD = 0.35
-LATENCY_THRESHOLD = 0.50  # seconds
+@app.after_request
+def count_request(response):
+    endpoint = request.endpoint or "unknown"
+    REQUEST_SECONDS.observe(time.perf_counter() - g.request_start, (endpoint,))
+    REQUESTS.inc(labels=(endpoint, str(response.status_code)))
+    return response
 
 
 # -----------------------------
-# Prediction endpoint
+# Prediction endpoints
 # -----------------------------
 @app.route("/predict", methods=["POST"])
 def predict():
-    global global_step
-    try:
-        # -----------------------------
-        # Input validation
-        # -----------------------------
-        if not request.is_json:
-            return jsonify({"error": "Request must be JSON"}), 400
-
-        payload = request.get_json(silent=True)
-        if payload is None:
-            return jsonify({"error": "Invalid JSON payload"}), 400
-
-        if "instances" not in payload:
-            return jsonify({"error": "Missing 'instances' field"}), 400
+    return _predict(raw=False)
 
-        data = payload.get("instances", [])
-        true_class = payload.get("true_class", None)
 
-        if not isinstance(data, (list, tuple)):
-            return jsonify({"error": "'instances' must be a list"}), 400
-        if len(data) == 0:
-            return jsonify({"error": "'instances' cannot be empty"}), 400
+# Raw Time, V1..V28, Amount rows: features engineered and scaled here
+@app.route("/predict/raw", methods=["POST"])
+def predict_raw():
+    if not preprocessor.available:
+        message = (
+            f"Raw scoring needs the scaler parameters ({preprocessor.path}, "
+            "see SCALER_PATH)"
+        )
+        return jsonify({"error": message}), 503
+    return _predict(raw=True)
 
-        # Convert to numpy
-        data = np.array(data, dtype=np.float32)
-        data = np.nan_to_num(data)
 
-        # Ensure 2D
-        if data.ndim == 1:
-            data = data.reshape(1, -1)
+def _predict(raw):
+    # Raw rows are decoded as float64, like the training pipeline's
+    # DataFrame, and converted to float32 after scaling
+    dtype = np.float64 if raw else np.float32
+    columns = RAW_COLUMNS if raw else None
+    try:
+        # -----------------------------
+        # Input validation
+        # -----------------------------
+        with span("decode"):
+            if request.mimetype in BINARY_CONTENT_TYPES:
+                try:
+                    data, true_class = decode_request(
+                        request.mimetype,
+                        request.get_data(cache=False),
+                        request.headers,
+                        request.args,
+                        dtype,
+                        columns,
+                    )
+                    threshold = request_threshold(
+                        request.args.get("threshold")
+                    )
+                except UnsupportedFormatError as e:
+                    return jsonify({"error": str(e)}), 415
+                except DecodeError as e:
+                    return jsonify({"error": str(e)}), 400
+            else:
+                if not request.is_json:
+                    return jsonify({"error": "Request must be JSON"}), 400
+                payload = request.get_json(silent=True)
+                try:
+                    if raw:
+                        payload = raw_instances(payload)
+                    data, true_class = decode_json(payload, dtype)
+                    threshold = payload.get(
+                        "threshold", request.args.get("threshold")
+                    )
+                    threshold = request_threshold(threshold)
+                except DecodeError as e:
+                    return jsonify({"error": str(e)}), 400
+
+            # Binary bodies are read-only views: only copy when cleaning
+            # is needed
+            if not np.isfinite(data).all():
+                data = np.nan_to_num(data)
+        if raw:
+            with span("preprocess"):
+                try:
+                    data = preprocessor.transform(data)
+                except DecodeError as e:
+                    return jsonify({"error": str(e)}), 400
+        REQUEST_ROWS.observe(len(data))
 
         # -----------------------------
-        # Call TF Serving
+        # Call the model backend
         # -----------------------------
         start = time.time()
-        response = requests.post(
-            TF_SERVING_URL, json={"instances": data.tolist()}, timeout=10
-        )
+        try:
+            with span("model"):
+                probs = admission.score(score, data)
+        except AdmissionError as e:
+            return jsonify({"error": str(e)}), e.status, error_headers(e)
+        except DecodeError as e:
+            return jsonify({"error": str(e)}), 400
+        except InferenceError as e:
+            INFERENCE_ERRORS.inc()
+            return jsonify({"error": str(e)}), 500
         latency = time.time() - start
+        # Fallback-model scores are served, but flagged
+        probs, degraded = split_degraded(probs)
 
-        if response.status_code != 200:
-            return (
-                jsonify({"error": f"TF Serving request failed: {response.text}"}),
-                500,
+        with span("record"):
+            labels, prediction_ids = monitor.record(
+                probs, latency, true_class, threshold, degraded
             )
 
-        probs = np.array(response.json().get("predictions", [])).flatten()
-        labels = ["Fraud" if p > 0.5 else "Not Fraud" for p in probs]
-
-        # -----------------------------
-        # Log predictions into SQLite
-        # -----------------------------
-        for i, p in enumerate(probs):
-            lbl = labels[i]
-            tc = None
-            if true_class is not None:
-                tc = (
-                    int(true_class[i])
-                    if isinstance(true_class, list)
-                    else int(true_class)
+        with span("encode"):
+            response_type = request.accept_mimetypes.best_match(
+                RESPONSE_CONTENT_TYPES, default=JSON_CONTENT_TYPE
+            )
+            if response_type != JSON_CONTENT_TYPE:
+                body, headers = encode_response(
+                    response_type, labels, probs, prediction_ids
+                )
+                headers[LATENCY_HEADER] = repr(latency)
+                if degraded:
+                    headers[DEGRADED_HEADER] = "1"
+                return app.response_class(
+                    body, mimetype=response_type, headers=headers
                 )
 
-            cursor.execute(
-                """
-                INSERT INTO logs (
-                    timestamp, latency, prediction, probability, true_class
-                ) VALUES (?, ?, ?, ?, ?)
-                """,
-                (datetime.utcnow().isoformat(), latency, lbl, float(p), tc),
+            return jsonify(
+                {
+                    "predictions": labels,
+                    "probabilities": probs.tolist(),
+                    "latency": latency,
+                    "prediction_ids": prediction_ids,
+                    "degraded": degraded,
+                }
             )
-        conn.commit()
 
-        # -----------------------------
-        # Compute aggregate metrics
-        # -----------------------------
-        df = pd.read_sql_query(
-            """
-            SELECT prediction, true_class, latency
-            FROM logs
-            WHERE true_class IS NOT NULL
-            """,
-            conn,
-        )
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({"error": str(e)}), 500
+
+
+# -----------------------------
+# Streaming NDJSON prediction endpoint
+# -----------------------------
+@app.route("/predict/stream", methods=["POST"])
+def predict_stream():
+    try:
+        threshold = request_threshold(request.args.get("threshold"))
+    except DecodeError as e:
+        return jsonify({"error": str(e)}), 400
+    stream = request.stream
+
+    def generate():
+        # Only one chunk of rows is in memory; results go out per chunk
+        decoder = ChunkDecoder()
+        admitted = False
+        try:
+            while True:
+                line = stream.readline(STREAM_MAX_LINE_BYTES + 1)
+                chunk = decoder.feed(line) if line else decoder.finish()
+                if chunk is not None:
+                    data, true_class = chunk
+                    REQUEST_ROWS.observe(len(data))
+                    start = time.time()
+                    with span("model"):
+                        # Stream chunks are bulk work; only the first one
+                        # can be turned away
+                        probs = admission.score(score, data, BULK, admitted)
+                    admitted = True
+                    latency = time.time() - start
+                    probs, degraded = split_degraded(probs)
+                    with span("record"):
+                        labels, prediction_ids = monitor.record(
+                            probs, latency, true_class, threshold, degraded
+                        )
+                    with span("encode"):
+                        lines = encode_results(
+                            labels, probs, prediction_ids, degraded
+                        )
+                    yield lines
+                if not line:
+                    break
+        except InferenceError as e:
+            INFERENCE_ERRORS.inc()
+            yield encode_error(str(e))
+        except (AdmissionError, DecodeError) as e:
+            yield encode_error(str(e))
+        except Exception as e:
+            traceback.print_exc()
+            yield encode_error(str(e))
+
+    return app.response_class(generate(), mimetype=NDJSON_CONTENT_TYPE)
 
-        if len(df) > 0:
-            df["y_true"] = df["true_class"].astype(int)
-            df["y_pred"] = df["prediction"].map({"Not Fraud": 0, "Fraud": 1})
-
-            acc = accuracy_score(df["y_true"], df["y_pred"])
-            prec = precision_score(df["y_true"], df["y_pred"])
-            rec = recall_score(df["y_true"], df["y_pred"])
-            f1 = f1_score(df["y_true"], df["y_pred"])
-            avg_latency = df["latency"].mean()
-
-            cursor.execute(
-                """
-                INSERT INTO batch_metrics (
-                    num_samples, avg_probability, accuracy, precision, recall, f1_score
-                ) VALUES (?, ?, ?, ?, ?, ?)
-                """,
-                (len(data), float(np.mean(probs)), acc, prec, rec, f1),
+
+# -----------------------------
+# Delayed-label feedback endpoint
+# -----------------------------
+@app.route("/feedback", methods=["POST"])
+def feedback():
+    try:
+        if not request.is_json:
+            return jsonify({"error": "Request must be JSON"}), 400
+        try:
+            prediction_ids, true_classes = decode_feedback(
+                request.get_json(silent=True)
             )
-            conn.commit()
-
-            # Alerts & actions
-            alerts = []
-            actions = []
-
-            if acc < ACCURACY_THRESHOLD:
-                alerts.append(("accuracy", acc, ACCURACY_THRESHOLD))
-                actions.append("Flag model as degraded due to low accuracy.")
-            if prec < PRECISION_THRESHOLD:
-                alerts.append(("precision", prec, PRECISION_THRESHOLD))
-                actions.append("Investigate false positives (precision issue).")
-            if rec < RECALL_THRESHOLD:
-                alerts.append(("recall", rec, RECALL_THRESHOLD))
-                actions.append("Investigate false negatives (recall issue).")
-            if latency > LATENCY_THRESHOLD:
-                alerts.append(("latency", latency, LATENCY_THRESHOLD))
-                actions.append("Check system performance / optimize latency.")
-
-            for (metric, value, threshold), action in zip(alerts, actions):
-                cursor.execute(
-                    "INSERT INTO alerts (metric, value, threshold) VALUES (?, ?, ?)",
-                    (metric, float(value), float(threshold)),
-                )
-                cursor.execute(
-                    "INSERT INTO actions (metric, action) VALUES (?, ?)",
-                    (metric, action),
-                )
-            conn.commit()
-
-            # TensorBoard logging
-            with step_lock:
-                step = global_step
-                global_step += 1
-            with writer.as_default():
-                tf.summary.scalar("accuracy", acc, step=step)
-                tf.summary.scalar("precision", prec, step=step)
-                tf.summary.scalar("recall", rec, step=step)
-                tf.summary.scalar("f1_score", f1, step=step)
-                tf.summary.scalar("avg_latency", avg_latency, step=step)
-            writer.flush()
-
-        return jsonify(
-            {"predictions": labels, "probabilities": probs.tolist(), "latency": latency}
+        except DecodeError as e:
+            return jsonify({"error": str(e)}), 400
+
+        result = monitor.feedback(prediction_ids, true_classes)
+        # Pending ids may not be written yet: the client resends them
+        status = 202 if result["pending"] else 200
+        return (
+            jsonify({**result, "metrics": monitor.accumulator.metrics()}),
+            status,
         )
 
     except Exception as e:
         traceback.print_exc()
         return jsonify({"error": str(e)}), 500
 
+
 # -----------------------------
 # Debug / Monitor endpoint
 # -----------------------------
 @app.route("/debug/monitor", methods=["GET"])
 def debug_monitor():
-    # List of tables to display
-    tables = ["logs", "batch_metrics", "alerts", "actions"]
-    html = "<h1>Monitoring DB Preview</h1>"
-
-    for table in tables:
-        df = pd.read_sql_query(f"SELECT * FROM {table} LIMIT 50", conn)
-        html += f"<h2>Table: {table}</h2>"
-        html += df.to_html(index=False, border=1, classes="dataframe")
-    
-    return html
+    return monitor.monitor_html()
+
+
+# -----------------------------
+# Rollup endpoint (hourly / daily aggregates of logs)
+# -----------------------------
+@app.route("/debug/rollups", methods=["GET"])
+def debug_rollups():
+    granularity = request.args.get("granularity", "hourly")
+    if granularity not in ("hourly", "daily"):
+        return jsonify({"error": "granularity must be hourly or daily"}), 400
+    limit = request.args.get("limit", 48, type=int)
+    return jsonify(
+        {
+            "granularity": granularity,
+            "rollups": monitor.rollups(granularity, limit),
+            "compactor": monitor.compactor.stats(),
+        }
+    )
+
+
+# -----------------------------
+# Prometheus metrics endpoint
+# -----------------------------
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    return app.response_class(
+        REGISTRY.render(), content_type=PROMETHEUS_CONTENT_TYPE
+    )
+
+
+# -----------------------------
+# Micro-batching stats endpoint
+# -----------------------------
+@app.route("/debug/batching", methods=["GET"])
+def debug_batching():
+    if batcher is None:
+        return jsonify({"enabled": False})
+    return jsonify({"enabled": True, **batcher.stats()})
+
+
+# -----------------------------
+# Prediction cache stats endpoint
+# -----------------------------
+@app.route("/debug/cache", methods=["GET"])
+def debug_cache():
+    if cache is None:
+        return jsonify({"enabled": False})
+    return jsonify({"enabled": True, **cache.stats()})
+
+
+# -----------------------------
+# Admission control stats endpoint
+# -----------------------------
+@app.route("/debug/admission", methods=["GET"])
+def debug_admission():
+    return jsonify(admission.stats())
+
+
+# -----------------------------
+# TF Serving deadline / hedging / circuit breaker endpoint
+# -----------------------------
+@app.route("/debug/resilience", methods=["GET"])
+def debug_resilience():
+    if resilient is None:
+        return jsonify({"enabled": False})
+    return jsonify({"enabled": True, **resilient.stats()})
+
+
+# -----------------------------
+# Windowed metrics endpoint
+# -----------------------------
+@app.route("/debug/windows", methods=["GET"])
+def debug_windows():
+    return jsonify(monitor.window_metrics())
+
+
+# -----------------------------
+# Prediction drift endpoint (label-free)
+# -----------------------------
+@app.route("/debug/drift", methods=["GET"])
+def debug_drift():
+    return jsonify(monitor.drift.stats())
+
+
+# -----------------------------
+# Alert states and transitions endpoint
+# -----------------------------
+@app.route("/debug/alerts", methods=["GET"])
+def debug_alerts():
+    limit = request.args.get("limit", 50, type=int)
+    return jsonify(monitor.alert_status(limit))
+
+
+# -----------------------------
+# TensorBoard pipeline stats endpoint
+# -----------------------------
+@app.route("/debug/summaries", methods=["GET"])
+def debug_summaries():
+    return jsonify(monitor.summaries.stats())
+
+
+# -----------------------------
+# Readiness endpoint (warm-up state)
+# -----------------------------
+@app.route("/healthz", methods=["GET"])
+def healthz():
+    # Outside gunicorn no worker hook runs: warm up on the first probe
+    warmup.start()
+    body, status = health(
+        warmup, LOADED_AT, STARTUP_CPU_SECONDS, monitor.summaries
+    )
+    return jsonify(body), status
+
+
+# Startup cost reported by /healthz
+LOADED_AT = time.time()
+STARTUP_CPU_SECONDS = time.process_time()
 
 # -----------------------------
 # Run Flask
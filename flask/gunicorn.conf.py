@@ -0,0 +1,65 @@
+import multiprocessing
+import os
+import sys
+import tempfile
+
+# -----------------------------
+# Gunicorn configuration (used by start.sh)
+# -----------------------------
+# N workers x M threads. The app is imported once in the master and then
+# forked (preload_app), so workers share the model weights copy-on-write
+# and the monitoring state that shared.py puts in shared memory.
+bind = f":{os.environ.get('PORT', '8080')}"
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+threads = int(os.environ.get("GUNICORN_THREADS", "4"))
+preload_app = os.environ.get("PRELOAD_APP", "1") == "1"
+
+# The local backend imports TensorFlow and runs a warm-up call at import
+# time; TF's runtime threads do not survive a fork, so workers could hang
+if preload_app and os.environ.get("INFERENCE_BACKEND") == "local":
+    print(
+        "gunicorn.conf.py: preload_app disabled for INFERENCE_BACKEND=local "
+        "(TensorFlow is not fork-safe)",
+        file=sys.stderr,
+    )
+    preload_app = False
+
+# Without preloading, every worker imports the app on its own and gets
+# private copies of the shared.py state: metrics, windows and drift
+# would be split per worker. Run one worker and scale with threads.
+if not preload_app and workers > 1:
+    print(
+        f"gunicorn.conf.py: workers reduced from {workers} to 1 without "
+        "preload_app; raise GUNICORN_THREADS to scale",
+        file=sys.stderr,
+    )
+    workers = 1
+
+# Per-worker metric exports merged by /metrics (see telemetry.py); must be
+# set before the app is imported
+os.environ.setdefault(
+    "METRICS_MULTIPROC_DIR",
+    os.path.join(tempfile.gettempdir(), "fraud-metrics"),
+)
+
+
+def on_starting(server):
+    # Exports of a previous run would be summed into this one
+    directory = os.environ["METRICS_MULTIPROC_DIR"]
+    os.makedirs(directory, exist_ok=True)
+    for filename in os.listdir(directory):
+        if filename.endswith(".json"):
+            os.remove(os.path.join(directory, filename))
+
+
+def post_worker_init(worker):
+    # Threads do not survive fork: start this worker's background work
+    from shared import start_worker
+
+    start_worker()
+
+
+def child_exit(server, worker):
+    from telemetry import REGISTRY
+
+    REGISTRY.archive_worker(worker.pid)
@@ -0,0 +1,297 @@
+import asyncio
+import os
+import threading
+import time
+
+import numpy as np
+import requests
+from numpy_model import NumpyModel
+
+# -----------------------------
+# Backend configuration
+# -----------------------------
+# "remote" keeps the TF Serving HTTP hop, "local" loads the model into the
+# Flask worker and scores batches in-process, "numpy" scores the
+# BatchNorm-folded .npz export without TensorFlow.
+INFERENCE_BACKEND = os.environ.get("INFERENCE_BACKEND", "remote")
+TF_SERVING_URL = os.environ.get(
+    "TF_SERVING_URL",
+    "https://fraud-serving-447240734112.us-central1.run.app"
+    "/v1/models/fraud_model:predict",
+)
+TF_SERVING_TIMEOUT = float(os.environ.get("TF_SERVING_TIMEOUT", "10"))
+MODEL_VERSION_POLL_SECS = float(
+    os.environ.get("MODEL_VERSION_POLL_SECS", "30")
+)
+# Connection pool of the asyncio client to TF Serving (async_app.py)
+ASYNC_POOL_SIZE = int(os.environ.get("ASYNC_POOL_SIZE", "256"))
+MODEL_PATH = os.environ.get(
+    "MODEL_PATH",
+    os.path.join(
+        os.path.dirname(os.path.abspath(__file__)),
+        "..",
+        "tf_serving",
+        "saved_model",
+        "1",
+    ),
+)
+NUMPY_MODEL_PATH = os.environ.get(
+    "NUMPY_MODEL_PATH",
+    os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "fraud_model.npz"
+    ),
+)
+
+
+class InferenceError(RuntimeError):
+    """Raised when the model backend cannot score a batch."""
+
+
+class InferenceTimeout(InferenceError):
+    """The model server did not answer within the timeout."""
+
+
+class InvalidInputError(InferenceError):
+    """The model server rejected the batch itself (HTTP 400)."""
+
+
+def _status_error(status, text):
+    error = InvalidInputError if status == 400 else InferenceError
+    return error(f"TF Serving request failed: {text}")
+
+
+def _file_version(path):
+    """Version string for a local model artifact (path + modification time)."""
+    target = path
+    if os.path.isdir(path):
+        target = os.path.join(path, "saved_model.pb")
+    return f"{os.path.abspath(path)}@{os.stat(target).st_mtime_ns}"
+
+
+class RemoteBackend:
+    """Score batches through the TF Serving REST API."""
+
+    name = "remote"
+
+    def __init__(self, url=TF_SERVING_URL, timeout=TF_SERVING_TIMEOUT):
+        self.url = url
+        self.timeout = timeout
+        # Keep-alive connection pool instead of a new TCP/TLS handshake
+        # per request
+        self.session = requests.Session()
+
+        # TF Serving model status endpoint, e.g. /v1/models/fraud_model
+        self.status_url = url.rsplit(":", 1)[0]
+        self._version = None
+        self._version_thread = None
+        self._version_lock = threading.Lock()
+
+    def model_version(self):
+        """Latest AVAILABLE version reported by TF Serving (polled)."""
+        if self._version_thread is None:
+            with self._version_lock:
+                if self._version_thread is None:
+                    self._version_thread = threading.Thread(
+                        target=self._poll_version,
+                        name="model-version",
+                        daemon=True,
+                    )
+                    self._version_thread.start()
+        return self._version
+
+    def _poll_version(self):
+        while True:
+            try:
+                response = self.session.get(self.status_url, timeout=5)
+                if response.status_code == 200:
+                    versions = [
+                        int(status["version"])
+                        for status in response.json().get(
+                            "model_version_status", []
+                        )
+                        if status.get("state") == "AVAILABLE"
+                    ]
+                    if versions:
+                        self._version = str(max(versions))
+            except (requests.RequestException, ValueError, KeyError):
+                pass
+            time.sleep(MODEL_VERSION_POLL_SECS)
+
+    def predict(self, data, timeout=None):
+        try:
+            response = self.session.post(
+                self.url,
+                json={"instances": data.tolist()},
+                timeout=timeout or self.timeout,
+            )
+        except requests.Timeout as e:
+            raise InferenceTimeout(f"TF Serving request failed: {e!r}") from e
+        except requests.RequestException as e:
+            raise InferenceError(f"TF Serving request failed: {e!r}") from e
+        if response.status_code != 200:
+            raise _status_error(response.status_code, response.text)
+        return np.array(response.json().get("predictions", [])).flatten()
+
+
+class LocalBackend:
+    """Score batches in-process from a SavedModel or a .keras file."""
+
+    name = "local"
+
+    def __init__(self, model_path=MODEL_PATH):
+        import tensorflow as tf
+
+        self.model_path = model_path
+        if str(model_path).endswith(".keras"):
+            model = tf.keras.models.load_model(model_path, compile=False)
+            input_dim = model.input_shape[-1]
+            self._model = model
+            self._fn = tf.function(
+                lambda x: model(x, training=False),
+                input_signature=[tf.TensorSpec([None, input_dim], tf.float32)],
+            )
+        else:
+            loaded = tf.saved_model.load(model_path)
+            signature = loaded.signatures["serving_default"]
+            input_name, input_spec = next(
+                iter(signature.structured_input_signature[1].items())
+            )
+            input_dim = input_spec.shape[-1]
+            self._model = loaded
+            self._fn = lambda x: next(
+                iter(signature(**{input_name: x}).values())
+            )
+
+        self._tf = tf
+        self.input_dim = int(input_dim)
+        self._version = _file_version(model_path)
+
+        # Warm-up call so the first real request does not pay for tracing
+        self.predict(np.zeros((1, self.input_dim), dtype=np.float32))
+
+    def model_version(self):
+        return self._version
+
+    def predict(self, data):
+        if data.ndim != 2 or data.shape[1] != self.input_dim:
+            raise InferenceError(
+                f"Expected instances with {self.input_dim} features, "
+                f"got shape {data.shape}"
+            )
+        probs = self._fn(self._tf.constant(data, dtype=self._tf.float32))
+        return probs.numpy().astype(np.float64).flatten()
+
+
+class NumpyBackend:
+    """Score batches with the TensorFlow-free NumPy export."""
+
+    name = "numpy"
+
+    def __init__(self, model_path=NUMPY_MODEL_PATH):
+        self.model_path = model_path
+        self._model = NumpyModel(model_path)
+        self.input_dim = self._model.input_dim
+        self._version = _file_version(model_path)
+
+    def model_version(self):
+        return self._version
+
+    def predict(self, data):
+        if data.ndim != 2 or data.shape[1] != self.input_dim:
+            raise InferenceError(
+                f"Expected instances with {self.input_dim} features, "
+                f"got shape {data.shape}"
+            )
+        return self._model.predict(data).astype(np.float64)
+
+
+def load_backend(name=INFERENCE_BACKEND):
+    """Build the inference backend selected by INFERENCE_BACKEND."""
+    if name == "remote":
+        return RemoteBackend()
+    if name == "local":
+        return LocalBackend()
+    if name == "numpy":
+        return NumpyBackend()
+    raise ValueError(f"Unknown INFERENCE_BACKEND: {name!r}")
+
+
+class AsyncRemoteBackend:
+    """
+    Score batches through the TF Serving REST API from an event loop.
+
+    One pooled ``aiohttp`` session (up to ``pool_size`` keep-alive
+    connections) is shared by every in-flight request; ``start`` and
+    ``close`` must run on the serving loop.
+    """
+
+    name = "remote"
+
+    def __init__(
+        self,
+        url=TF_SERVING_URL,
+        timeout=TF_SERVING_TIMEOUT,
+        pool_size=ASYNC_POOL_SIZE,
+    ):
+        self.url = url
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self._session = None
+
+    async def start(self):
+        import aiohttp
+
+        self._session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit=self.pool_size, keepalive_timeout=60
+            ),
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+        )
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def predict(self, data, timeout=None):
+        import aiohttp
+
+        try:
+            async with self._session.post(
+                self.url,
+                json={"instances": data.tolist()},
+                timeout=aiohttp.ClientTimeout(total=timeout or self.timeout),
+            ) as response:
+                if response.status != 200:
+                    raise _status_error(response.status, await response.text())
+                result = await response.json(content_type=None)
+        except asyncio.TimeoutError as e:
+            raise InferenceTimeout(f"TF Serving request failed: {e!r}") from e
+        except aiohttp.ClientError as e:
+            raise InferenceError(f"TF Serving request failed: {e!r}") from e
+        return np.array(result.get("predictions", [])).flatten()
+
+
+class ExecutorBackend:
+    """Run a blocking in-process backend on the loop's thread pool."""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.name = backend.name
+
+    async def start(self):
+        pass
+
+    async def close(self):
+        pass
+
+    async def predict(self, data):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.backend.predict, data)
+
+
+def load_async_backend(name=INFERENCE_BACKEND):
+    """Awaitable counterpart of ``load_backend`` for async_app.py."""
+    if name == "remote":
+        return AsyncRemoteBackend()
+    return ExecutorBackend(load_backend(name))
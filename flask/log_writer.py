@@ -0,0 +1,182 @@
+import os
+import queue
+import sqlite3
+import threading
+import time
+import traceback
+from concurrent.futures import Future
+
+from storage import connect
+from telemetry import LOG_WRITE_ROWS, span
+
+# -----------------------------
+# Write-behind configuration
+# -----------------------------
+LOG_QUEUE_SIZE = int(os.environ.get("LOG_QUEUE_SIZE", "10000"))
+LOG_FLUSH_ROWS = int(os.environ.get("LOG_FLUSH_ROWS", "5000"))
+LOG_FLUSH_INTERVAL = float(os.environ.get("LOG_FLUSH_INTERVAL", "0.5"))
+# A batch that finds the database locked (e.g. a long VACUUM) is retried
+# for this long before its rows are dropped; meanwhile the queue fills and
+# submit applies backpressure
+LOG_LOCKED_RETRY_SECS = float(os.environ.get("LOG_LOCKED_RETRY_SECS", "120"))
+LOG_RETRY_BACKOFF_MAX = 5.0
+
+_STOP = object()
+
+
+class LogWriter:
+    """
+    Background SQLite writer fed by a bounded in-memory queue.
+
+    Each submitted unit is a list of ``(sql, rows)`` statements that is
+    written atomically. Units are buffered until ``flush_rows`` rows are
+    pending or ``flush_interval`` seconds have passed since the first one,
+    then written with ``executemany`` in a single transaction. When the
+    queue is full, ``submit`` blocks (backpressure instead of data loss).
+    A transaction that finds the database locked is retried with backoff
+    for ``locked_retry_secs`` before its rows are counted as failed.
+    """
+
+    def __init__(
+        self,
+        db_path,
+        max_queue=LOG_QUEUE_SIZE,
+        flush_rows=LOG_FLUSH_ROWS,
+        flush_interval=LOG_FLUSH_INTERVAL,
+        locked_retry_secs=LOG_LOCKED_RETRY_SECS,
+    ):
+        self.db_path = db_path
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.locked_retry_secs = locked_retry_secs
+
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+        self._stats_lock = threading.Lock()
+        self._transactions = 0
+        self._rows_written = 0
+        self._failed_rows = 0
+        self._locked_retries = 0
+
+    def submit(self, statements):
+        """Enqueue one unit of ``(sql, rows)`` statements."""
+        self._ensure_started()
+        self._queue.put(statements)
+
+    def flush(self, timeout=None):
+        """Block until everything submitted so far has been written."""
+        self._ensure_started()
+        done = Future()
+        self._queue.put(done)
+        done.result(timeout=timeout)
+
+    def close(self, timeout=10.0):
+        """Drain the queue and stop the writer thread."""
+        if self._thread is None:
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout=timeout)
+        self._thread = None
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="log-writer", daemon=True
+                )
+                self._thread.start()
+
+    def _run(self):
+        conn = connect(self.db_path)
+        try:
+            stopping = False
+            while not stopping:
+                units, waiters = [], []
+                item = self._queue.get()
+                deadline = time.monotonic() + self.flush_interval
+                rows = 0
+
+                while True:
+                    if item is _STOP:
+                        stopping = True
+                    elif isinstance(item, Future):
+                        waiters.append(item)
+                    else:
+                        units.append(item)
+                        rows += sum(len(params) for _, params in item)
+
+                    if stopping or waiters or rows >= self.flush_rows:
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        item = self._queue.get(timeout=remaining)
+                    except queue.Empty:
+                        break
+
+                if units:
+                    self._write(conn, units, rows)
+                for waiter in waiters:
+                    waiter.set_result(None)
+        finally:
+            conn.close()
+
+    def _write(self, conn, units, rows):
+        # Merge identical statements so each one is a single executemany
+        grouped = {}
+        for unit in units:
+            for sql, params in unit:
+                grouped.setdefault(sql, []).extend(params)
+
+        deadline = time.monotonic() + self.locked_retry_secs
+        backoff = 0.05
+        while True:
+            try:
+                with span("sqlite_write"), conn:
+                    for sql, params in grouped.items():
+                        conn.executemany(sql, params)
+                break
+            except sqlite3.OperationalError as e:
+                # The transaction was rolled back: safe to run it again
+                if _is_locked(e) and time.monotonic() < deadline:
+                    with self._stats_lock:
+                        self._locked_retries += 1
+                    time.sleep(backoff)
+                    backoff = min(2 * backoff, LOG_RETRY_BACKOFF_MAX)
+                    continue
+                self._fail(rows)
+                return
+            except sqlite3.Error:
+                self._fail(rows)
+                return
+
+        LOG_WRITE_ROWS.observe(rows)
+        with self._stats_lock:
+            self._transactions += 1
+            self._rows_written += rows
+
+    def _fail(self, rows):
+        traceback.print_exc()
+        with self._stats_lock:
+            self._failed_rows += rows
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                "queue_depth": self._queue.qsize(),
+                "queue_capacity": self._queue.maxsize,
+                "transactions": self._transactions,
+                "rows_written": self._rows_written,
+                "failed_rows": self._failed_rows,
+                "locked_retries": self._locked_retries,
+            }
+
+
+def _is_locked(error):
+    message = str(error)
+    return "locked" in message or "busy" in message
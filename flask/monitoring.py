@@ -0,0 +1,487 @@
+import os
+import threading
+import time
+from datetime import datetime
+from itertools import repeat
+
+import numpy as np
+from alerting import AlertEvaluator, AlertRule, hysteresis, read_alerts
+from decision import classify, load_decision_threshold
+from drift import DRIFT_ACTIONS, DRIFT_METRICS, DriftMonitor
+from feedback import apply_labels, epoch_seconds, prediction_prefix
+from log_writer import LogWriter
+from rollup import RollupCompactor, read_rollups
+from running_metrics import UPDATE_METRIC_STATE_SQL, ConfusionAccumulator
+from shared import StepCounter, elect_writer, is_inherited, on_worker_start
+from storage import DB_PATH, get_connection, init_db, read_connection
+from summary_writer import SummaryPipeline
+from telemetry import observe_stage, span
+from windowed_metrics import WindowedMetrics
+
+INSERT_LOG_SQL = """
+INSERT INTO logs (
+    timestamp, latency, prediction, probability, true_class, prediction_id,
+    degraded
+) VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
+
+INSERT_BATCH_METRICS_SQL = """
+INSERT INTO batch_metrics (
+    num_samples, avg_probability, accuracy, precision, recall, f1_score
+) VALUES (?, ?, ?, ?, ?, ?)
+"""
+
+# -----------------------------
+# Thresholds
+# -----------------------------
+ACCURACY_THRESHOLD = 0.90
+PRECISION_THRESHOLD = 0.75
+RECALL_THRESHOLD = 0.35
+LATENCY_THRESHOLD = 0.50  # seconds
+
+# Alert rules, evaluated off the request path by alerting.AlertEvaluator.
+# Quality rules read the window named by <METRIC>_ALERT_WINDOW, defaulting
+# to ALERT_WINDOW: "all" (full history), "count", "time" or "decay" (see
+# windowed_metrics). The latency rule reads the mean latency of every
+# request, labelled or not, over the last METRICS_WINDOW_MINUTES. A firing
+# alert resolves once the metric is <METRIC>_ALERT_HYSTERESIS past its
+# threshold on the healthy side.
+LATENCY_ACTION = "Check system performance / optimize latency."
+ALERT_RULES = [
+    AlertRule(
+        "accuracy",
+        ACCURACY_THRESHOLD,
+        "Flag model as degraded due to low accuracy.",
+        band=hysteresis("accuracy", 0.01),
+    ),
+    AlertRule(
+        "precision",
+        PRECISION_THRESHOLD,
+        "Investigate false positives (precision issue).",
+        band=hysteresis("precision", 0.02),
+    ),
+    AlertRule(
+        "recall",
+        RECALL_THRESHOLD,
+        "Investigate false negatives (recall issue).",
+        band=hysteresis("recall", 0.02),
+    ),
+    AlertRule(
+        "latency",
+        LATENCY_THRESHOLD,
+        LATENCY_ACTION,
+        above=True,
+        band=hysteresis("latency", 0.05),
+    ),
+]
+ALERT_WINDOW = os.environ.get("ALERT_WINDOW", "all")
+ALERT_WINDOWS = {
+    rule.metric: os.environ.get(
+        f"{rule.metric.upper()}_ALERT_WINDOW", ALERT_WINDOW
+    )
+    for rule in ALERT_RULES
+    if rule.metric != "latency"
+}
+# Default hysteresis of the drift_psi / drift_ks rules
+DRIFT_HYSTERESIS = {"psi": 0.05, "ks": 0.02}
+
+MONITOR_TABLES = ["logs", "batch_metrics", "alerts", "actions", "alert_state"]
+
+
+class PredictionMonitor:
+    """
+    Everything that happens to a scored batch after the model call.
+
+    Shared by the Flask app and the asyncio app: builds the log rows,
+    updates the running and windowed metrics and drift histograms,
+    queues TensorBoard scalars and hands one unit of statements to the
+    write-behind log writer. Nothing here waits on SQLite or TensorBoard.
+
+    Built once before gunicorn forks its workers (``preload_app``): the
+    step counter, running metrics, windows and drift histograms are in
+    shared memory, each worker logs through its own writer thread, and
+    one elected worker runs the rollup compactor, the alert evaluator
+    and the TensorBoard writer (see ``start``).
+    """
+
+    def __init__(self, db_path=DB_PATH):
+        self.db_path = db_path
+        self._created_pid = os.getpid()
+
+        # Serving threshold (artifact from model_training.py)
+        self.decision = load_decision_threshold()
+        self.threshold = self.decision["threshold"]
+
+        # TensorBoard setup (buffered, written by one background thread)
+        self.summaries = SummaryPipeline()
+        # Shared by all workers, forked or not
+        self._steps = StepCounter(f"{db_path}.steps")
+
+        # Running confusion counts over labelled logs (rebuilt at startup)
+        conn = init_db(db_path)
+        self.accumulator = ConfusionAccumulator()
+        with conn:
+            self.accumulator.restore(conn.cursor())
+        conn.close()
+
+        # Recent-history metrics for alerting (fixed memory, O(batch))
+        self.windows = WindowedMetrics()
+
+        # Label-free drift of the served probabilities (fixed bins)
+        self.drift = DriftMonitor()
+
+        # Write-behind logging: the request only enqueues
+        self.log_writer = LogWriter(db_path)
+
+        # Hourly/daily rollups and retention of raw rows (writer only)
+        self.compactor = RollupCompactor(db_path)
+
+        # Alert state machine over the aggregated metrics (writer only)
+        drift_rules = [
+            AlertRule(
+                f"drift_{metric}",
+                self.drift.thresholds[metric],
+                DRIFT_ACTIONS[metric],
+                above=True,
+                band=hysteresis(f"drift_{metric}", DRIFT_HYSTERESIS[metric]),
+            )
+            for metric in DRIFT_METRICS
+        ]
+        self.alerts = AlertEvaluator(
+            db_path, ALERT_RULES + drift_rules, self.alert_metrics
+        )
+        self.writer = False
+        self._started_pid = None
+        self._start_lock = threading.Lock()
+        on_worker_start(self.start)
+
+    def start(self):
+        """
+        Start this process's background work: once per worker, called
+        by gunicorn.conf.py after the fork or by the first request.
+
+        The worker holding the ``<db>.writer`` lock runs the compactor
+        and the alert evaluator and writes TensorBoard summaries; workers
+        forked from the process that built this monitor forward their
+        summaries to it.
+        """
+        with self._start_lock:
+            if self._started_pid == os.getpid():
+                return
+            self._started_pid = os.getpid()
+
+            self.writer = elect_writer(self.db_path)
+            if self.writer:
+                self.compactor.start()
+                self.alerts.start()
+                self.summaries.start()
+            elif is_inherited(self._created_pid):
+                self.summaries.forward()
+            else:
+                # Not forked from the writer: there is no queue to it, and
+                # a second event file would interleave steps
+                self.summaries.discard()
+
+    def record(
+        self, probs, latency, true_class=None, threshold=None, degraded=False
+    ):
+        """
+        Label, log a scored batch and update metrics.
+
+        Rows with ``probs >= threshold`` (default: the serving threshold;
+        ``>`` for the 0.5 fallback) are fraud. Returns
+        ``(labels, prediction_ids)``. Ids are ``<prefix>-<row>`` with one
+        time-stamped random prefix per batch (see ``prediction_prefix``);
+        ``/feedback`` takes them back.
+
+        ``degraded`` batches were scored by the fallback model: they are
+        logged with ``degraded = 1`` but kept out of the drift histograms
+        and the quality metrics, which describe the primary model.
+        """
+        if self._started_pid != os.getpid():
+            self.start()
+
+        rows_start = time.perf_counter()
+        strict = False
+        if threshold is None:
+            threshold = self.threshold
+            strict = self.decision["strict"]
+        fraud, labels = classify(probs, threshold, strict)
+        prefix = prediction_prefix()
+        prediction_ids = [f"{prefix}-{i}" for i in range(len(probs))]
+
+        # -----------------------------
+        # Queue prediction logs (written in bulk by the log writer)
+        # -----------------------------
+        if true_class is None:
+            row_classes = [None] * len(probs)
+            labelled, y_true = [], []
+        elif isinstance(true_class, list):
+            if len(true_class) < len(probs):
+                raise ValueError(
+                    "'true_class' must have one label per instance"
+                )
+            row_classes = [
+                None if tc is None else int(tc)
+                for tc in true_class[: len(probs)]
+            ]
+            # Rows without a label (None in the list) are logged only
+            labelled = [
+                i for i, tc in enumerate(row_classes) if tc is not None
+            ]
+            y_true = [row_classes[i] for i in labelled]
+        else:
+            row_classes = [int(true_class)] * len(probs)
+            labelled = slice(None)
+            y_true = np.full(len(probs), int(true_class))
+
+        timestamp = datetime.utcnow().isoformat()
+        statements = [
+            (
+                INSERT_LOG_SQL,
+                list(
+                    zip(
+                        repeat(timestamp),
+                        repeat(latency),
+                        fraud.view(np.int8).tolist(),
+                        probs.tolist(),
+                        row_classes,
+                        prediction_ids,
+                        repeat(int(degraded)),
+                    )
+                ),
+            )
+        ]
+
+        # -----------------------------
+        # Update aggregate metrics (O(batch), same transaction as logs)
+        # -----------------------------
+        metrics_start = time.perf_counter()
+        observe_stage("log_rows", metrics_start - rows_start)
+
+        # Alerts are evaluated on these aggregates by the writer's
+        # AlertEvaluator, not per request
+        self.windows.observe_request(latency)
+        if not degraded:
+            self.drift.update(probs)
+
+        if len(y_true) and not degraded:
+            y_pred = fraud[labelled]
+            snapshot, delta = self.accumulator.update(y_true, y_pred, latency)
+            statements.append((UPDATE_METRIC_STATE_SQL, [delta]))
+            self.windows.update(y_true, y_pred, latency)
+        else:
+            snapshot = self.accumulator.metrics()
+
+        if snapshot["num_labelled"] > 0 and not degraded:
+            acc = snapshot["accuracy"]
+            prec = snapshot["precision"]
+            rec = snapshot["recall"]
+            f1 = snapshot["f1_score"]
+            avg_latency = snapshot["avg_latency"]
+
+            statements.append(
+                (
+                    INSERT_BATCH_METRICS_SQL,
+                    [(len(probs), float(np.mean(probs)), acc, prec, rec, f1)],
+                )
+            )
+
+            # TensorBoard logging
+            self.summaries.add(
+                self._steps.next(),
+                {
+                    "accuracy": acc,
+                    "precision": prec,
+                    "recall": rec,
+                    "f1_score": f1,
+                    "avg_latency": avg_latency,
+                },
+            )
+
+        observe_stage("metrics", time.perf_counter() - metrics_start)
+
+        # Blocks only when the write-behind queue is full
+        with span("log_enqueue"):
+            self.log_writer.submit(statements)
+        return labels, prediction_ids
+
+    def feedback(self, prediction_ids, true_classes):
+        """
+        Attach delayed labels to logged predictions (see feedback.py).
+
+        This worker's pending log rows are flushed first so ids it
+        returned moments ago are found; recent ids still queued in
+        another worker come back as ``pending_ids``. The running metrics
+        take the confusion delta directly and the windows get newly
+        labelled rows at the time they were scored (see
+        ``WindowedMetrics``); neither re-scans ``logs``.
+        """
+        if self._started_pid != os.getpid():
+            self.start()
+
+        self.log_writer.flush()
+        with span("feedback"):
+            result, delta, newly_labelled = apply_labels(
+                get_connection(self.db_path), prediction_ids, true_classes
+            )
+            self.accumulator.add(delta)
+            if newly_labelled:
+                y_true, y_pred, latency, scored = zip(*newly_labelled)
+                self.windows.update(
+                    y_true, y_pred, latency, epoch_seconds(scored)
+                )
+        return result
+
+    def register_metrics(self, registry):
+        """Expose queue depths and writer counters on ``/metrics``."""
+        registry.callback(
+            "fraud_log_queue_depth",
+            "gauge",
+            "Statement units waiting for the SQLite write-behind writer.",
+            lambda: self.log_writer.stats()["queue_depth"],
+        )
+        registry.callback(
+            "fraud_log_rows_total",
+            "counter",
+            "Rows handled by the SQLite write-behind writer.",
+            lambda: {
+                ("written",): self.log_writer.stats()["rows_written"],
+                ("failed",): self.log_writer.stats()["failed_rows"],
+            },
+            labelnames=("result",),
+        )
+        registry.callback(
+            "fraud_summary_pending",
+            "gauge",
+            "TensorBoard scalars waiting to be written.",
+            lambda: self.summaries.stats()["pending"],
+        )
+        registry.callback(
+            "fraud_summary_points_total",
+            "counter",
+            "TensorBoard scalars by outcome.",
+            lambda: {
+                (key,): value
+                for key, value in self.summaries.stats().items()
+                if key in ("written", "dropped", "failed")
+            },
+            labelnames=("result",),
+        )
+        registry.callback(
+            "fraud_rollup_rows_total",
+            "counter",
+            "Raw rows folded into rollups or deleted by retention.",
+            lambda: {
+                ("rolled",): self.compactor.stats()["rows_rolled"],
+                ("deleted",): self.compactor.stats()["rows_deleted"],
+            },
+            labelnames=("result",),
+        )
+        registry.callback(
+            "fraud_labelled_predictions",
+            "gauge",
+            "Labelled predictions behind the running metrics.",
+            lambda: self.accumulator.metrics()["num_labelled"],
+            aggregate="max",
+        )
+        registry.callback(
+            "fraud_decision_threshold",
+            "gauge",
+            "Default probability threshold for the Fraud label.",
+            lambda: self.threshold,
+            aggregate="max",
+        )
+        registry.callback(
+            "fraud_alert_firing",
+            "gauge",
+            "1 while the alert rule is firing (reported by the writer).",
+            lambda: {
+                (metric,): value
+                for metric, value in self.alerts.firing().items()
+            },
+            labelnames=("metric",),
+            aggregate="max",
+        )
+        registry.callback(
+            "fraud_prediction_drift",
+            "gauge",
+            "PSI / KS distance of the current window's probabilities "
+            "from the training reference.",
+            lambda: {
+                (metric,): value
+                for metric, value in self.drift.metrics().items()
+                if value is not None
+            },
+            labelnames=("metric",),
+            aggregate="max",
+        )
+
+    def alert_metrics(self):
+        """
+        ``{metric: value}`` the alert rules are evaluated on; ``None``
+        while a metric has no data (no labels or too few predictions).
+        """
+        windows = {"all": self.accumulator.metrics()}
+        requests = self.windows.request_metrics()
+        values = {
+            "latency": (
+                requests["avg_latency"] if requests["num_requests"] else None
+            )
+        }
+        for metric, window in ALERT_WINDOWS.items():
+            if window not in windows:
+                windows[window] = self.windows.metrics(window)
+            current = windows[window]
+            values[metric] = (
+                current[metric] if current["num_labelled"] else None
+            )
+        for metric, value in self.drift.alert_metrics().items():
+            values[f"drift_{metric}"] = value
+        return values
+
+    def alert_status(self, limit=50):
+        """Rule states and recent transitions (from SQLite: any worker)."""
+        return {
+            **read_alerts(read_connection(self.db_path), limit),
+            "evaluator": self.alerts.stats(),
+        }
+
+    def window_metrics(self):
+        return {
+            "all": self.accumulator.metrics(),
+            **self.windows.all_metrics(),
+            "requests": self.windows.request_metrics(),
+            "alert_windows": ALERT_WINDOWS,
+        }
+
+    def rollups(self, granularity="hourly", limit=48):
+        return read_rollups(read_connection(self.db_path), granularity, limit)
+
+    def monitor_html(self):
+        """HTML preview: recent rollups, then the first 50 raw rows."""
+        # Only the dashboard needs pandas: keep it off the cold start
+        import pandas as pd
+
+        html = "<h1>Monitoring DB Preview</h1>"
+        for granularity, limit in (("hourly", 48), ("daily", 30)):
+            df = pd.DataFrame(self.rollups(granularity, limit))
+            if not df.empty:
+                df = df.drop(columns=["probability_hist"])
+            html += f"<h2>Rollup: {granularity}</h2>"
+            html += df.to_html(index=False, border=1, classes="dataframe")
+        for table in MONITOR_TABLES:
+            df = pd.read_sql_query(
+                f"SELECT * FROM {table} LIMIT 50",
+                read_connection(self.db_path),
+            )
+            html += f"<h2>Table: {table}</h2>"
+            html += df.to_html(index=False, border=1, classes="dataframe")
+        return html
+
+    def close(self):
+        """Drain the log writer, then the TensorBoard buffer."""
+        self.alerts.close()
+        self.compactor.close()
+        self.log_writer.close()
+        self.summaries.close()
@@ -0,0 +1,49 @@
+import numpy as np
+
+# Activations produced by model_training.export_numpy_weights
+SUPPORTED_ACTIVATIONS = ("relu", "sigmoid", "linear")
+
+
+class NumpyModel:
+    """
+    TensorFlow-free scorer for the BatchNorm-folded .npz export.
+
+    The archive holds one float32 ``kernel_i``/``bias_i`` pair per Dense
+    layer plus their ``activations`` names, written by
+    ``export_numpy_weights`` in model_training.py.
+    """
+
+    def __init__(self, path):
+        with np.load(path, allow_pickle=False) as weights:
+            activations = weights["activations"].tolist()
+            self.layers = [
+                (
+                    np.ascontiguousarray(weights[f"kernel_{i}"], np.float32),
+                    np.ascontiguousarray(weights[f"bias_{i}"], np.float32),
+                    activation,
+                )
+                for i, activation in enumerate(activations)
+            ]
+
+        for _, _, activation in self.layers:
+            if activation not in SUPPORTED_ACTIVATIONS:
+                raise ValueError(f"Unsupported activation: {activation}")
+
+        self.path = path
+        self.input_dim = self.layers[0][0].shape[0]
+
+    def predict(self, data):
+        h = np.asarray(data, dtype=np.float32)
+        for kernel, bias, activation in self.layers:
+            h = h @ kernel
+            h += bias
+            if activation == "relu":
+                np.maximum(h, 0.0, out=h)
+            elif activation == "sigmoid":
+                # 1 / (1 + exp(-h)); exp overflow saturates to 0 as intended
+                with np.errstate(over="ignore"):
+                    np.negative(h, out=h)
+                    np.exp(h, out=h)
+                h += 1.0
+                np.reciprocal(h, out=h)
+        return h.ravel()
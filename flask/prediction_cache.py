@@ -0,0 +1,152 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+from resilience import DegradedScores, split_degraded
+
+# -----------------------------
+# Prediction cache configuration
+# -----------------------------
+PREDICTION_CACHE = os.environ.get("PREDICTION_CACHE", "0") == "1"
+PREDICTION_CACHE_SIZE = int(os.environ.get("PREDICTION_CACHE_SIZE", "100000"))
+PREDICTION_CACHE_TTL = float(os.environ.get("PREDICTION_CACHE_TTL", "600"))
+
+
+class PredictionCache:
+    """
+    Bounded LRU cache of probabilities keyed by the float32 feature row.
+
+    Rows are keyed by their raw bytes, so retried or replayed transactions
+    are served without a model call. Duplicate rows inside one batch are
+    scored once, and only the distinct misses are sent to the model in a
+    single call. Entries expire after ``ttl_seconds``, the least recently
+    used entry is evicted beyond ``max_size``, and the whole cache is
+    cleared when ``version_fn()`` reports a new model version.
+    """
+
+    def __init__(
+        self,
+        version_fn,
+        max_size=PREDICTION_CACHE_SIZE,
+        ttl_seconds=PREDICTION_CACHE_TTL,
+    ):
+        self.version_fn = version_fn
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+
+        self._entries = OrderedDict()  # row bytes -> (probability, expiry)
+        self._version = None
+        self._lock = threading.Lock()
+
+        self._hits = 0
+        self._misses = 0
+        self._deduplicated = 0
+        self._evictions = 0
+        self._expirations = 0
+        self._invalidations = 0
+
+    def wrap(self, predict_fn):
+        """Return ``predict_fn`` with the cache in front of it."""
+        return lambda data: self.score(data, predict_fn)
+
+    def score(self, data, predict_fn):
+        data = np.ascontiguousarray(data, dtype=np.float32)
+        # One opaque void scalar per row; tolist() yields its bytes
+        keys = data.view(np.dtype((np.void, data.shape[1] * 4))).ravel()
+        keys = keys.tolist()
+
+        probs = np.empty(len(keys), dtype=np.float64)
+        misses = {}  # row bytes -> positions in this batch
+        version = self.version_fn()
+        now = time.monotonic()
+
+        with self._lock:
+            if version != self._version:
+                if self._entries:
+                    self._invalidations += 1
+                self._entries.clear()
+                self._version = version
+
+            for i, key in enumerate(keys):
+                entry = self._entries.get(key)
+                if entry is not None:
+                    if entry[1] > now:
+                        self._entries.move_to_end(key)
+                        probs[i] = entry[0]
+                        self._hits += 1
+                        continue
+                    del self._entries[key]
+                    self._expirations += 1
+                positions = misses.get(key)
+                if positions is None:
+                    misses[key] = [i]
+                else:
+                    positions.append(i)
+                    self._deduplicated += 1
+            self._misses += len(misses)
+
+        if not misses:
+            return probs
+
+        first = [positions[0] for positions in misses.values()]
+        scored, degraded = split_degraded(predict_fn(data[first]))
+        scored = np.asarray(scored, dtype=np.float64)
+        if len(scored) != len(first):
+            raise ValueError(
+                f"Model returned {len(scored)} predictions "
+                f"for {len(first)} instances"
+            )
+        for positions, p in zip(misses.values(), scored):
+            probs[positions] = p
+        if degraded:
+            # Fallback-model scores are never cached
+            return probs.view(DegradedScores)
+
+        expiry = time.monotonic() + self.ttl_seconds
+        with self._lock:
+            if version == self._version:
+                for key, p in zip(misses, scored.tolist()):
+                    self._entries[key] = (p, expiry)
+                    self._entries.move_to_end(key)
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+                    self._evictions += 1
+        return probs
+
+    def register_metrics(self, registry):
+        registry.callback(
+            "fraud_cache_size",
+            "gauge",
+            "Rows held by the prediction cache.",
+            lambda: self.stats()["size"],
+        )
+        registry.callback(
+            "fraud_cache_lookups_total",
+            "counter",
+            "Prediction cache lookups by outcome.",
+            lambda: {
+                (key,): value
+                for key, value in self.stats().items()
+                if key in ("hits", "misses", "deduplicated")
+            },
+            labelnames=("result",),
+        )
+
+    def stats(self):
+        with self._lock:
+            lookups = self._hits + self._misses + self._deduplicated
+            return {
+                "model_version": self._version,
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self._hits,
+                "misses": self._misses,
+                "deduplicated": self._deduplicated,
+                "hit_ratio": self._hits / lookups if lookups else 0.0,
+                "evictions": self._evictions,
+                "expirations": self._expirations,
+                "invalidations": self._invalidations,
+            }
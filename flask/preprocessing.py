@@ -0,0 +1,120 @@
+import json
+import os
+
+import numpy as np
+from tensor_codec import DecodeError
+
+# -----------------------------
+# Server-side feature engineering and scaling (/predict/raw)
+# -----------------------------
+# Raw transactions (Time, V1..V28, Amount) get the engineered features of
+# `feature_engineering` in model_training.py and the fitted StandardScaler,
+# whose mean / scale are exported by `save_scaler_params` as plain JSON
+# arrays (no pickled sklearn object, no sklearn import at serving time).
+SCALER_PATH = os.environ.get(
+    "SCALER_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "scaler.json"),
+)
+
+RAW_COLUMNS = ("Time", *(f"V{i}" for i in range(1, 29)), "Amount")
+ENGINEERED_COLUMNS = ("log_amount", "hour", "is_night")
+FEATURE_COLUMNS = RAW_COLUMNS + ENGINEERED_COLUMNS
+
+TIME, AMOUNT = 0, len(RAW_COLUMNS) - 1
+LOG_AMOUNT, HOUR, IS_NIGHT = range(len(RAW_COLUMNS), len(FEATURE_COLUMNS))
+# Night is 00:00-05:59
+NIGHT_END_HOUR = 6
+
+
+def load_scaler(path=SCALER_PATH):
+    """
+    Read ``{"feature_names": [...], "mean": [...], "scale": [...]}``.
+
+    Returns ``(mean, scale)`` as float64 arrays in ``FEATURE_COLUMNS``
+    order, or ``None`` if the file does not exist.
+    """
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        params = json.load(f)
+    if tuple(params["feature_names"]) != FEATURE_COLUMNS:
+        raise ValueError(
+            f"{path}: scaler features {params['feature_names']} do not "
+            f"match {list(FEATURE_COLUMNS)}"
+        )
+    mean = np.asarray(params["mean"], dtype=np.float64)
+    scale = np.asarray(params["scale"], dtype=np.float64)
+    if mean.shape != (len(FEATURE_COLUMNS),) or scale.shape != mean.shape:
+        raise ValueError(f"Malformed scaler parameters: {path}")
+    return mean, scale
+
+
+def raw_instances(payload):
+    """
+    JSON ``instances`` given as objects keyed by column name become rows
+    in ``RAW_COLUMNS`` order; lists of values are returned unchanged.
+    """
+    if not isinstance(payload, dict):
+        return payload
+    instances = payload.get("instances")
+    if isinstance(instances, dict):
+        instances = [instances]
+    if not instances or not isinstance(instances[0], dict):
+        return payload
+    try:
+        rows = [[row[name] for name in RAW_COLUMNS] for row in instances]
+    except KeyError as e:
+        raise DecodeError(f"Missing column {e.args[0]!r}") from e
+    except TypeError as e:
+        raise DecodeError("'instances' must all be objects") from e
+    return {**payload, "instances": rows}
+
+
+class Preprocessor:
+    """
+    Raw rows to scaled model features in one vectorized pass.
+
+    ``transform`` writes the raw columns and the three engineered ones
+    into a single float64 buffer, standardizes it in place with the
+    preloaded ``mean`` / ``scale`` and returns float32 rows for the model.
+    """
+
+    def __init__(self, path=SCALER_PATH):
+        self.path = path
+        loaded = load_scaler(path)
+        self.mean, self.scale = loaded if loaded is not None else (None, None)
+
+    @property
+    def available(self):
+        return self.mean is not None
+
+    def transform(self, raw):
+        raw = np.asarray(raw, dtype=np.float64)
+        if raw.ndim != 2 or raw.shape[1] != len(RAW_COLUMNS):
+            raise DecodeError(
+                f"Expected raw rows with {len(RAW_COLUMNS)} values "
+                f"({', '.join(RAW_COLUMNS[:2])}, ..., {RAW_COLUMNS[-1]}), "
+                f"got shape {raw.shape}"
+            )
+        if (raw[:, AMOUNT] < 0).any():
+            raise DecodeError("'Amount' must not be negative")
+
+        out = np.empty((len(raw), len(FEATURE_COLUMNS)), dtype=np.float64)
+        out[:, : len(RAW_COLUMNS)] = raw
+        np.log1p(raw[:, AMOUNT], out=out[:, LOG_AMOUNT])
+        # Same floor semantics as pandas: (Time // 3600) % 24
+        hour = out[:, HOUR]
+        np.floor_divide(raw[:, TIME], 3600.0, out=hour)
+        np.mod(hour, 24.0, out=hour)
+        np.less(hour, NIGHT_END_HOUR, out=out[:, IS_NIGHT])
+
+        out -= self.mean
+        out /= self.scale
+        return out.astype(np.float32)
+
+    def stats(self):
+        return {
+            "scaler": self.path if self.available else None,
+            "raw_columns": list(RAW_COLUMNS),
+            "feature_columns": list(FEATURE_COLUMNS),
+        }
@@ -0,0 +1,500 @@
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import numpy as np
+from inference import (
+    TF_SERVING_TIMEOUT,
+    InferenceError,
+    InferenceTimeout,
+    InvalidInputError,
+    NumpyBackend,
+)
+from telemetry import (
+    BREAKER_TRANSITIONS,
+    MODEL_ATTEMPT_SECONDS,
+    MODEL_ATTEMPTS,
+    MODEL_CALL_SECONDS,
+    MODEL_CALLS,
+    MODEL_FALLBACKS,
+)
+
+# -----------------------------
+# Tail-latency protection for TF Serving calls
+# -----------------------------
+# Every model call gets an overall deadline (TF_SERVING_TIMEOUT) split into
+# attempts with their own deadline. Once an attempt has been pending for the
+# HEDGE_QUANTILE of recent attempt latencies at that batch size, a
+# duplicate is sent and the first answer wins; batches above HEDGE_MAX_ROWS
+# (bulk chunks) are never hedged. Consecutive failed calls open a circuit
+# breaker, and a failed or short-circuited call can be answered by a local
+# fallback model (flagged as degraded) instead of an error.
+RESILIENCE = os.environ.get("RESILIENCE", "1") == "1"
+TF_SERVING_ATTEMPT_TIMEOUT = float(
+    os.environ.get("TF_SERVING_ATTEMPT_TIMEOUT", str(TF_SERVING_TIMEOUT))
+)
+HEDGE_MAX_ATTEMPTS = int(os.environ.get("HEDGE_MAX_ATTEMPTS", "2"))
+HEDGE_QUANTILE = float(os.environ.get("HEDGE_QUANTILE", "0.95"))
+HEDGE_MIN_DELAY_MS = float(os.environ.get("HEDGE_MIN_DELAY_MS", "20"))
+# Successful attempts needed before the quantile is trusted for hedging
+HEDGE_MIN_SAMPLES = int(os.environ.get("HEDGE_MIN_SAMPLES", "50"))
+# Recent successful attempts kept per batch-size bucket (powers of two)
+HEDGE_WINDOW = int(os.environ.get("HEDGE_WINDOW", "500"))
+HEDGE_MAX_ROWS = int(os.environ.get("HEDGE_MAX_ROWS", "256"))
+# Threads running attempts of the sync backend (losers run to completion)
+HEDGE_POOL_SIZE = int(os.environ.get("HEDGE_POOL_SIZE", "64"))
+BREAKER_FAILURES = int(os.environ.get("BREAKER_FAILURES", "5"))
+BREAKER_RESET_SECS = float(os.environ.get("BREAKER_RESET_SECS", "30"))
+# Logistic-regression baseline exported by model_training.py; serving it
+# is skipped when the file is missing or the variable is empty
+FALLBACK_MODEL_PATH = os.environ.get(
+    "FALLBACK_MODEL_PATH",
+    os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "baseline_model.npz"
+    ),
+)
+
+DEGRADED_HEADER = "X-Degraded"
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+BREAKER_STATES = (CLOSED, HALF_OPEN, OPEN)
+
+
+class DegradedScores(np.ndarray):
+    """
+    Probabilities from the fallback model.
+
+    A marker subclass, so the flag survives micro-batch slicing; callers
+    unwrap it with ``split_degraded``.
+    """
+
+
+def split_degraded(probs):
+    """``(plain probabilities, degraded flag)`` of a backend result."""
+    if isinstance(probs, DegradedScores):
+        return probs.view(np.ndarray), True
+    return probs, False
+
+
+def load_fallback(path=FALLBACK_MODEL_PATH):
+    """NumPy backend for the fallback model, or ``None`` if not exported."""
+    if not path or not os.path.exists(path):
+        return None
+    return NumpyBackend(path)
+
+
+class LatencyWindow:
+    """
+    Latencies of the last ``size`` successful attempts per batch-size
+    bucket, so the hedge delay follows recent behaviour and a small
+    request is not compared with bulk chunks. Bucket ``b`` holds batches
+    of ``2**(b-1)`` to ``2**b - 1`` rows. Per process.
+    """
+
+    def __init__(self, size=HEDGE_WINDOW):
+        self.size = size
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def bucket(rows):
+        return max(int(rows), 1).bit_length()
+
+    def observe(self, rows, seconds):
+        bucket = self.bucket(rows)
+        with self._lock:
+            if bucket not in self._buckets:
+                self._buckets[bucket] = deque(maxlen=self.size)
+            self._buckets[bucket].append(seconds)
+
+    def quantile(self, rows, q, min_samples):
+        """``q`` quantile for a batch of ``rows``, or ``None`` if too few."""
+        with self._lock:
+            samples = list(self._buckets.get(self.bucket(rows), ()))
+        if not samples or len(samples) < min_samples:
+            return None
+        return float(np.quantile(samples, q))
+
+    def rows(self):
+        """Largest batch size of each bucket seen so far."""
+        with self._lock:
+            return sorted(2**bucket - 1 for bucket in self._buckets)
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker.
+
+    After ``failures`` failed calls in a row the circuit opens and calls
+    are short-circuited for ``reset_seconds``; then a single probe call is
+    let through (half-open), which closes the circuit on success and
+    re-opens it on failure.
+    """
+
+    def __init__(
+        self, failures=BREAKER_FAILURES, reset_seconds=BREAKER_RESET_SECS
+    ):
+        self.failures = failures
+        self.reset_seconds = reset_seconds
+        self.state = CLOSED
+        self._consecutive = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Whether a call may go to the primary backend."""
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN:
+                if time.monotonic() - self._opened_at < self.reset_seconds:
+                    return False
+                self._transition(HALF_OPEN)
+            if self._probing:
+                return False
+            self._probing = True
+            return True
+
+    def success(self):
+        with self._lock:
+            self._consecutive = 0
+            self._probing = False
+            if self.state != CLOSED:
+                self._transition(CLOSED)
+
+    def release(self):
+        """
+        End a call that says nothing about backend health (a rejected
+        request): frees a half-open probe slot without closing the circuit.
+        """
+        with self._lock:
+            self._probing = False
+
+    def failure(self):
+        with self._lock:
+            self._consecutive += 1
+            self._probing = False
+            if self.state == HALF_OPEN or (
+                self.state == CLOSED and self._consecutive >= self.failures
+            ):
+                self._opened_at = time.monotonic()
+                self._transition(OPEN)
+
+    def retry_in(self):
+        """Seconds until an open circuit lets a probe through."""
+        with self._lock:
+            if self.state != OPEN:
+                return 0.0
+            elapsed = time.monotonic() - self._opened_at
+            return max(0.0, self.reset_seconds - elapsed)
+
+    def _transition(self, state):
+        self.state = state
+        BREAKER_TRANSITIONS.inc(labels=(state,))
+
+
+class _Resilience:
+    """Policy shared by the sync and asyncio wrappers."""
+
+    name = "remote"
+
+    def __init__(
+        self,
+        primary,
+        fallback=None,
+        deadline=TF_SERVING_TIMEOUT,
+        attempt_timeout=TF_SERVING_ATTEMPT_TIMEOUT,
+        max_attempts=HEDGE_MAX_ATTEMPTS,
+        hedge_quantile=HEDGE_QUANTILE,
+        hedge_min_delay_ms=HEDGE_MIN_DELAY_MS,
+        hedge_min_samples=HEDGE_MIN_SAMPLES,
+        hedge_max_rows=HEDGE_MAX_ROWS,
+        breaker=None,
+    ):
+        self.primary = primary
+        self.fallback = fallback
+        self.deadline = deadline
+        self.attempt_timeout = min(attempt_timeout, deadline)
+        self.max_attempts = max(1, max_attempts)
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_delay = hedge_min_delay_ms / 1000.0
+        self.hedge_min_samples = hedge_min_samples
+        self.hedge_max_rows = hedge_max_rows
+        self.latencies = LatencyWindow()
+        self.breaker = breaker or CircuitBreaker()
+
+    def model_version(self):
+        return self.primary.model_version()
+
+    def hedge_delay(self, rows):
+        """
+        Seconds before a duplicate attempt of a ``rows`` batch is sent: the
+        ``hedge_quantile`` of recent successful attempts of similar size.
+        ``None`` (no hedging) above ``hedge_max_rows`` or until that size
+        bucket has ``hedge_min_samples`` attempts.
+        """
+        if self.max_attempts < 2 or rows > self.hedge_max_rows:
+            return None
+        delay = self.latencies.quantile(
+            rows, self.hedge_quantile, self.hedge_min_samples
+        )
+        if delay is None:
+            return None
+        return max(self.hedge_min_delay, delay)
+
+    def _short_circuit(self, data):
+        error = InferenceError(
+            "TF Serving circuit open, retrying in "
+            f"{self.breaker.retry_in():.1f}s"
+        )
+        return self._degrade(data, "short_circuit", error)
+
+    def _degrade(self, data, result, error):
+        """Answer from the fallback model, or re-raise ``error``."""
+        MODEL_CALLS.inc(labels=(result,))
+        if self.fallback is None:
+            raise error
+        MODEL_FALLBACKS.inc(labels=(result,))
+        return self.fallback.predict(data).view(DegradedScores)
+
+    def _won(self, kind, start):
+        self.breaker.success()
+        MODEL_CALLS.inc(labels=(kind,))
+        MODEL_CALL_SECONDS.observe(time.monotonic() - start, (kind,))
+
+    def _failed(self, data, start, error):
+        """All attempts failed or the deadline passed."""
+        self.breaker.failure()
+        MODEL_CALL_SECONDS.observe(time.monotonic() - start, ("failed",))
+        if error is None:
+            error = InferenceError(
+                f"TF Serving deadline of {self.deadline}s exceeded"
+            )
+        return self._degrade(data, "failed", error)
+
+    def _next_attempt(self, launched, pending, hedge_at):
+        """Kind of attempt to launch now, or ``None``."""
+        if launched >= self.max_attempts:
+            return None
+        if not pending:
+            return "retry"
+        if hedge_at is not None and time.monotonic() >= hedge_at:
+            return "hedge"
+        return None
+
+    def _observe_attempt(self, data, started, error):
+        elapsed = time.monotonic() - started
+        if error is None:
+            outcome = "ok"
+            self.latencies.observe(len(data), elapsed)
+        elif isinstance(error, InvalidInputError):
+            outcome = "invalid"
+        elif isinstance(error, InferenceTimeout):
+            outcome = "timeout"
+        else:
+            outcome = "error"
+        MODEL_ATTEMPT_SECONDS.observe(elapsed, (outcome,))
+
+    def register_metrics(self, registry):
+        registry.callback(
+            "fraud_circuit_state",
+            "gauge",
+            "TF Serving circuit breaker state (1 for the current state).",
+            lambda: {
+                (state,): int(state == self.breaker.state)
+                for state in BREAKER_STATES
+            },
+            labelnames=("state",),
+            aggregate="max",
+        )
+
+    def stats(self):
+        delays = {}
+        for rows in self.latencies.rows():
+            delay = self.hedge_delay(rows)
+            if delay is not None:
+                delays[rows] = 1000.0 * delay
+        return {
+            "deadline_seconds": self.deadline,
+            "attempt_timeout_seconds": self.attempt_timeout,
+            "max_attempts": self.max_attempts,
+            "hedge_quantile": self.hedge_quantile,
+            "hedge_max_rows": self.hedge_max_rows,
+            # Keyed by the largest batch size of each bucket
+            "hedge_delay_ms": delays,
+            "breaker": {
+                "state": self.breaker.state,
+                "failures": self.breaker.failures,
+                "reset_seconds": self.breaker.reset_seconds,
+                "retry_in_seconds": self.breaker.retry_in(),
+            },
+            "fallback": (
+                None if self.fallback is None else self.fallback.model_path
+            ),
+        }
+
+
+class ResilientBackend(_Resilience):
+    """
+    Deadlines, hedging, circuit breaker and fallback around
+    ``RemoteBackend``.
+
+    Attempts run on a thread pool. An abandoned attempt (deadline passed
+    or a hedge answered first) is not interrupted: it runs until its own
+    ``attempt_timeout`` and still has its latency recorded, so the hedge
+    quantile is not biased towards fast answers.
+    """
+
+    def __init__(
+        self, primary, fallback=None, pool_size=HEDGE_POOL_SIZE, **kwargs
+    ):
+        super().__init__(primary, fallback, **kwargs)
+        self._pool = ThreadPoolExecutor(
+            max_workers=pool_size, thread_name_prefix="model-attempt"
+        )
+
+    def predict(self, data):
+        if not self.breaker.allow():
+            return self._short_circuit(data)
+
+        start = time.monotonic()
+        deadline = start + self.deadline
+        delay = self.hedge_delay(len(data))
+        pending = {}  # future -> attempt kind
+        error = None
+
+        def launch(kind):
+            MODEL_ATTEMPTS.inc(labels=(kind,))
+            timeout = min(self.attempt_timeout, deadline - time.monotonic())
+            pending[self._pool.submit(self._attempt, data, timeout)] = kind
+            return None if delay is None else time.monotonic() + delay
+
+        hedge_at = launch("first")
+        launched = 1
+        while pending:
+            wake = deadline
+            if hedge_at is not None and launched < self.max_attempts:
+                wake = min(wake, hedge_at)
+            done, _ = wait(
+                pending,
+                timeout=max(0.0, wake - time.monotonic()),
+                return_when=FIRST_COMPLETED,
+            )
+            for future in done:
+                kind = pending.pop(future)
+                e = future.exception()
+                if e is None:
+                    self._won(kind, start)
+                    return future.result()
+                if isinstance(e, InvalidInputError):
+                    # The request is at fault, not TF Serving
+                    self.breaker.release()
+                    MODEL_CALLS.inc(labels=("invalid",))
+                    raise e
+                error = e
+
+            if time.monotonic() >= deadline:
+                break
+            kind = self._next_attempt(launched, pending, hedge_at)
+            if kind is not None:
+                hedge_at = launch(kind)
+                launched += 1
+
+        return self._failed(data, start, error)
+
+    def _attempt(self, data, timeout):
+        started = time.monotonic()
+        try:
+            probs = self.primary.predict(data, timeout=timeout)
+        except Exception as e:
+            self._observe_attempt(data, started, e)
+            raise
+        self._observe_attempt(data, started, None)
+        return probs
+
+
+class AsyncResilientBackend(_Resilience):
+    """
+    asyncio counterpart of ``ResilientBackend`` around
+    ``AsyncRemoteBackend``. Losing attempts are cancelled, which closes
+    their connection.
+    """
+
+    async def start(self):
+        await self.primary.start()
+
+    async def close(self):
+        await self.primary.close()
+
+    async def predict(self, data):
+        if not self.breaker.allow():
+            return self._short_circuit(data)
+
+        loop = asyncio.get_running_loop()
+        start = time.monotonic()
+        deadline = start + self.deadline
+        delay = self.hedge_delay(len(data))
+        pending = {}  # task -> attempt kind
+        error = None
+
+        def launch(kind):
+            MODEL_ATTEMPTS.inc(labels=(kind,))
+            timeout = min(self.attempt_timeout, deadline - time.monotonic())
+            pending[loop.create_task(self._attempt(data, timeout))] = kind
+            return None if delay is None else time.monotonic() + delay
+
+        try:
+            hedge_at = launch("first")
+            launched = 1
+            while pending:
+                wake = deadline
+                if hedge_at is not None and launched < self.max_attempts:
+                    wake = min(wake, hedge_at)
+                done, _ = await asyncio.wait(
+                    pending,
+                    timeout=max(0.0, wake - time.monotonic()),
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                for task in done:
+                    kind = pending.pop(task)
+                    e = task.exception()
+                    if e is None:
+                        self._won(kind, start)
+                        return task.result()
+                    if isinstance(e, InvalidInputError):
+                        self.breaker.release()
+                        MODEL_CALLS.inc(labels=("invalid",))
+                        raise e
+                    error = e
+
+                if time.monotonic() >= deadline:
+                    break
+                kind = self._next_attempt(launched, pending, hedge_at)
+                if kind is not None:
+                    hedge_at = launch(kind)
+                    launched += 1
+        finally:
+            for task in pending:
+                task.cancel()
+
+        # The fallback is a small NumPy model, cheap enough for the loop
+        return self._failed(data, start, error)
+
+    async def _attempt(self, data, timeout):
+        started = time.monotonic()
+        try:
+            probs = await self.primary.predict(data, timeout=timeout)
+        except asyncio.CancelledError:
+            MODEL_ATTEMPT_SECONDS.observe(
+                time.monotonic() - started, ("cancelled",)
+            )
+            raise
+        except Exception as e:
+            self._observe_attempt(data, started, e)
+            raise
+        self._observe_attempt(data, started, None)
+        return probs
@@ -0,0 +1,422 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import traceback
+from datetime import datetime, timedelta
+
+import numpy as np
+from feedback import FEEDBACK_WINDOW_DAYS
+from running_metrics import confusion_metrics
+from storage import INCREMENTAL_VACUUM, connect
+from telemetry import LATENCY_BUCKETS, bucket_quantile, span
+
+# -----------------------------
+# Rollup / retention configuration
+# -----------------------------
+ROLLUP_INTERVAL_SECS = float(os.environ.get("ROLLUP_INTERVAL_SECS", "300"))
+ROLLUP_CHUNK_ROWS = int(os.environ.get("ROLLUP_CHUNK_ROWS", "50000"))
+# /feedback joins labels on raw logs rows: they are kept for at least the
+# label delay (FEEDBACK_WINDOW_DAYS), 0 keeps them forever
+LOG_RETENTION_DAYS = float(
+    os.environ.get("LOG_RETENTION_DAYS", str(FEEDBACK_WINDOW_DAYS))
+)
+HOURLY_RETENTION_DAYS = float(os.environ.get("HOURLY_RETENTION_DAYS", "90"))
+BATCH_METRICS_RETENTION_DAYS = float(
+    os.environ.get("BATCH_METRICS_RETENTION_DAYS", "7")
+)
+ALERT_RETENTION_DAYS = float(os.environ.get("ALERT_RETENTION_DAYS", "90"))
+VACUUM_PAGES = int(os.environ.get("VACUUM_PAGES", "2000"))
+
+PROBABILITY_BINS = 20
+DELETE_BATCH_ROWS = 10000
+
+GRANULARITIES = {"hourly": "logs_hourly", "daily": "logs_daily"}
+
+SELECT_NEW_LOGS_SQL = """
+SELECT
+    id, substr(timestamp, 1, 13), latency, prediction = 1,
+    probability, true_class, degraded
+FROM logs
+WHERE id > ?
+ORDER BY id
+LIMIT ?
+"""
+
+UPSERT_ROLLUP_SQL = """
+INSERT OR REPLACE INTO {table} (
+    bucket, num_predictions, num_fraud, num_labelled, tp, fp, tn, fn,
+    latency_sum, labelled_latency_sum, latency_max, probability_sum,
+    latency_sketch, probability_hist
+) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+# Integer columns that merge by addition, in table order
+_COUNTS = (
+    "num_predictions",
+    "num_fraud",
+    "num_labelled",
+    "tp",
+    "fp",
+    "tn",
+    "fn",
+)
+
+
+def _aggregate(rows):
+    """
+    Aggregate ``SELECT_NEW_LOGS_SQL`` rows per hour.
+
+    Returns ``{hour: {column: value}}`` with latency and probability
+    bucket counts as integer arrays. Degraded (fallback-model) rows count
+    as predictions but not towards the labelled confusion columns.
+    """
+    _, hours, latency, fraud, prob, true_class, degraded = zip(*rows)
+    hour_keys, group = np.unique(
+        np.array([h or "" for h in hours]), return_inverse=True
+    )
+    n_groups = len(hour_keys)
+
+    latency = np.array(latency, dtype=np.float64)
+    latency = np.nan_to_num(latency)
+    fraud = np.array(fraud, dtype=bool)
+    prob = np.nan_to_num(np.array(prob, dtype=np.float64))
+    labelled = np.array([tc is not None for tc in true_class])
+    labelled &= ~np.array(degraded, dtype=bool)
+    positive = np.array([tc == 1 for tc in true_class])
+
+    def total(weights):
+        return np.bincount(group, weights=weights, minlength=n_groups)
+
+    columns = {
+        "num_predictions": np.bincount(group, minlength=n_groups),
+        "num_fraud": total(fraud),
+        "num_labelled": total(labelled),
+        "tp": total(labelled & positive & fraud),
+        "fp": total(labelled & ~positive & fraud),
+        "tn": total(labelled & ~positive & ~fraud),
+        "fn": total(labelled & positive & ~fraud),
+        "latency_sum": total(latency),
+        "labelled_latency_sum": total(np.where(labelled, latency, 0.0)),
+        "probability_sum": total(prob),
+    }
+    latency_max = np.zeros(n_groups)
+    np.maximum.at(latency_max, group, latency)
+
+    n_lat = len(LATENCY_BUCKETS) + 1
+    lat_idx = np.searchsorted(LATENCY_BUCKETS, latency, side="left")
+    latency_sketch = np.bincount(
+        group * n_lat + lat_idx, minlength=n_groups * n_lat
+    ).reshape(n_groups, n_lat)
+
+    prob_idx = np.clip(
+        (prob * PROBABILITY_BINS).astype(np.int64), 0, PROBABILITY_BINS - 1
+    )
+    probability_hist = np.bincount(
+        group * PROBABILITY_BINS + prob_idx,
+        minlength=n_groups * PROBABILITY_BINS,
+    ).reshape(n_groups, PROBABILITY_BINS)
+
+    result = {}
+    for i, hour in enumerate(hour_keys.tolist()):
+        bucket = {
+            name: int(values[i]) if name in _COUNTS else float(values[i])
+            for name, values in columns.items()
+        }
+        bucket["latency_max"] = float(latency_max[i])
+        bucket["latency_sketch"] = latency_sketch[i]
+        bucket["probability_hist"] = probability_hist[i]
+        result[hour] = bucket
+    return result
+
+
+def _merge(conn, table, buckets):
+    """Add aggregated ``buckets`` into existing ``table`` rows."""
+    cursor = conn.cursor()
+    cursor.row_factory = sqlite3.Row
+    for key, new in buckets.items():
+        old = cursor.execute(
+            f"SELECT * FROM {table} WHERE bucket = ?", (key,)
+        ).fetchone()
+        if old is not None:
+            merged = {
+                name: old[name] + new[name]
+                for name in _COUNTS
+                + ("latency_sum", "labelled_latency_sum", "probability_sum")
+            }
+            merged["latency_max"] = max(old["latency_max"], new["latency_max"])
+            merged["latency_sketch"] = new["latency_sketch"] + np.array(
+                json.loads(old["latency_sketch"])
+            )
+            merged["probability_hist"] = new["probability_hist"] + np.array(
+                json.loads(old["probability_hist"])
+            )
+            new = merged
+
+        conn.execute(
+            UPSERT_ROLLUP_SQL.format(table=table),
+            (
+                key,
+                *(new[name] for name in _COUNTS),
+                new["latency_sum"],
+                new["labelled_latency_sum"],
+                new["latency_max"],
+                new["probability_sum"],
+                json.dumps(new["latency_sketch"].tolist()),
+                json.dumps(new["probability_hist"].tolist()),
+            ),
+        )
+
+
+def _by_day(hourly):
+    daily = {}
+    for hour, bucket in hourly.items():
+        day = daily.get(hour[:10])
+        if day is None:
+            daily[hour[:10]] = dict(bucket)
+            continue
+        for name in _COUNTS + (
+            "latency_sum",
+            "labelled_latency_sum",
+            "probability_sum",
+            "latency_sketch",
+            "probability_hist",
+        ):
+            day[name] = day[name] + bucket[name]
+        day["latency_max"] = max(day["latency_max"], bucket["latency_max"])
+    return daily
+
+
+def check_retention(
+    log_days=LOG_RETENTION_DAYS, feedback_days=FEEDBACK_WINDOW_DAYS
+):
+    """Refuse a raw-log retention that would delete rows still awaiting
+    their label (``/feedback`` would report them as not found)."""
+    if 0 < log_days < feedback_days:
+        raise ValueError(
+            f"LOG_RETENTION_DAYS={log_days:g} is shorter than "
+            f"FEEDBACK_WINDOW_DAYS={feedback_days:g}: late labels would "
+            "find no logged prediction"
+        )
+
+
+def rollup_metrics(row):
+    """Derived metrics for one rollup row (labelled metrics as in logs)."""
+    sketch = json.loads(row["latency_sketch"])
+    n = row["num_predictions"]
+    return {
+        "bucket": row["bucket"],
+        "num_predictions": n,
+        "fraud_rate": row["num_fraud"] / n if n else 0.0,
+        "avg_probability": row["probability_sum"] / n if n else 0.0,
+        **confusion_metrics(
+            row["tp"],
+            row["fp"],
+            row["tn"],
+            row["fn"],
+            row["labelled_latency_sum"],
+        ),
+        "avg_latency": row["latency_sum"] / n if n else 0.0,
+        "latency_p50": bucket_quantile(LATENCY_BUCKETS, sketch, 0.5),
+        "latency_p95": bucket_quantile(LATENCY_BUCKETS, sketch, 0.95),
+        "latency_p99": bucket_quantile(LATENCY_BUCKETS, sketch, 0.99),
+        "latency_max": row["latency_max"],
+        "probability_hist": json.loads(row["probability_hist"]),
+    }
+
+
+def read_rollups(conn, granularity="hourly", limit=48):
+    """Most recent ``limit`` rollup rows with derived metrics, oldest first."""
+    table = GRANULARITIES[granularity]
+    cursor = conn.cursor()
+    cursor.row_factory = sqlite3.Row
+    rows = cursor.execute(
+        f"SELECT * FROM {table} ORDER BY bucket DESC LIMIT ?", (limit,)
+    ).fetchall()
+    return [rollup_metrics(row) for row in reversed(rows)]
+
+
+class RollupCompactor:
+    """
+    Background job that keeps monitoring.db bounded.
+
+    Every ``interval`` seconds it folds new ``logs`` rows (by id, past the
+    ``rollup_state`` watermark) into ``logs_hourly`` and ``logs_daily``
+    in the same transaction that advances the watermark, so a row is
+    never counted twice. It then deletes rolled-up raw rows older than
+    the retention windows in small batches, ages out ``batch_metrics``,
+    ``alerts``/``actions`` and hourly rollups, and returns freed pages
+    with ``PRAGMA incremental_vacuum``. Daily rollups are kept forever.
+
+    A database still in full auto-vacuum mode is not converted here: the
+    full ``VACUUM`` would lock out the log writer while serving (see
+    ``storage.SQLITE_VACUUM_ON_START``).
+    """
+
+    def __init__(self, db_path, interval=ROLLUP_INTERVAL_SECS):
+        check_retention()
+        self.db_path = db_path
+        self.interval = interval
+
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+        self._passes = 0
+        self._rows_rolled = 0
+        self._rows_deleted = 0
+        self._last_pass_seconds = 0.0
+
+    def start(self):
+        if self.interval <= 0 or self._thread is not None:
+            return
+        self._thread = threading.Thread(
+            target=self._run, name="rollup-compactor", daemon=True
+        )
+        self._thread.start()
+
+    def close(self, timeout=10.0):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join(timeout=timeout)
+        self._thread = None
+
+    def _run(self):
+        conn = connect(self.db_path)
+        try:
+            while not self._stop.wait(self.interval):
+                try:
+                    self.run_once(conn)
+                except sqlite3.Error:
+                    traceback.print_exc()
+        finally:
+            conn.close()
+
+    def run_once(self, conn=None):
+        """One rollup + retention + vacuum pass; returns rows rolled up."""
+        own = conn is None
+        if own:
+            conn = connect(self.db_path)
+        start = time.perf_counter()
+        try:
+            with span("rollup"):
+                rolled = self._rollup(conn)
+                deleted = self._retain(conn)
+                self._vacuum(conn)
+        finally:
+            if own:
+                conn.close()
+
+        with self._lock:
+            self._passes += 1
+            self._rows_rolled += rolled
+            self._rows_deleted += deleted
+            self._last_pass_seconds = time.perf_counter() - start
+        return rolled
+
+    def _rollup(self, conn):
+        rolled = 0
+        while True:
+            # IMMEDIATE: several workers may run a compactor; the
+            # watermark read and the rollup writes must not interleave
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                watermark = conn.execute(
+                    "SELECT last_log_id FROM rollup_state WHERE id = 1"
+                ).fetchone()[0]
+                rows = conn.execute(
+                    SELECT_NEW_LOGS_SQL, (watermark, ROLLUP_CHUNK_ROWS)
+                ).fetchall()
+                if rows:
+                    hourly = _aggregate(rows)
+                    _merge(conn, "logs_hourly", hourly)
+                    _merge(conn, "logs_daily", _by_day(hourly))
+                    conn.execute(
+                        "UPDATE rollup_state SET last_log_id = ? WHERE id = 1",
+                        (rows[-1][0],),
+                    )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            rolled += len(rows)
+            if len(rows) < ROLLUP_CHUNK_ROWS:
+                return rolled
+
+    def _retain(self, conn):
+        now = datetime.utcnow()
+        deleted = 0
+
+        # Raw logs: only rows already folded into the rollups
+        if LOG_RETENTION_DAYS > 0:
+            cutoff = (now - timedelta(days=LOG_RETENTION_DAYS)).isoformat()
+            deleted += self._delete(
+                conn,
+                """
+                DELETE FROM logs WHERE id IN (
+                    SELECT id FROM logs
+                    WHERE timestamp < ?
+                      AND id <= (SELECT last_log_id FROM rollup_state)
+                    LIMIT ?
+                )
+                """,
+                cutoff,
+            )
+
+        # batch_metrics / alerts / actions use CURRENT_TIMESTAMP (UTC)
+        for table, days in (
+            ("batch_metrics", BATCH_METRICS_RETENTION_DAYS),
+            ("alerts", ALERT_RETENTION_DAYS),
+            ("actions", ALERT_RETENTION_DAYS),
+        ):
+            if days > 0:
+                cutoff = (now - timedelta(days=days)).strftime(
+                    "%Y-%m-%d %H:%M:%S"
+                )
+                deleted += self._delete(
+                    conn,
+                    f"""
+                    DELETE FROM {table} WHERE id IN (
+                        SELECT id FROM {table} WHERE timestamp < ? LIMIT ?
+                    )
+                    """,
+                    cutoff,
+                )
+
+        if HOURLY_RETENTION_DAYS > 0:
+            cutoff = (now - timedelta(days=HOURLY_RETENTION_DAYS)).isoformat()
+            with conn:
+                conn.execute(
+                    "DELETE FROM logs_hourly WHERE bucket < ?", (cutoff[:13],)
+                )
+        return deleted
+
+    def _delete(self, conn, sql, cutoff):
+        # Short transactions so the log writer is never locked out for long
+        deleted = 0
+        while True:
+            with conn:
+                count = conn.execute(sql, (cutoff, DELETE_BATCH_ROWS)).rowcount
+            deleted += count
+            if count < DELETE_BATCH_ROWS:
+                return deleted
+
+    def _vacuum(self, conn):
+        mode = conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+        if mode == INCREMENTAL_VACUUM:
+            conn.execute(
+                f"PRAGMA incremental_vacuum({VACUUM_PAGES})"
+            ).fetchall()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "interval_secs": self.interval,
+                "log_retention_days": LOG_RETENTION_DAYS,
+                "passes": self._passes,
+                "rows_rolled": self._rows_rolled,
+                "rows_deleted": self._rows_deleted,
+                "last_pass_seconds": self._last_pass_seconds,
+            }
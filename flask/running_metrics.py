@@ -0,0 +1,167 @@
+import numpy as np
+from shared import SharedSlot, shared_array, shared_lock
+
+# Single-row table holding the running confusion counts, updated in the
+# same transaction as the labelled rows written to logs.
+CREATE_METRIC_STATE_SQL = """
+CREATE TABLE IF NOT EXISTS metric_state (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    tp INTEGER NOT NULL DEFAULT 0,
+    fp INTEGER NOT NULL DEFAULT 0,
+    tn INTEGER NOT NULL DEFAULT 0,
+    fn INTEGER NOT NULL DEFAULT 0,
+    latency_sum REAL NOT NULL DEFAULT 0
+)
+"""
+
+UPDATE_METRIC_STATE_SQL = """
+UPDATE metric_state
+SET tp = tp + ?, fp = fp + ?, tn = tn + ?, fn = fn + ?,
+    latency_sum = latency_sum + ?
+WHERE id = 1
+"""
+
+# Raw logs may have been compacted away (rollup.py): rows up to the
+# rollup watermark are counted from logs_daily, newer ones from logs.
+REBUILD_METRIC_STATE_SQL = """
+SELECT
+    COALESCE(SUM(tp), 0),
+    COALESCE(SUM(fp), 0),
+    COALESCE(SUM(tn), 0),
+    COALESCE(SUM(fn), 0),
+    COALESCE(SUM(latency_sum), 0.0)
+FROM (
+    SELECT tp, fp, tn, fn, labelled_latency_sum AS latency_sum
+    FROM logs_daily
+    UNION ALL
+    SELECT
+        true_class = 1 AND prediction = 1,
+        true_class != 1 AND prediction = 1,
+        true_class != 1 AND prediction != 1,
+        true_class = 1 AND prediction != 1,
+        latency
+    FROM logs
+    WHERE true_class IS NOT NULL AND NOT degraded
+      AND id > (SELECT COALESCE(MAX(last_log_id), 0) FROM rollup_state)
+)
+"""
+
+LABELLED_COUNT_SQL = """
+SELECT
+    (SELECT COALESCE(SUM(num_labelled), 0) FROM logs_daily)
+  + (SELECT COUNT(*) FROM logs
+     WHERE true_class IS NOT NULL AND NOT degraded
+       AND id > (SELECT COALESCE(MAX(last_log_id), 0) FROM rollup_state))
+"""
+
+
+class ConfusionAccumulator:
+    """
+    Running TP/FP/TN/FN counts and latency sum over all labelled logs.
+
+    Replaces re-reading the whole ``logs`` table on every request: each
+    update costs O(batch) and the derived metrics match sklearn's
+    accuracy/precision/recall/F1 (0.0 when a ratio is undefined).
+    Counts live in shared memory, so workers forked after construction
+    (see shared.py) add to the same totals.
+    """
+
+    tp = SharedSlot("_state", 0, int)
+    fp = SharedSlot("_state", 1, int)
+    tn = SharedSlot("_state", 2, int)
+    fn = SharedSlot("_state", 3, int)
+    latency_sum = SharedSlot("_state", 4)
+
+    def __init__(self):
+        # tp, fp, tn, fn, latency_sum (float64 counts are exact to 2**53)
+        self._state = shared_array(5)
+        self._lock = shared_lock()
+
+    @property
+    def count(self):
+        return self.tp + self.fp + self.tn + self.fn
+
+    def restore(self, cursor):
+        """
+        Load the persisted counts, rebuilding them from ``logs`` (and the
+        daily rollups of compacted rows) when the state row is missing or
+        out of sync with the labelled rows.
+        """
+        cursor.execute(CREATE_METRIC_STATE_SQL)
+        state = cursor.execute(
+            "SELECT tp, fp, tn, fn, latency_sum FROM metric_state WHERE id = 1"
+        ).fetchone()
+        labelled = cursor.execute(LABELLED_COUNT_SQL).fetchone()[0]
+
+        if state is None or sum(state[:4]) != labelled:
+            state = cursor.execute(REBUILD_METRIC_STATE_SQL).fetchone()
+            cursor.execute(
+                """
+                INSERT OR REPLACE INTO metric_state (
+                    id, tp, fp, tn, fn, latency_sum
+                ) VALUES (1, ?, ?, ?, ?, ?)
+                """,
+                state,
+            )
+
+        with self._lock:
+            self._state[:] = state
+
+    def update(self, y_true, y_pred, latency):
+        """
+        Add a labelled batch.
+
+        ``latency`` is the per-row latency (scalar or array). Returns the
+        metrics snapshot after the update and the parameters for
+        ``UPDATE_METRIC_STATE_SQL``, which must be written in the same
+        transaction as the corresponding ``logs`` rows.
+        """
+        y_true = np.asarray(y_true) == 1
+        y_pred = np.asarray(y_pred) == 1
+        latency = np.broadcast_to(
+            np.asarray(latency, dtype=float), y_true.shape
+        )
+
+        tp = int(np.count_nonzero(y_true & y_pred))
+        fp = int(np.count_nonzero(~y_true & y_pred))
+        fn = int(np.count_nonzero(y_true & ~y_pred))
+        tn = len(y_true) - tp - fp - fn
+        latency_sum = float(latency.sum())
+
+        with self._lock:
+            self._state += (tp, fp, tn, fn, latency_sum)
+            snapshot = self._metrics()
+
+        return snapshot, (tp, fp, tn, fn, latency_sum)
+
+    def add(self, delta):
+        """
+        Apply a ``(tp, fp, tn, fn, latency_sum)`` delta, e.g. labels that
+        arrived after the prediction (entries may be negative for
+        relabelled rows). Returns the metrics snapshot after the update.
+        """
+        with self._lock:
+            self._state += delta
+            return self._metrics()
+
+    def metrics(self):
+        with self._lock:
+            return self._metrics()
+
+    def _metrics(self):
+        return confusion_metrics(
+            self.tp, self.fp, self.tn, self.fn, self.latency_sum
+        )
+
+
+def confusion_metrics(tp, fp, tn, fn, latency_sum):
+    """Accuracy/precision/recall/F1 and mean latency from (weighted) counts."""
+    n = tp + fp + tn + fn
+    return {
+        "num_labelled": n,
+        "accuracy": (tp + tn) / n if n else 0.0,
+        "precision": tp / (tp + fp) if tp + fp else 0.0,
+        "recall": tp / (tp + fn) if tp + fn else 0.0,
+        "f1_score": 2 * tp / (2 * tp + fp + fn) if tp else 0.0,
+        "avg_latency": latency_sum / n if n else 0.0,
+    }
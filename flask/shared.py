@@ -0,0 +1,206 @@
+import atexit
+import ctypes
+import fcntl
+import multiprocessing
+import os
+import tempfile
+import threading
+
+import numpy as np
+
+# -----------------------------
+# State shared by gunicorn workers
+# -----------------------------
+# Objects created here at import time live in anonymous shared memory.
+# With gunicorn's preload_app (see gunicorn.conf.py) the app is imported
+# once in the master and every forked worker inherits the same pages, so
+# counters, confusion counts, metric windows and drift histograms are
+# common to all workers. Without a fork they behave as process-local
+# state, which is why gunicorn.conf.py runs a single worker when it does
+# not preload. The TensorBoard step counter is file-backed instead, so
+# its steps stay unique even across processes that were not forked.
+
+_worker_hooks = []
+_started_pid = None
+_hooks_lock = threading.Lock()
+
+
+def shared_array(length, dtype=np.float64):
+    """Zeroed NumPy array backed by fork-inherited shared memory."""
+    dtype = np.dtype(dtype)
+    buffer = multiprocessing.RawArray(ctypes.c_byte, length * dtype.itemsize)
+    return np.frombuffer(buffer, dtype=dtype, count=length)
+
+
+class SharedLock:
+    """
+    Lock held across threads and forked workers alike.
+
+    A thread lock serializes the threads of one process and an exclusive
+    ``flock`` on a temporary file serializes the processes. Unlike a
+    semaphore in shared memory, the ``flock`` is dropped by the kernel
+    when its holder dies, so a worker that gunicorn SIGKILLs on timeout
+    cannot leave every other worker waiting on it. Each process opens
+    its own descriptor after the fork (a lock taken through an inherited
+    descriptor would be shared with the parent).
+
+    With a ``path``, processes that open the same file share the lock
+    whether or not they were forked from one another.
+    """
+
+    def __init__(self, path=None):
+        if path is None:
+            fd, path = tempfile.mkstemp(prefix="fraud-lock-")
+            os.close(fd)
+            atexit.register(self._remove)
+        else:
+            os.close(os.open(path, os.O_RDWR | os.O_CREAT, 0o644))
+        self.path = path
+        self._created_pid = os.getpid()
+        self._pid = None
+        self._fd = None
+        self._thread_lock = None
+        self._reset()
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        # A thread lock inherited from the parent may be held by a thread
+        # that does not exist in the child
+        self._thread_lock = threading.Lock()
+        self._fd = None
+        self._pid = os.getpid()
+
+    def acquire(self):
+        self._thread_lock.acquire()
+        try:
+            if self._fd is None:
+                self._fd = os.open(self.path, os.O_RDWR)
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+        except BaseException:
+            self._thread_lock.release()
+            raise
+
+    def release(self):
+        fcntl.flock(self._fd, fcntl.LOCK_UN)
+        self._thread_lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+    def _remove(self):
+        if os.getpid() == self._created_pid:
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+
+
+def shared_lock():
+    """Lock held across threads and forked workers alike."""
+    return SharedLock()
+
+
+class SharedSlot:
+    """
+    Scalar attribute stored in a shared float64 array.
+
+    ``owner._<array>`` holds the values; ``None`` is stored as NaN and
+    ``kind`` converts on read (e.g. ``int`` for sequence numbers).
+    """
+
+    def __init__(self, array, index, kind=float):
+        self.array = array
+        self.index = index
+        self.kind = kind
+
+    def __get__(self, owner, cls=None):
+        if owner is None:
+            return self
+        value = getattr(owner, self.array)[self.index]
+        if np.isnan(value):
+            return None
+        return self.kind(value)
+
+    def __set__(self, owner, value):
+        getattr(owner, self.array)[self.index] = (
+            np.nan if value is None else value
+        )
+
+
+class StepCounter:
+    """
+    Monotonic counter shared by every process using ``path`` (TensorBoard
+    steps).
+
+    The value is stored in the file and bumped under its ``flock``, so
+    processes that were not forked from one master still get unique
+    steps, and a restart carries on after the steps already written
+    instead of reusing them.
+    """
+
+    def __init__(self, path):
+        self._lock = SharedLock(path)
+        self._fd = None
+        self._pid = None
+
+    def next(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                self._fd = os.open(self._lock.path, os.O_RDWR)
+                self._pid = os.getpid()
+            raw = os.pread(self._fd, 8, 0)
+            step = int.from_bytes(raw, "little") if len(raw) == 8 else 0
+            os.pwrite(self._fd, (step + 1).to_bytes(8, "little"), 0)
+        return step
+
+
+def is_inherited(created_pid):
+    """True in a forked worker for an object created by ``created_pid``."""
+    return created_pid != os.getpid()
+
+
+def elect_writer(db_path):
+    """
+    Try to become the single background writer for ``db_path``.
+
+    Holds an exclusive ``flock`` on ``<db_path>.writer`` for the life of
+    the process; the kernel drops it when the process exits, so the
+    worker gunicorn starts as a replacement can take over.
+    """
+    fd = os.open(f"{db_path}.writer", os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        os.close(fd)
+        return False
+    os.ftruncate(fd, 0)
+    os.write(fd, str(os.getpid()).encode())
+    return True
+
+
+def on_worker_start(fn):
+    """
+    Run ``fn`` once in every worker once the app is loaded (gunicorn's
+    ``post_worker_init``), or right away if a worker already started.
+    """
+    with _hooks_lock:
+        _worker_hooks.append(fn)
+        started = _started_pid == os.getpid()
+    if started:
+        fn()
+
+
+def start_worker():
+    """Run the ``on_worker_start`` hooks; called by gunicorn.conf.py."""
+    global _started_pid
+    with _hooks_lock:
+        if _started_pid == os.getpid():
+            return
+        _started_pid = os.getpid()
+        hooks = list(_worker_hooks)
+    for fn in hooks:
+        fn()
@@ -1,5 +1,11 @@
 #!/bin/sh
 export PORT=${PORT:-8080}
 
-# Run Flask app with gunicorn, binding to Cloud Run's $PORT
-exec gunicorn -w 1 -b :$PORT flask_app:app
+# Run the app with gunicorn, binding to Cloud Run's $PORT. Workers,
+# threads and preloading are set in gunicorn.conf.py (WEB_CONCURRENCY,
+# GUNICORN_THREADS, PRELOAD_APP).
+# APP_SERVER=async serves the asyncio variant (async_app.py) instead.
+if [ "${APP_SERVER:-sync}" = "async" ]; then
+    exec gunicorn -c gunicorn.conf.py --worker-class aiohttp.GunicornWebWorker async_app:app
+fi
+exec gunicorn -c gunicorn.conf.py flask_app:app
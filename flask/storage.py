@@ -0,0 +1,242 @@
+import os
+import sqlite3
+import threading
+from pathlib import Path
+
+# -----------------------------
+# SQLite configuration
+# -----------------------------
+DB_PATH = os.environ.get("MONITORING_DB", "monitoring.db")
+SQLITE_CACHE_KB = int(os.environ.get("SQLITE_CACHE_KB", "16384"))
+SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+# Databases created before incremental auto-vacuum need one full VACUUM to
+# switch modes. It rewrites the whole file under the write lock, so it only
+# runs from init_db, before the app serves, when this is set.
+SQLITE_VACUUM_ON_START = os.environ.get("SQLITE_VACUUM_ON_START", "0") == "1"
+
+# PRAGMA auto_vacuum value of INCREMENTAL
+INCREMENTAL_VACUUM = 2
+
+SCHEMA = [
+    """
+CREATE TABLE IF NOT EXISTS logs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    timestamp TEXT,
+    latency REAL,
+    prediction INTEGER,
+    probability REAL,
+    true_class INTEGER
+)
+""",
+    """
+CREATE TABLE IF NOT EXISTS batch_metrics (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+    num_samples INTEGER,
+    avg_probability REAL,
+    accuracy REAL,
+    precision REAL,
+    recall REAL,
+    f1_score REAL
+)
+""",
+    """
+CREATE TABLE IF NOT EXISTS alerts (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    metric TEXT,
+    value REAL,
+    threshold REAL,
+    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+)
+""",
+    """
+CREATE TABLE IF NOT EXISTS actions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    metric TEXT,
+    action TEXT,
+    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+)
+""",
+    "CREATE INDEX IF NOT EXISTS idx_logs_timestamp ON logs(timestamp)",
+    "CREATE INDEX IF NOT EXISTS idx_logs_true_class ON logs(true_class)",
+]
+
+# Hourly / daily aggregates of logs (see rollup.py). Buckets are UTC
+# 'YYYY-MM-DDTHH' / 'YYYY-MM-DD' prefixes of logs.timestamp; the sketch
+# columns hold JSON bucket counts so partial buckets can be merged.
+ROLLUP_COLUMNS = """
+    num_predictions INTEGER NOT NULL,
+    num_fraud INTEGER NOT NULL,
+    num_labelled INTEGER NOT NULL,
+    tp INTEGER NOT NULL,
+    fp INTEGER NOT NULL,
+    tn INTEGER NOT NULL,
+    fn INTEGER NOT NULL,
+    latency_sum REAL NOT NULL,
+    labelled_latency_sum REAL NOT NULL,
+    latency_max REAL NOT NULL,
+    probability_sum REAL NOT NULL,
+    latency_sketch TEXT NOT NULL,
+    probability_hist TEXT NOT NULL
+"""
+
+SCHEMA += [
+    f"""
+CREATE TABLE IF NOT EXISTS logs_hourly (
+    bucket TEXT PRIMARY KEY,{ROLLUP_COLUMNS})
+""",
+    f"""
+CREATE TABLE IF NOT EXISTS logs_daily (
+    bucket TEXT PRIMARY KEY,{ROLLUP_COLUMNS})
+""",
+    # Highest logs.id already folded into the rollups
+    """
+CREATE TABLE IF NOT EXISTS rollup_state (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    last_log_id INTEGER NOT NULL DEFAULT 0
+)
+""",
+    "INSERT OR IGNORE INTO rollup_state (id, last_log_id) VALUES (1, 0)",
+    # Current state of each alert rule (see alerting.py); times are epochs
+    """
+CREATE TABLE IF NOT EXISTS alert_state (
+    metric TEXT PRIMARY KEY,
+    state TEXT NOT NULL,
+    since REAL,
+    fired_at REAL,
+    value REAL,
+    threshold REAL,
+    updated REAL NOT NULL
+)
+""",
+]
+
+# Columns added after the first release: (table, column, declaration).
+# init_db adds the missing ones, then creates MIGRATION_INDEXES.
+MIGRATIONS = [
+    # Stable id returned by /predict and used by /feedback
+    ("logs", "prediction_id", "TEXT"),
+    # 'firing' / 'resolved': alerts rows are written on transitions only
+    ("alerts", "state", "TEXT"),
+    # 1 for rows scored by the fallback model (resilience.py)
+    ("logs", "degraded", "INTEGER NOT NULL DEFAULT 0"),
+]
+
+MIGRATION_INDEXES = [
+    "CREATE UNIQUE INDEX IF NOT EXISTS idx_logs_prediction_id "
+    "ON logs(prediction_id)",
+]
+
+# logs.prediction used to hold "Fraud" / "Not Fraud"; it is now 1 / 0.
+# SQLite cannot change a column type, so old tables are copied once.
+RETYPE_PREDICTION_SQL = """
+INSERT INTO logs (
+    id, timestamp, latency, prediction, probability, true_class,
+    prediction_id
+)
+SELECT
+    id, timestamp, latency, prediction = 'Fraud', probability, true_class,
+    prediction_id
+FROM logs_text_labels
+"""
+
+
+def connect(path=DB_PATH, readonly=False):
+    """
+    Open a tuned SQLite connection.
+
+    WAL lets readers run concurrently with the single writer, and
+    ``synchronous=NORMAL`` is durable across application crashes in WAL
+    mode while skipping an fsync per commit.
+    """
+    if readonly:
+        uri = Path(path).resolve().as_uri() + "?mode=ro"
+        conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        conn.execute("PRAGMA query_only = ON")
+    else:
+        new = not os.path.exists(path) or os.path.getsize(path) == 0
+        conn = sqlite3.connect(path, check_same_thread=False)
+        if new:
+            # Must precede WAL to apply; existing databases are converted
+            # by init_db with SQLITE_VACUUM_ON_START
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+
+    conn.execute(f"PRAGMA busy_timeout = {SQLITE_BUSY_TIMEOUT_MS}")
+    conn.execute(f"PRAGMA cache_size = -{SQLITE_CACHE_KB}")
+    conn.execute("PRAGMA temp_store = MEMORY")
+    return conn
+
+
+def init_db(path=DB_PATH, vacuum=SQLITE_VACUUM_ON_START):
+    """Create tables, apply migrations and indexes; returns the connection."""
+    conn = connect(path)
+    with conn:
+        for statement in SCHEMA:
+            conn.execute(statement)
+        _add_columns(conn)
+        _retype_prediction(conn)
+        for statement in MIGRATION_INDEXES:
+            conn.execute(statement)
+    mode = conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+    if vacuum and mode != INCREMENTAL_VACUUM:
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM")
+    return conn
+
+
+def _add_columns(conn):
+    for table, column, declaration in MIGRATIONS:
+        columns = {
+            row[1] for row in conn.execute(f"PRAGMA table_info({table})")
+        }
+        if column not in columns:
+            conn.execute(
+                f"ALTER TABLE {table} ADD COLUMN {column} {declaration}"
+            )
+
+
+def _retype_prediction(conn):
+    types = {row[1]: row[2] for row in conn.execute("PRAGMA table_info(logs)")}
+    if types["prediction"].upper() == "INTEGER":
+        return
+
+    # Keep the AUTOINCREMENT counter: ids must stay above the rollup
+    # watermark even if every row has been compacted away
+    seq = conn.execute(
+        "SELECT seq FROM sqlite_sequence WHERE name = 'logs'"
+    ).fetchone()
+    conn.execute("ALTER TABLE logs RENAME TO logs_text_labels")
+    conn.execute(SCHEMA[0])
+    _add_columns(conn)
+    conn.execute(RETYPE_PREDICTION_SQL)
+    conn.execute("DROP TABLE logs_text_labels")
+    if seq is not None:
+        conn.execute("DELETE FROM sqlite_sequence WHERE name = 'logs'")
+        conn.execute(
+            "INSERT INTO sqlite_sequence (name, seq) VALUES ('logs', ?)", seq
+        )
+    # The indexes were dropped with the old table
+    for statement in SCHEMA:
+        if statement.startswith("CREATE INDEX"):
+            conn.execute(statement)
+
+
+_local = threading.local()
+
+
+def get_connection(path=DB_PATH):
+    """Per-thread read/write connection."""
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = _local.conn = connect(path)
+    return conn
+
+
+def read_connection(path=DB_PATH):
+    """Per-thread read-only connection (dashboards never block writers)."""
+    conn = getattr(_local, "read_conn", None)
+    if conn is None:
+        conn = _local.read_conn = connect(path, readonly=True)
+    return conn
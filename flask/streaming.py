@@ -0,0 +1,110 @@
+import json
+import os
+
+import numpy as np
+from tensor_codec import DecodeError
+
+# -----------------------------
+# NDJSON streaming configuration (/predict/stream)
+# -----------------------------
+NDJSON_CONTENT_TYPE = "application/x-ndjson"
+STREAM_CHUNK_ROWS = int(os.environ.get("STREAM_CHUNK_ROWS", "1024"))
+STREAM_MAX_LINE_BYTES = int(os.environ.get("STREAM_MAX_LINE_BYTES", "65536"))
+
+
+class ChunkDecoder:
+    """
+    Turn NDJSON request lines into fixed-size float32 chunks.
+
+    Each non-blank line is either a JSON array of features or an object
+    ``{"instance": [...], "true_class": 0}``. ``feed`` returns
+    ``(data, true_class)`` every ``chunk_rows`` rows and ``None`` in
+    between; ``finish`` returns the final partial chunk (or ``None``).
+    At most one chunk of rows is held at a time.
+    """
+
+    def __init__(self, chunk_rows=STREAM_CHUNK_ROWS):
+        self.chunk_rows = chunk_rows
+        self.lines = 0
+        self._rows = []
+        self._classes = []
+
+    def feed(self, line):
+        self.lines += 1
+        if len(line) > STREAM_MAX_LINE_BYTES:
+            raise DecodeError(
+                f"Line {self.lines} exceeds {STREAM_MAX_LINE_BYTES} bytes"
+            )
+        if not line.strip():
+            return None
+
+        try:
+            item = json.loads(line)
+        except ValueError as e:
+            raise DecodeError(f"Line {self.lines}: invalid JSON") from e
+        if isinstance(item, dict):
+            if "instance" not in item:
+                raise DecodeError(
+                    f"Line {self.lines}: missing 'instance' field"
+                )
+            self._rows.append(item["instance"])
+            self._classes.append(item.get("true_class"))
+        elif isinstance(item, list):
+            self._rows.append(item)
+            self._classes.append(None)
+        else:
+            raise DecodeError(
+                f"Line {self.lines}: expected a feature list or an object"
+            )
+
+        if len(self._rows) >= self.chunk_rows:
+            return self._take()
+        return None
+
+    def finish(self):
+        return self._take() if self._rows else None
+
+    def _take(self):
+        rows, classes = self._rows, self._classes
+        self._rows, self._classes = [], []
+        try:
+            data = np.array(rows, dtype=np.float32)
+        except ValueError as e:
+            raise DecodeError(
+                f"Lines up to {self.lines}: instances must be equal-length "
+                "numeric lists"
+            ) from e
+        if data.ndim != 2:
+            raise DecodeError(
+                f"Lines up to {self.lines}: instances must be equal-length "
+                "numeric lists"
+            )
+        if not np.isfinite(data).all():
+            data = np.nan_to_num(data)
+        if all(tc is None for tc in classes):
+            classes = None
+        return data, classes
+
+
+def encode_results(labels, probs, prediction_ids, degraded=False):
+    """
+    One NDJSON result line per scored row; rows scored by the fallback
+    model carry ``"degraded": true``.
+    """
+    extra = {"degraded": True} if degraded else {}
+    return "".join(
+        json.dumps(
+            {
+                "prediction_id": pid,
+                "prediction": label,
+                "probability": p,
+                **extra,
+            }
+        )
+        + "\n"
+        for pid, label, p in zip(prediction_ids, labels, probs.tolist())
+    ).encode()
+
+
+def encode_error(message):
+    return (json.dumps({"error": message}) + "\n").encode()
@@ -0,0 +1,259 @@
+import multiprocessing
+import os
+import queue
+import threading
+import time
+import traceback
+
+from event_writer import EventFileWriter
+from telemetry import span
+
+# -----------------------------
+# TensorBoard summary configuration
+# -----------------------------
+TENSORBOARD_LOGDIR = os.environ.get(
+    "TENSORBOARD_LOGDIR", "gs://credit2025-tensorboard-logs/tensorboard"
+)
+SUMMARY_FLUSH_SECS = float(os.environ.get("SUMMARY_FLUSH_SECS", "10"))
+SUMMARY_FLUSH_POINTS = int(os.environ.get("SUMMARY_FLUSH_POINTS", "500"))
+SUMMARY_MAX_PENDING = int(os.environ.get("SUMMARY_MAX_PENDING", "10000"))
+# "native" writes event files without TensorFlow (local logdirs only),
+# "tensorflow" uses tf.summary; "auto" picks native unless the logdir is
+# a remote URL such as gs://
+SUMMARY_WRITER = os.environ.get("SUMMARY_WRITER", "auto")
+
+
+class TensorFlowWriter:
+    """``tf.summary`` file writer; imports TensorFlow when created."""
+
+    def __init__(self, logdir):
+        import tensorflow as tf
+
+        self._tf = tf
+        self._writer = tf.summary.create_file_writer(logdir)
+
+    def write(self, points):
+        with self._writer.as_default():
+            for tag, value, step in points:
+                self._tf.summary.scalar(tag, value, step=step)
+
+    def flush(self):
+        self._writer.flush()
+
+    def close(self):
+        self._writer.close()
+
+
+def open_writer(logdir, kind=SUMMARY_WRITER):
+    if kind == "auto":
+        kind = "tensorflow" if "://" in logdir else "native"
+    if kind == "native":
+        return EventFileWriter(logdir)
+    if kind == "tensorflow":
+        return TensorFlowWriter(logdir)
+    raise ValueError(f"Unknown SUMMARY_WRITER: {kind!r}")
+
+
+class SummaryPipeline:
+    """
+    Buffer TensorBoard scalars in memory and write them from a thread.
+
+    ``add`` never touches the summary writer: points are appended to a
+    bounded buffer (and dropped, with a counter, when it is full). A
+    dedicated thread writes the buffer every ``flush_secs`` seconds or as
+    soon as ``flush_points`` points are pending. ``logdir`` may be a GCS
+    path or a local directory. The file writer (and TensorFlow, for
+    GCS) is only opened by the first flush that has points to write.
+
+    Across gunicorn workers only one process writes: the others call
+    ``forward`` and their points travel through a fork-inherited
+    multiprocessing queue to the writer, which drains it on every flush.
+    A process that was not forked from the writer has no such queue and
+    calls ``discard``: its points are counted as dropped.
+    """
+
+    def __init__(
+        self,
+        logdir=TENSORBOARD_LOGDIR,
+        flush_secs=SUMMARY_FLUSH_SECS,
+        flush_points=SUMMARY_FLUSH_POINTS,
+        max_pending=SUMMARY_MAX_PENDING,
+    ):
+        self.logdir = logdir
+        self.flush_secs = flush_secs
+        self.flush_points = flush_points
+        self.max_pending = max_pending
+
+        self._pending = []
+        self._cond = threading.Condition()
+        self._closing = False
+        self._thread = None
+
+        # Points from non-writer workers, in (step, scalars) units
+        self._inbox = multiprocessing.Queue(max_pending)
+        self._forwarding = False
+        self._forwarded = 0
+        self._discarding = False
+
+        self._written = 0
+        self._dropped = 0
+        self._failed = 0
+        self._flushes = 0
+        self._last_flush_seconds = 0.0
+        self._open_seconds = None
+
+    def add(self, step, scalars):
+        """Queue ``{tag: value}`` scalars for ``step``; False if dropped."""
+        if self._discarding:
+            with self._cond:
+                self._dropped += len(scalars)
+            return False
+        if self._forwarding:
+            try:
+                self._inbox.put_nowait((step, scalars))
+            except queue.Full:
+                with self._cond:
+                    self._dropped += len(scalars)
+                return False
+            with self._cond:
+                self._forwarded += len(scalars)
+            return True
+
+        self._ensure_started()
+        with self._cond:
+            if len(self._pending) + len(scalars) > self.max_pending:
+                self._dropped += len(scalars)
+                return False
+            self._pending.extend(
+                (tag, float(value), step) for tag, value in scalars.items()
+            )
+            if len(self._pending) >= self.flush_points:
+                self._cond.notify()
+        return True
+
+    def start(self):
+        """Start writing now (the writer must drain forwarded points)."""
+        self._ensure_started()
+
+    def forward(self):
+        """Send points to the writer process instead of writing them."""
+        self._forwarding = True
+
+    def discard(self):
+        """Drop points: another process writes the event files."""
+        self._discarding = True
+
+    def close(self, timeout=30.0):
+        """Write everything still pending and stop the thread."""
+        if self._thread is None:
+            return
+        with self._cond:
+            self._closing = True
+            self._cond.notify()
+        self._thread.join(timeout=timeout)
+        self._thread = None
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="summary-writer", daemon=True
+                )
+                self._thread.start()
+
+    def _run(self):
+        writer = None
+        while True:
+            with self._cond:
+                deadline = time.monotonic() + self.flush_secs
+                while (
+                    not self._closing
+                    and len(self._pending) < self.flush_points
+                ):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                points, self._pending = self._pending, []
+                closing = self._closing
+
+            points += self._drain_inbox()
+
+            if points:
+                if writer is None:
+                    writer = self._open()
+                if writer is not None:
+                    self._write(writer, points)
+                else:
+                    with self._cond:
+                        self._failed += len(points)
+            if closing:
+                if writer is not None:
+                    writer.close()
+                return
+
+    def _open(self):
+        start = time.perf_counter()
+        try:
+            writer = open_writer(self.logdir)
+        except Exception:
+            traceback.print_exc()
+            return None
+        with self._cond:
+            self._open_seconds = time.perf_counter() - start
+        return writer
+
+    def _drain_inbox(self):
+        points = []
+        while True:
+            try:
+                step, scalars = self._inbox.get_nowait()
+            except queue.Empty:
+                return points
+            points.extend(
+                (tag, float(value), step) for tag, value in scalars.items()
+            )
+
+    def _write(self, writer, points):
+        start = time.perf_counter()
+        try:
+            with span("tensorboard_flush"):
+                writer.write(points)
+                writer.flush()
+        except Exception:
+            traceback.print_exc()
+            with self._cond:
+                self._failed += len(points)
+            return
+
+        with self._cond:
+            self._written += len(points)
+            self._flushes += 1
+            self._last_flush_seconds = time.perf_counter() - start
+
+    def stats(self):
+        with self._cond:
+            return {
+                "logdir": self.logdir,
+                "writer_open": self._open_seconds is not None,
+                "writer_open_seconds": self._open_seconds,
+                "flush_secs": self.flush_secs,
+                "flush_points": self.flush_points,
+                "role": (
+                    "discarding"
+                    if self._discarding
+                    else "forwarder"
+                    if self._forwarding
+                    else "writer"
+                ),
+                "pending": len(self._pending),
+                "forwarded": self._forwarded,
+                "max_pending": self.max_pending,
+                "written": self._written,
+                "dropped": self._dropped,
+                "failed": self._failed,
+                "flushes": self._flushes,
+                "last_flush_seconds": self._last_flush_seconds,
+            }
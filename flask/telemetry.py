@@ -0,0 +1,510 @@
+import bisect
+import json
+import math
+import os
+import threading
+import time
+import traceback
+
+from shared import on_worker_start
+
+# -----------------------------
+# In-process metrics for /metrics (Prometheus text format 0.0.4)
+# -----------------------------
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+QUANTILES = (0.5, 0.95, 0.99)
+
+# Multi-worker mode (set by gunicorn.conf.py): every worker dumps its
+# values to <dir>/worker-<pid>.json and /metrics sums all workers
+METRICS_MULTIPROC_DIR = os.environ.get("METRICS_MULTIPROC_DIR", "")
+METRICS_SYNC_SECS = float(os.environ.get("METRICS_SYNC_SECS", "5"))
+ARCHIVE_FILE = "archive.json"
+
+# 25 us .. ~75 s, x1.5 per bucket: fine enough for p50/p95/p99 estimates
+LATENCY_BUCKETS = tuple(25e-6 * 1.5**i for i in range(38))
+# 1 .. 65536 rows, powers of two
+SIZE_BUCKETS = tuple(float(2**i) for i in range(17))
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    body = ",".join(f'{name}="{_escape(value)}"' for name, value in pairs)
+    return "{" + body + "}"
+
+
+def _escape(value):
+    return (
+        str(value)
+        .replace("\\", r"\\")
+        .replace('"', r"\"")
+        .replace("\n", r"\n")
+    )
+
+
+def _number(value):
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+def bucket_quantile(buckets, counts, q):
+    """
+    Estimate the ``q`` quantile from per-bucket counts (one count per
+    upper bound in ``buckets`` plus a final +Inf bucket), interpolating
+    geometrically inside the bucket that holds the rank.
+    """
+    total = sum(counts)
+    if not total:
+        return float("nan")
+
+    rank = q * total
+    seen = 0
+    for i, count in enumerate(counts):
+        if count and seen + count >= rank:
+            if i == len(buckets):
+                return buckets[-1]
+            upper = buckets[i]
+            lower = buckets[i - 1] if i else upper / 1.5
+            fraction = (rank - seen) / count
+            return lower * (upper / lower) ** fraction
+        seen += count
+    return buckets[-1]
+
+
+class Counter:
+    """Monotonic counter, optionally split by label values."""
+
+    kind = "counter"
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, labels=()):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def snapshot(self):
+        """``{labels: value}``."""
+        with self._lock:
+            return dict(self._values)
+
+    @staticmethod
+    def merge(total, values):
+        for labels, value in values.items():
+            total[labels] = total.get(labels, 0) + value
+
+    def render(self, values):
+        return [
+            f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}"
+            for labels, value in sorted(values.items())
+        ]
+
+
+class Histogram:
+    """
+    Cumulative-bucket histogram with sum and count per label set.
+
+    ``quantile`` interpolates inside the bucket that holds the requested
+    rank (geometrically, as the buckets are exponential).
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name, help, buckets=LATENCY_BUCKETS, labelnames=()):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self.labelnames = tuple(labelnames)
+        self._series = {}  # labels -> [bucket counts..., +Inf], sum
+        self._lock = threading.Lock()
+
+    def observe(self, value, labels=()):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = [[0] * (len(self.buckets) + 1), 0.0]
+                self._series[labels] = series
+            series[0][i] += 1
+            series[1] += value
+
+    def quantile(self, q, labels=()):
+        with self._lock:
+            series = self._series.get(labels)
+            counts = list(series[0]) if series else []
+        return bucket_quantile(self.buckets, counts, q)
+
+    def count(self, labels=()):
+        with self._lock:
+            series = self._series.get(labels)
+            return sum(series[0]) if series else 0
+
+    def snapshot(self):
+        """``{labels: [bucket counts, sum]}``."""
+        with self._lock:
+            return {
+                labels: [list(counts), total]
+                for labels, (counts, total) in self._series.items()
+            }
+
+    @staticmethod
+    def merge(total, values):
+        for labels, (counts, value_sum) in values.items():
+            series = total.setdefault(labels, [[0] * len(counts), 0.0])
+            series[0] = [a + b for a, b in zip(series[0], counts)]
+            series[1] += value_sum
+
+    def render(self, values):
+        lines = []
+        for labels, (counts, total) in sorted(values.items()):
+            cumulative = 0
+            for upper, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                le = _labels(self.labelnames, labels, [("le", _number(upper))])
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            tags = _labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{tags} {_number(total)}")
+            lines.append(f"{self.name}_count{tags} {cumulative}")
+
+        # Bucket-interpolated quantiles, exported as a separate gauge
+        name = f"{self.name}_quantile"
+        lines.append(f"# HELP {name} Estimated quantiles of {self.name}.")
+        lines.append(f"# TYPE {name} gauge")
+        for labels, (counts, _) in sorted(values.items()):
+            for q in QUANTILES:
+                tags = _labels(self.labelnames, labels, [("quantile", q)])
+                value = bucket_quantile(self.buckets, counts, q)
+                lines.append(f"{name}{tags} {_number(value)}")
+        return lines
+
+
+class Registry:
+    """
+    Metrics rendered by ``/metrics``, plus callbacks for live state.
+
+    With ``METRICS_MULTIPROC_DIR`` set, each worker also exports its
+    values every ``METRICS_SYNC_SECS`` seconds and ``render`` adds up the
+    other workers' latest exports (and the archive of exited workers),
+    so any worker can answer a scrape for the whole server.
+    """
+
+    def __init__(self, multiproc_dir=METRICS_MULTIPROC_DIR):
+        self.multiproc_dir = multiproc_dir
+        self._metrics = []
+        self._callbacks = []
+        self._lock = threading.Lock()
+        self._export_thread = None
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self.register(Counter(name, help, labelnames))
+
+    def histogram(self, name, help, buckets=LATENCY_BUCKETS, labelnames=()):
+        return self.register(Histogram(name, help, buckets, labelnames))
+
+    def callback(self, name, kind, help, fn, labelnames=(), aggregate="sum"):
+        """
+        Sample ``fn()`` at scrape time: a number, or a dict mapping label
+        value tuples to numbers. Exceptions drop the sample.
+
+        ``aggregate`` combines workers: ``"sum"`` for per-process state
+        (queue depths, row counts), ``"max"`` for values every worker
+        reads from shared memory.
+        """
+        with self._lock:
+            self._callbacks.append(
+                (name, kind, help, fn, tuple(labelnames), aggregate)
+            )
+
+    def snapshot(self):
+        """Current values: ``{"metrics": {...}, "callbacks": {...}}``."""
+        with self._lock:
+            metrics = list(self._metrics)
+            callbacks = list(self._callbacks)
+
+        snapshot = {"metrics": {}, "callbacks": {}}
+        for metric in metrics:
+            snapshot["metrics"][metric.name] = metric.snapshot()
+        for name, _, _, fn, _, _ in callbacks:
+            try:
+                value = fn()
+            except Exception:
+                continue
+            if value is None:
+                continue
+            if not isinstance(value, dict):
+                value = {(): value}
+            snapshot["callbacks"][name] = value
+        return snapshot
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics)
+            callbacks = list(self._callbacks)
+
+        snapshots = [self.snapshot()]
+        if self.multiproc_dir:
+            snapshots += _read_exports(self.multiproc_dir, exclude=os.getpid())
+
+        lines = []
+        for metric in metrics:
+            values = {}
+            for snapshot in snapshots:
+                metric.merge(values, snapshot["metrics"].get(metric.name, {}))
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render(values))
+
+        for name, kind, help, _, labelnames, aggregate in callbacks:
+            values = {}
+            for snapshot in snapshots:
+                for labels, v in snapshot["callbacks"].get(name, {}).items():
+                    if labels not in values:
+                        values[labels] = v
+                    elif aggregate == "max":
+                        values[labels] = max(values[labels], v)
+                    else:
+                        values[labels] += v
+            if not values:
+                continue
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, v in sorted(values.items()):
+                lines.append(
+                    f"{name}{_labels(labelnames, labels)} {_number(v)}"
+                )
+        return "\n".join(lines) + "\n"
+
+    # -----------------------------
+    # Multi-worker export
+    # -----------------------------
+    def start_export(self):
+        """Start exporting this worker's values (one thread per worker)."""
+        if not self.multiproc_dir or self._export_thread is not None:
+            return
+        os.makedirs(self.multiproc_dir, exist_ok=True)
+        self._export_thread = threading.Thread(
+            target=self._export_loop, name="metrics-export", daemon=True
+        )
+        self._export_thread.start()
+
+    def export(self):
+        path = os.path.join(self.multiproc_dir, f"worker-{os.getpid()}.json")
+        _write_json(path, _encode(self.snapshot()))
+
+    def archive_worker(self, pid):
+        """
+        Fold an exited worker's counters and histograms into the archive
+        so totals survive worker restarts; its gauges are dropped. Called
+        by the gunicorn master (``child_exit`` in gunicorn.conf.py).
+        """
+        if not self.multiproc_dir:
+            return
+        path = os.path.join(self.multiproc_dir, f"worker-{pid}.json")
+        archive_path = os.path.join(self.multiproc_dir, ARCHIVE_FILE)
+        try:
+            with open(path) as f:
+                dead = _decode(json.load(f))
+        except (OSError, ValueError):
+            return
+
+        archive = {"metrics": {}, "callbacks": {}}
+        if os.path.exists(archive_path):
+            with open(archive_path) as f:
+                archive = _decode(json.load(f))
+
+        with self._lock:
+            metrics = {metric.name: metric for metric in self._metrics}
+            counters = {
+                name for name, kind, *_ in self._callbacks if kind == "counter"
+            }
+        for name, values in dead["metrics"].items():
+            if name in metrics:
+                metrics[name].merge(
+                    archive["metrics"].setdefault(name, {}), values
+                )
+        for name, values in dead["callbacks"].items():
+            if name in counters:
+                Counter.merge(
+                    archive["callbacks"].setdefault(name, {}), values
+                )
+
+        _write_json(archive_path, _encode(archive))
+        os.remove(path)
+
+    def _export_loop(self):
+        while True:
+            try:
+                self.export()
+            except Exception:
+                traceback.print_exc()
+            time.sleep(METRICS_SYNC_SECS)
+
+
+def _encode(snapshot):
+    return {
+        section: {
+            name: [[list(labels), value] for labels, value in values.items()]
+            for name, values in snapshot[section].items()
+        }
+        for section in ("metrics", "callbacks")
+    }
+
+
+def _decode(data):
+    return {
+        section: {
+            name: {tuple(labels): value for labels, value in values}
+            for name, values in data.get(section, {}).items()
+        }
+        for section in ("metrics", "callbacks")
+    }
+
+
+def _write_json(path, data):
+    # Readers only ever see a complete file
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+
+def _read_exports(directory, exclude=None):
+    snapshots = []
+    for filename in sorted(os.listdir(directory)):
+        if not filename.endswith(".json"):
+            continue
+        if filename == f"worker-{exclude}.json":
+            continue
+        try:
+            with open(os.path.join(directory, filename)) as f:
+                snapshots.append(_decode(json.load(f)))
+        except (OSError, ValueError):
+            continue  # removed or replaced while listing
+    return snapshots
+
+
+REGISTRY = Registry()
+on_worker_start(REGISTRY.start_export)
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "fraud_stage_seconds",
+    "Time spent in each stage of the prediction path.",
+    labelnames=("stage",),
+)
+REQUEST_SECONDS = REGISTRY.histogram(
+    "fraud_request_seconds",
+    "End-to-end request handling time.",
+    labelnames=("endpoint",),
+)
+REQUESTS = REGISTRY.counter(
+    "fraud_requests_total",
+    "HTTP requests handled.",
+    labelnames=("endpoint", "status"),
+)
+REQUEST_ROWS = REGISTRY.histogram(
+    "fraud_request_rows",
+    "Instances per scoring request (or stream chunk).",
+    buckets=SIZE_BUCKETS,
+)
+MODEL_BATCH_ROWS = REGISTRY.histogram(
+    "fraud_model_batch_rows",
+    "Rows per model backend call after micro-batching.",
+    buckets=SIZE_BUCKETS,
+)
+MODEL_BATCH_REQUESTS = REGISTRY.histogram(
+    "fraud_model_batch_requests",
+    "Requests coalesced into one micro-batch.",
+    buckets=SIZE_BUCKETS,
+)
+MODEL_BATCH_WAIT_SECONDS = REGISTRY.histogram(
+    "fraud_model_batch_wait_seconds",
+    "Time a request waited in the micro-batcher before its model call.",
+)
+LOG_WRITE_ROWS = REGISTRY.histogram(
+    "fraud_log_write_rows",
+    "Rows per SQLite write-behind transaction.",
+    buckets=SIZE_BUCKETS,
+)
+INFERENCE_ERRORS = REGISTRY.counter(
+    "fraud_inference_errors_total",
+    "Model backend calls that failed.",
+)
+
+# TF Serving deadlines, hedging and circuit breaker (see resilience.py)
+MODEL_ATTEMPTS = REGISTRY.counter(
+    "fraud_model_attempts_total",
+    "Requests sent to TF Serving by kind (first, hedge, retry).",
+    labelnames=("kind",),
+)
+MODEL_ATTEMPT_SECONDS = REGISTRY.histogram(
+    "fraud_model_attempt_seconds",
+    "Latency of single TF Serving attempts by outcome.",
+    labelnames=("outcome",),
+)
+MODEL_CALLS = REGISTRY.counter(
+    "fraud_model_calls_total",
+    "Protected model calls by result (winning attempt kind, failed, "
+    "short_circuit, invalid).",
+    labelnames=("result",),
+)
+MODEL_CALL_SECONDS = REGISTRY.histogram(
+    "fraud_model_call_seconds",
+    "Latency of protected model calls by result, hedges included.",
+    labelnames=("result",),
+)
+MODEL_FALLBACKS = REGISTRY.counter(
+    "fraud_model_fallbacks_total",
+    "Degraded responses served by the fallback model, by cause.",
+    labelnames=("cause",),
+)
+BREAKER_TRANSITIONS = REGISTRY.counter(
+    "fraud_circuit_transitions_total",
+    "TF Serving circuit breaker transitions by new state.",
+    labelnames=("state",),
+)
+
+
+# Admission control and priority lanes (see admission.py)
+ADMISSION_REJECTIONS = REGISTRY.counter(
+    "fraud_admission_rejections_total",
+    "Scoring requests turned away, by lane and reason (too_large, "
+    "queue_full, queue_timeout).",
+    labelnames=("lane", "reason"),
+)
+ADMISSION_WAIT_SECONDS = REGISTRY.histogram(
+    "fraud_admission_wait_seconds",
+    "Time a request (or bulk chunk) waited for a model call slot.",
+    labelnames=("lane",),
+)
+
+
+def observe_stage(stage, seconds):
+    STAGE_SECONDS.observe(seconds, (stage,))
+
+
+class span:
+    """Time a block into ``fraud_stage_seconds{stage=...}``."""
+
+    __slots__ = ("labels", "start")
+
+    def __init__(self, stage):
+        self.labels = (stage,)
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        STAGE_SECONDS.observe(time.perf_counter() - self.start, self.labels)
+        return False
@@ -0,0 +1,230 @@
+import io
+
+import numpy as np
+
+# -----------------------------
+# Binary tensor formats for /predict
+# -----------------------------
+JSON_CONTENT_TYPE = "application/json"
+RAW_CONTENT_TYPE = "application/octet-stream"
+NPY_CONTENT_TYPE = "application/x-npy"
+ARROW_CONTENT_TYPE = "application/vnd.apache.arrow.stream"
+
+BINARY_CONTENT_TYPES = (RAW_CONTENT_TYPE, NPY_CONTENT_TYPE, ARROW_CONTENT_TYPE)
+RESPONSE_CONTENT_TYPES = (JSON_CONTENT_TYPE,) + BINARY_CONTENT_TYPES
+
+# Raw bodies are little-endian float32 in C order; their shape travels in
+# this header as "rows,cols" ("n" on responses).
+SHAPE_HEADER = "X-Tensor-Shape"
+LATENCY_HEADER = "X-Latency"
+# Raw/.npy responses: prediction ids are "<prefix>-<row>" for this prefix
+PREDICTION_ID_PREFIX_HEADER = "X-Prediction-Id-Prefix"
+TRUE_CLASS_COLUMN = "true_class"
+
+_NPY_HEADER_READERS = {
+    (1, 0): np.lib.format.read_array_header_1_0,
+    (2, 0): np.lib.format.read_array_header_2_0,
+}
+
+
+class DecodeError(ValueError):
+    """Raised when a binary request body cannot be decoded."""
+
+
+class UnsupportedFormatError(DecodeError):
+    """Raised when a format needs an optional dependency that is missing."""
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow as pa
+        import pyarrow.ipc  # noqa: F401
+    except ImportError as e:
+        raise UnsupportedFormatError(
+            "Arrow IPC requires the optional 'pyarrow' package"
+        ) from e
+    return pa
+
+
+def parse_true_class(value):
+    """Query-string labels: a single class or a comma-separated list."""
+    if value is None or value == "":
+        return None
+    parts = value.split(",")
+    try:
+        if len(parts) == 1:
+            return int(parts[0])
+        return [int(p) for p in parts]
+    except ValueError as e:
+        raise DecodeError(f"Invalid true_class: {value!r}") from e
+
+
+def decode_raw(body, shape_header):
+    """Zero-copy view of a raw little-endian float32 body."""
+    if not shape_header:
+        raise DecodeError(f"Raw float32 bodies need a {SHAPE_HEADER} header")
+    try:
+        rows, cols = (int(v) for v in shape_header.split(","))
+    except ValueError as e:
+        raise DecodeError(
+            f"{SHAPE_HEADER} must be 'rows,cols', got {shape_header!r}"
+        ) from e
+    if len(body) != rows * cols * 4:
+        raise DecodeError(
+            f"Body has {len(body)} bytes, expected {rows * cols * 4} "
+            f"for shape ({rows}, {cols}) float32"
+        )
+    return np.frombuffer(body, dtype="<f4").reshape(rows, cols)
+
+
+def decode_npy(body):
+    """Zero-copy view of a .npy body (header parsed, data not copied)."""
+    buf = io.BytesIO(body)
+    try:
+        version = np.lib.format.read_magic(buf)
+        reader = _NPY_HEADER_READERS.get(version)
+        if reader is None:
+            raise DecodeError(f"Unsupported .npy format version {version}")
+        shape, fortran_order, dtype = reader(buf)
+    except ValueError as e:
+        raise DecodeError(f"Invalid .npy body: {e}") from e
+
+    if dtype.hasobject or dtype.kind not in "fiu":
+        raise DecodeError(f"Unsupported .npy dtype: {dtype}")
+
+    count = int(np.prod(shape))
+    if len(body) - buf.tell() != count * dtype.itemsize:
+        raise DecodeError(".npy body is truncated or has trailing bytes")
+
+    data = np.frombuffer(body, dtype=dtype, count=count, offset=buf.tell())
+    if fortran_order:
+        return data.reshape(shape[::-1]).T
+    return data.reshape(shape)
+
+
+def decode_arrow(body, columns=None):
+    """
+    Decode an Arrow IPC stream.
+
+    Either a single fixed-size-list column of feature vectors, or one
+    numeric column per feature; an optional ``true_class`` column carries
+    labels. With ``columns``, tables that have all of these columns are
+    read in that order (extra columns are ignored). Returns
+    ``(data, true_class)``.
+    """
+    pa = _import_pyarrow()
+    try:
+        table = pa.ipc.open_stream(pa.py_buffer(body)).read_all()
+    except pa.ArrowInvalid as e:
+        raise DecodeError(f"Invalid Arrow IPC stream: {e}") from e
+
+    true_class = None
+    if TRUE_CLASS_COLUMN in table.column_names:
+        true_class = table.column(TRUE_CLASS_COLUMN).to_numpy().tolist()
+        table = table.drop([TRUE_CLASS_COLUMN])
+
+    if table.num_columns == 0:
+        raise DecodeError("Arrow table has no feature columns")
+    if columns and set(columns) <= set(table.column_names):
+        table = table.select(list(columns))
+
+    first = table.column(0)
+    if table.num_columns == 1 and pa.types.is_fixed_size_list(first.type):
+        column = first.combine_chunks()
+        width = first.type.list_size
+        data = column.flatten().to_numpy().reshape(-1, width)
+    else:
+        data = np.column_stack([column.to_numpy() for column in table.columns])
+    return data, true_class
+
+
+def decode_json(payload, dtype=np.float32):
+    """
+    Validate a parsed JSON /predict payload into ``(data, true_class)``.
+
+    ``data`` is a ``dtype`` array, reshaped to 2D for a single instance.
+    """
+    if payload is None:
+        raise DecodeError("Invalid JSON payload")
+    if "instances" not in payload:
+        raise DecodeError("Missing 'instances' field")
+
+    data = payload.get("instances", [])
+    true_class = payload.get("true_class", None)
+
+    if not isinstance(data, (list, tuple)):
+        raise DecodeError("'instances' must be a list")
+    if len(data) == 0:
+        raise DecodeError("'instances' cannot be empty")
+
+    # Convert to numpy
+    data = np.array(data, dtype=dtype)
+
+    # Ensure 2D
+    if data.ndim == 1:
+        data = data.reshape(1, -1)
+    return data, true_class
+
+
+def decode_request(
+    content_type, body, headers, args, dtype=np.float32, columns=None
+):
+    """
+    Decode a binary /predict body into ``(2D array, true_class)``.
+
+    The array is ``dtype`` (float32 for the model); ``columns`` selects
+    named Arrow columns (see ``decode_arrow``). Labels for raw and .npy
+    bodies come from the ``true_class`` query parameter.
+    """
+    if content_type == RAW_CONTENT_TYPE:
+        data = decode_raw(body, headers.get(SHAPE_HEADER))
+        true_class = parse_true_class(args.get("true_class"))
+    elif content_type == NPY_CONTENT_TYPE:
+        data = decode_npy(body)
+        true_class = parse_true_class(args.get("true_class"))
+    elif content_type == ARROW_CONTENT_TYPE:
+        data, true_class = decode_arrow(body, columns)
+    else:
+        raise DecodeError(f"Unsupported content type: {content_type}")
+
+    if data.size == 0:
+        raise DecodeError("'instances' cannot be empty")
+    if data.ndim == 1:
+        data = data.reshape(1, -1)
+    if data.ndim != 2:
+        raise DecodeError(f"Expected a 2D tensor, got shape {data.shape}")
+    return data.astype(dtype, copy=False), true_class
+
+
+def encode_response(content_type, labels, probs, prediction_ids):
+    """
+    Encode probabilities as a binary body.
+
+    Arrow bodies also carry the labels and prediction ids; raw and .npy
+    bodies return the id prefix in a header.
+    """
+    probs = np.asarray(probs, dtype="<f4")
+    prefix = prediction_ids[0].rsplit("-", 1)[0] if prediction_ids else ""
+    if content_type == RAW_CONTENT_TYPE:
+        return probs.tobytes(), {
+            SHAPE_HEADER: str(len(probs)),
+            PREDICTION_ID_PREFIX_HEADER: prefix,
+        }
+    if content_type == NPY_CONTENT_TYPE:
+        buf = io.BytesIO()
+        np.save(buf, probs, allow_pickle=False)
+        return buf.getvalue(), {PREDICTION_ID_PREFIX_HEADER: prefix}
+    if content_type == ARROW_CONTENT_TYPE:
+        pa = _import_pyarrow()
+        table = pa.table(
+            {
+                "prediction_id": pa.array(prediction_ids, pa.string()),
+                "prediction": pa.array(labels).dictionary_encode(),
+                "probability": pa.array(probs),
+            }
+        )
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return sink.getvalue().to_pybytes(), {}
+    raise ValueError(f"Unsupported response content type: {content_type}")
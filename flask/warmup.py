@@ -0,0 +1,125 @@
+import os
+import sys
+import threading
+import time
+import traceback
+
+import numpy as np
+
+# -----------------------------
+# Warm-up and readiness (/healthz)
+# -----------------------------
+# Each worker scores one dummy row once it has started, so the first real
+# request does not pay for TF Serving's or the local model's cold path.
+# /healthz answers 503 until that call has returned.
+WARMUP = os.environ.get("WARMUP", "1") == "1"
+WARMUP_FEATURES = int(os.environ.get("WARMUP_FEATURES", "33"))
+
+# Imports kept off the startup path; /healthz reports whether they loaded
+HEAVY_MODULES = ("tensorflow", "pandas", "pyarrow", "sklearn")
+
+PENDING, RUNNING, READY, FAILED, DISABLED = (
+    "pending",
+    "running",
+    "ready",
+    "failed",
+    "disabled",
+)
+
+
+class Warmup:
+    """
+    One-shot warm-up call and the readiness state of this worker.
+
+    A failed warm-up still counts as ready: requests are served (or
+    degraded) as usual and the error is reported.
+    """
+
+    def __init__(
+        self, predict_fn, num_features=WARMUP_FEATURES, enabled=WARMUP
+    ):
+        self.predict_fn = predict_fn
+        self.num_features = num_features
+        self.state = PENDING if enabled else DISABLED
+        self.seconds = None
+        self.error = None
+        self._lock = threading.Lock()
+
+    def _claim(self):
+        with self._lock:
+            if self.state != PENDING:
+                return False
+            self.state = RUNNING
+            return True
+
+    def _dummy(self):
+        return np.zeros((1, self.num_features), dtype=np.float32)
+
+    def start(self):
+        """Run the warm-up call on a background thread (once)."""
+        if self._claim():
+            threading.Thread(
+                target=self._run, name="warmup", daemon=True
+            ).start()
+
+    def _run(self):
+        start = time.perf_counter()
+        try:
+            self.predict_fn(self._dummy())
+        except Exception as e:
+            traceback.print_exc()
+            self._finish(start, e)
+        else:
+            self._finish(start, None)
+
+    async def run_async(self):
+        """Awaitable variant for the asyncio app's backends."""
+        if not self._claim():
+            return
+        start = time.perf_counter()
+        try:
+            await self.predict_fn(self._dummy())
+        except Exception as e:
+            traceback.print_exc()
+            self._finish(start, e)
+        else:
+            self._finish(start, None)
+
+    def _finish(self, start, error):
+        self.seconds = time.perf_counter() - start
+        self.error = None if error is None else repr(error)
+        self.state = READY if error is None else FAILED
+
+    def ready(self):
+        return self.state in (READY, FAILED, DISABLED)
+
+    def stats(self):
+        return {
+            "state": self.state,
+            "seconds": self.seconds,
+            "error": self.error,
+        }
+
+
+def health(warmup, loaded_at, startup_cpu_seconds, summaries):
+    """
+    ``(body, status code)`` of /healthz. ``loaded_at`` is when the app
+    module finished importing and ``startup_cpu_seconds`` the process
+    CPU time spent up to then (imports dominate it).
+    """
+    ready = warmup.ready()
+    summary = summaries.stats()
+    body = {
+        "status": "ready" if ready else "warming",
+        "pid": os.getpid(),
+        "uptime_seconds": time.time() - loaded_at,
+        "startup_cpu_seconds": startup_cpu_seconds,
+        "warmup": warmup.stats(),
+        "summary_writer": {
+            key: summary[key] for key in ("role", "writer_open")
+        },
+        "heavy_modules_loaded": [
+            name for name in HEAVY_MODULES if name in sys.modules
+        ],
+    }
+    return body, 200 if ready else 503
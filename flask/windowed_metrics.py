@@ -0,0 +1,255 @@
+import math
+import os
+import time
+
+import numpy as np
+from running_metrics import confusion_metrics
+from shared import SharedSlot, shared_array, shared_lock
+
+# -----------------------------
+# Windowed metrics configuration
+# -----------------------------
+METRICS_WINDOW_SIZE = int(os.environ.get("METRICS_WINDOW_SIZE", "10000"))
+METRICS_WINDOW_MINUTES = float(os.environ.get("METRICS_WINDOW_MINUTES", "60"))
+METRICS_HALF_LIFE_MINUTES = float(
+    os.environ.get("METRICS_HALF_LIFE_MINUTES", "30")
+)
+
+WINDOWS = ("count", "time", "decay")
+# Resolution of the time window: 1 / TIME_BUCKETS of its length
+TIME_BUCKETS = 60
+
+# Ring cells encode 2 * y_true + y_pred, so bincount gives [TN, FP, FN, TP]
+TN, FP, FN, TP = range(4)
+LATENCY = 4
+
+
+class TimeBuckets:
+    """
+    Column sums over a sliding time window, one slot per interval.
+
+    A shared ring of ``buckets`` slots each holds the sums of one
+    ``window_seconds / buckets`` interval; a slot is cleared when it is
+    reused for a newer interval. Rows can be added at any timestamp
+    inside the window, so late rows land in the interval they belong to.
+    Adding costs O(rows), reading O(buckets). Callers hold the lock.
+    """
+
+    def __init__(self, window_seconds, columns, buckets=TIME_BUCKETS):
+        self.buckets = buckets
+        self.width = window_seconds / buckets
+        self._ids = shared_array(buckets, np.int64)
+        self._ids[:] = -1
+        self._sums = shared_array(buckets * columns).reshape(buckets, columns)
+
+    def add(self, values, ts, now):
+        """Add ``values`` (rows x columns) at ``ts`` (scalar or per row)."""
+        values = np.asarray(values, dtype=np.float64)
+        oldest = self._oldest(now)
+        if np.ndim(ts) == 0:
+            self._add(int(min(ts, now) // self.width), oldest, values)
+            return
+        ids = (np.minimum(ts, now) // self.width).astype(np.int64)
+        for bucket in np.unique(ids):
+            self._add(int(bucket), oldest, values[ids == bucket])
+
+    def total(self, now):
+        return self._sums[self._ids >= self._oldest(now)].sum(axis=0)
+
+    def _oldest(self, now):
+        return int(now // self.width) - self.buckets + 1
+
+    def _add(self, bucket, oldest, values):
+        if bucket < oldest:
+            return
+        slot = bucket % self.buckets
+        if self._ids[slot] != bucket:
+            self._ids[slot] = bucket
+            self._sums[slot] = 0.0
+        self._sums[slot] += values.sum(axis=0)
+
+
+class WindowedMetrics:
+    """
+    Fixed-memory store of recent labelled predictions.
+
+    Three windows over labelled predictions:
+      - ``count``: the last ``size`` labels received (a ring buffer),
+      - ``time``: predictions scored in the last ``window_minutes``
+        (time buckets, see ``TimeBuckets``),
+      - ``decay``: exponentially decayed counts (``half_life_minutes``).
+    ``time`` and ``decay`` go by the prediction's timestamp, not by when
+    its label arrived: a late ``/feedback`` label counts in the interval
+    its prediction was scored in (or not at all once that left the time
+    window) and is decayed by the prediction's age. ``count`` is in
+    label arrival order.
+
+    Request latency does not wait for labels: ``observe_request`` adds
+    every scored request to its own ``window_minutes`` time buckets,
+    read by ``request_metrics`` (and the latency alert).
+
+    Every update costs O(batch) and a read O(1) amortized. The ring,
+    the buckets and the scalars below live in shared memory, so forked
+    workers (see shared.py) feed and read the same windows.
+    """
+
+    _total = SharedSlot("_scalars", 0, int)
+    _count_latency = SharedSlot("_scalars", 1)
+    _decay_latency = SharedSlot("_scalars", 2)
+    _decay_at = SharedSlot("_scalars", 3)
+    _last_ts = SharedSlot("_scalars", 4)
+
+    def __init__(
+        self,
+        size=METRICS_WINDOW_SIZE,
+        window_minutes=METRICS_WINDOW_MINUTES,
+        half_life_minutes=METRICS_HALF_LIFE_MINUTES,
+    ):
+        self.size = size
+        self.window_seconds = window_minutes * 60.0
+        self.half_life_seconds = half_life_minutes * 60.0
+        self._tau = self.half_life_seconds / math.log(2)
+
+        self._cells = shared_array(size, np.int8)
+        self._latency = shared_array(size)
+        self._scalars = shared_array(5)
+
+        # Sequence numbers: the ring holds [max(0, total - size), total)
+        self._total = 0
+
+        self._count = shared_array(4, np.int64)
+        self._count_latency = 0.0
+        # TN, FP, FN, TP and latency sums per time bucket
+        self._time = TimeBuckets(self.window_seconds, 5)
+        # Requests and their latency sum per time bucket, labelled or not
+        self._requests = TimeBuckets(self.window_seconds, 2)
+        self._decay = shared_array(4)
+        self._decay_latency = 0.0
+        self._decay_at = None
+        self._last_ts = 0.0
+
+        self._lock = shared_lock()
+
+    def update(self, y_true, y_pred, latency, timestamps=None):
+        """
+        Add a labelled batch (``latency`` scalar or per row).
+
+        ``timestamps`` are the epoch seconds the rows were scored at
+        (scalar or per row); ``None`` means now.
+        """
+        cells = (
+            2 * (np.asarray(y_true) == 1) + (np.asarray(y_pred) == 1)
+        ).astype(np.int8)
+        latency = np.broadcast_to(
+            np.asarray(latency, dtype=np.float64), cells.shape
+        )
+        if len(cells) == 0:
+            return
+
+        with self._lock:
+            now = max(time.time(), self._last_ts)
+            self._last_ts = now
+            ts = now if timestamps is None else np.asarray(timestamps, float)
+
+            # Decayed counts see every row, weighted by its age
+            self._decay_to(now)
+            if timestamps is None:
+                self._decay += np.bincount(cells, minlength=4)
+                self._decay_latency += float(latency.sum())
+            else:
+                weights = np.exp(-np.maximum(now - ts, 0.0) / self._tau)
+                weights = np.broadcast_to(weights, cells.shape)
+                self._decay += np.bincount(cells, weights, minlength=4)
+                self._decay_latency += float(latency @ weights)
+
+            rows = np.zeros((len(cells), 5))
+            rows[np.arange(len(cells)), cells] = 1.0
+            rows[:, LATENCY] = latency
+            self._time.add(rows, ts, now)
+
+            # Only the most recent `size` rows fit in the ring
+            cells, latency = cells[-self.size :], latency[-self.size :]
+            start, end = self._total, self._total + len(cells)
+
+            old_oldest = max(0, start - self.size)
+            oldest = max(0, end - self.size)
+            if oldest > old_oldest:
+                counts, lat = self._range(old_oldest, oldest)
+                self._count -= counts
+                self._count_latency -= lat
+
+            offset = 0
+            for sl in self._slices(start, end):
+                n = sl.stop - sl.start
+                self._cells[sl] = cells[offset : offset + n]
+                self._latency[sl] = latency[offset : offset + n]
+                offset += n
+            self._total = end
+
+            self._count += np.bincount(cells, minlength=4)
+            self._count_latency += float(latency.sum())
+
+    def observe_request(self, latency):
+        """Add one scored request to the request-latency window."""
+        with self._lock:
+            now = max(time.time(), self._last_ts)
+            self._last_ts = now
+            self._requests.add([[1.0, latency]], now, now)
+
+    def request_metrics(self):
+        """Requests and their mean latency over the time window."""
+        with self._lock:
+            now = max(time.time(), self._last_ts)
+            count, latency = self._requests.total(now).tolist()
+        return {
+            "num_requests": int(round(count)),
+            "avg_latency": latency / count if count else 0.0,
+        }
+
+    def metrics(self, window):
+        """Metrics for ``window`` in ("count", "time", "decay")."""
+        with self._lock:
+            now = max(time.time(), self._last_ts)
+            if window == "count":
+                counts, lat = self._count, self._count_latency
+            elif window == "time":
+                sums = self._time.total(now)
+                counts = np.rint(sums[:LATENCY]).astype(np.int64)
+                lat = float(sums[LATENCY])
+            elif window == "decay":
+                self._decay_to(now)
+                counts, lat = self._decay, self._decay_latency
+            else:
+                raise ValueError(f"Unknown metrics window: {window!r}")
+            counts = counts.tolist()
+            return confusion_metrics(
+                counts[TP], counts[FP], counts[TN], counts[FN], lat
+            )
+
+    def all_metrics(self):
+        return {window: self.metrics(window) for window in WINDOWS}
+
+    def _decay_to(self, now):
+        if self._decay_at is not None and now > self._decay_at:
+            factor = math.exp(-(now - self._decay_at) / self._tau)
+            self._decay *= factor
+            self._decay_latency *= factor
+        self._decay_at = now
+
+    def _slices(self, start, end):
+        """Ring slices (at most two) covering sequence numbers [start, end)."""
+        n = end - start
+        if n <= 0:
+            return []
+        first = start % self.size
+        if first + n <= self.size:
+            return [slice(first, first + n)]
+        return [slice(first, self.size), slice(0, first + n - self.size)]
+
+    def _range(self, start, end):
+        counts = np.zeros(4, dtype=np.int64)
+        lat = 0.0
+        for sl in self._slices(start, end):
+            counts += np.bincount(self._cells[sl], minlength=4)
+            lat += float(self._latency[sl].sum())
+        return counts, lat
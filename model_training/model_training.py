@@ -40,6 +40,8 @@ Finally, I switch the working directory to the project root so that all subseque
 
 from pathlib import Path
 import os
+import sys
+import json
 import datetime
 import joblib
 
@@ -86,6 +88,10 @@ PROCESSED_DATA_DIR = DATA_DIR / "processed"
 MODELS_DIR = PROJECT_ROOT / "models"
 NOTEBOOKS_DIR = PROJECT_ROOT / "notebooks"
 LOGS_DIR = PROJECT_ROOT / "logs"
+# Flask API sources, relative to the launch directory (the repository root):
+# serving artifacts are written there, where the API loads them by default,
+# and the parity checks import the API's own scorers from it.
+FLASK_APP_DIR = Path(os.environ.get("FLASK_APP_DIR", "flask")).resolve()
 
 
 def set_global_seed(seed: int = 42) -> None:
@@ -902,6 +908,11 @@ In this section, we save:
   - Enables consistent feature scaling during future inference and model deployment,
   - Prevents retraining-time and inference-time preprocessing mismatch.
 
+- **The scaler parameters as plain arrays** (`scaler.json`):
+  - The per-feature `mean_` and `scale_` in `FEATURE_COLS` order,
+  - Loaded by the Flask API's `/predict/raw` endpoint, which applies `feature_engineering` and this scaling to raw `Time, V1..V28, Amount` rows in one vectorized NumPy pass (no pickled sklearn object at serving time),
+  - A parity check replays that NumPy transform on the raw test rows and compares it with `X_test_scaled`.
+
 By explicitly persisting both data splits and preprocessing artifacts, this step strengthens the end-to-end pipeline by ensuring **reproducibility, auditability, and deployment readiness**.
 """
 
@@ -974,6 +985,72 @@ def save_scaler(scaler, model_dir: Path = MODELS_DIR) -> None:
     print(f"Saved scaler to: {scaler_path}")
 
 
+RAW_COLUMNS = ["Time"] + [f"V{i}" for i in range(1, 29)] + ["Amount"]
+
+
+def save_scaler_params(scaler, feature_names: List[str],
+                       model_dir: Path = FLASK_APP_DIR,
+                       filename: str = "scaler.json") -> Path:
+    """
+    Save the fitted StandardScaler's mean and scale as JSON arrays.
+
+    The Flask API loads them for `/predict/raw` instead of unpickling
+    `scaler.pkl`.
+
+    Parameters
+    ----------
+    scaler : StandardScaler
+        The fitted scaler.
+    feature_names : list of str
+        Columns the scaler was fitted on, in model input order.
+    model_dir : Path
+        Directory where the JSON file will be saved.
+    filename : str
+        File name of the JSON file.
+
+    Returns
+    -------
+    Path
+        Path to the saved file.
+    """
+    model_dir.mkdir(parents=True, exist_ok=True)
+    save_path = model_dir / filename
+    with open(save_path, "w") as f:
+        json.dump(
+            {
+                "feature_names": list(feature_names),
+                "mean": scaler.mean_.tolist(),
+                "scale": scaler.scale_.tolist(),
+            },
+            f,
+            indent=2,
+        )
+    print(f"Saved scaler parameters to: {save_path}")
+    return save_path
+
+
+def preprocess_raw_numpy(raw: pd.DataFrame, scaler_path: Path) -> np.ndarray:
+    """
+    Engineer and scale raw `Time, V1..V28, Amount` rows with NumPy only.
+
+    Mirrors `Preprocessor.transform` in the Flask API's preprocessing.py.
+    """
+    with open(scaler_path) as f:
+        params = json.load(f)
+    mean = np.asarray(params["mean"], dtype=np.float64)
+    scale = np.asarray(params["scale"], dtype=np.float64)
+
+    x = raw[RAW_COLUMNS].to_numpy(dtype=np.float64)
+    hour = (x[:, 0] // 3600) % 24
+    features = np.column_stack([
+        x,
+        np.log1p(x[:, -1]),
+        hour,
+        hour < 6,
+    ])
+    return ((features - mean) / scale).astype("float32")
+
+
 # -------- EXECUTE SAVING -------- #
 
 save_split_datasets(
@@ -984,6 +1061,21 @@ save_split_datasets(
 
 save_scaler(scaler)
 
+# Scaler as plain arrays for server-side preprocessing (/predict/raw)
+assert numeric_cols == FEATURE_COLS == RAW_COLUMNS + ["log_amount", "hour", "is_night"], (
+    "Serving expects Time, V1..V28, Amount, log_amount, hour, is_night"
+)
+scaler_params_path = save_scaler_params(scaler, FEATURE_COLS)
+
+# Parity check: raw test rows through the NumPy transform vs the pipeline
+raw_test_features = preprocess_raw_numpy(X_test, scaler_params_path)
+pipeline_test_features = X_test_scaled[FEATURE_COLS].values.astype("float32")
+max_abs_diff = float(np.max(np.abs(raw_test_features - pipeline_test_features)))
+print(f"NumPy preprocessing vs pipeline max |Δx| on X_test: {max_abs_diff:.2e}")
+assert np.allclose(raw_test_features, pipeline_test_features, atol=1e-5), (
+    "NumPy preprocessing does not match feature_engineering + scaler"
+)
+
 print("\nAll processed splits and scaler have been saved successfully.")
 
 """### 16. TensorFlow Input Pipelines with `tf.data`
@@ -2187,9 +2279,14 @@ Two complementary export formats are used:
      - TensorFlow Serving,
      - Conversion to TensorFlow Lite,
      - ONNX export for cross-platform inference.
+   - With two serving signatures:
+     - `serving_default`: the 33 scaled features (unchanged),
+     - `serving_raw`: raw `Time, V1..V28, Amount` rows; `log1p(Amount)`, `hour`, `is_night` and the StandardScaler (fitted `mean_` / `scale_` baked in as constants) run **inside the graph**, so TF Serving does the preprocessing in the same batched call. A parity check compares both signatures of the reloaded export on `X_test`.
 
 A reload sanity check is performed after saving the `.keras` model to ensure that the model can be restored correctly without errors. This step confirms that the trained model is **portable, reusable, and deployment-ready**.
 
+The F1-optimal `best_threshold` from threshold tuning is saved as `decision_threshold.json` in the Flask API directory (`FLASK_APP_DIR`, `flask/` by default). The file is versioned with a timestamp and records the F1 score it was tuned for. The Flask API loads it at startup and labels a transaction as fraud when `probability >= threshold`, instead of using a hard-coded 0.5.
+
 By persisting both formats, the project transitions from model experimentation to **production-oriented machine learning**.
 """
 
@@ -2225,8 +2322,55 @@ def save_keras_model(model: tf.keras.Model, model_dir: Path = MODELS_DIR,
     return save_path
 
 
+def build_raw_serving_fn(model: tf.keras.Model, scaler: StandardScaler,
+                         feature_names: List[str]):
+    """
+    Wrap the model with in-graph feature engineering and scaling.
+
+    The returned `tf.function` takes raw `Time, V1..V28, Amount` rows and
+    derives `log_amount`, `hour` and `is_night` exactly like
+    `feature_engineering`, standardizes them with the fitted scaler's
+    `mean_` / `scale_` (baked in as constants) and calls the model.
+    Mirrors `preprocess_raw_numpy` and the Flask API's preprocessing.py.
+
+    Parameters
+    ----------
+    model : tf.keras.Model
+        Model trained on the 33 scaled features.
+    scaler : StandardScaler
+        Scaler fitted on `feature_names`.
+    feature_names : list of str
+        Model input columns (`RAW_COLUMNS` + engineered features).
+
+    Returns
+    -------
+    tf.function
+        Serving function with a `[None, 30]` float64 input named `raw`.
+    """
+    assert feature_names == RAW_COLUMNS + ["log_amount", "hour", "is_night"]
+    mean = tf.constant(scaler.mean_, dtype=tf.float64)
+    scale = tf.constant(scaler.scale_, dtype=tf.float64)
+
+    @tf.function(input_signature=[
+        tf.TensorSpec([None, len(RAW_COLUMNS)], tf.float64, name="raw")
+    ])
+    def serve_raw(raw):
+        time, amount = raw[:, :1], raw[:, -1:]
+        hour = tf.math.floormod(tf.math.floordiv(time, 3600.0), 24.0)
+        is_night = tf.cast(hour < 6.0, tf.float64)
+        features = tf.concat(
+            [raw, tf.math.log1p(amount), hour, is_night], axis=1
+        )
+        scaled = tf.cast((features - mean) / scale, tf.float32)
+        return model(scaled, training=False)
+
+    return serve_raw
+
+
 def export_saved_model(model: tf.keras.Model, export_dir: Path = MODELS_DIR,
-                       foldername: str = "saved_model_tfserving") -> Path:
+                       foldername: str = "saved_model_tfserving",
+                       scaler: Optional[StandardScaler] = None,
+                       feature_names: Optional[List[str]] = None) -> Path:
     """
     Export the model in TensorFlow SavedModel format.
     This version is suitable for:
@@ -2234,6 +2378,11 @@ def export_saved_model(model: tf.keras.Model, export_dir: Path = MODELS_DIR,
         - TFLite conversion
         - ONNX export
 
+    With a fitted `scaler`, a second `serving_raw` signature is exported
+    next to `serving_default` (33 scaled features): it takes raw
+    transaction rows and runs the preprocessing inside the graph
+    (see `build_raw_serving_fn`).
+
     Parameters
     ----------
     model : tf.keras.Model
@@ -2242,6 +2391,10 @@ def export_saved_model(model: tf.keras.Model, export_dir: Path = MODELS_DIR,
         Directory where SavedModel will be stored.
     foldername : str
         Subfolder for the SavedModel export.
+    scaler : StandardScaler, optional
+        Fitted scaler for the raw-input signature.
+    feature_names : list of str, optional
+        Columns the scaler was fitted on, in model input order.
 
     Returns
     -------
@@ -2251,23 +2404,271 @@ def export_saved_model(model: tf.keras.Model, export_dir: Path = MODELS_DIR,
     export_path = export_dir / foldername
     export_path.mkdir(parents=True, exist_ok=True)
 
-    model.export(export_path)
-    print(f"Exported SavedModel → {export_path.resolve()}")
+    if scaler is None:
+        model.export(export_path)
+        print(f"Exported SavedModel → {export_path.resolve()}")
+        return export_path
+
+    # Same "serve" endpoint as model.export (also written as
+    # serving_default), plus the raw-input endpoint
+    archive = tf.keras.export.ExportArchive()
+    archive.track(model)
+    archive.add_endpoint(
+        name="serve",
+        fn=lambda x: model(x, training=False),
+        input_signature=[
+            tf.TensorSpec([None, len(feature_names)], tf.float32)
+        ],
+    )
+    archive.add_endpoint(
+        name="serving_raw",
+        fn=build_raw_serving_fn(model, scaler, feature_names),
+    )
+    archive.write_out(str(export_path))
+    print(f"Exported SavedModel (serving_default + serving_raw) → "
+          f"{export_path.resolve()}")
 
     return export_path
 
 
+def call_signature(signature, x: np.ndarray) -> np.ndarray:
+    """Run a single-input SavedModel signature and return its output."""
+    input_name = next(iter(signature.structured_input_signature[1]))
+    outputs = signature(**{input_name: tf.constant(x)})
+    return next(iter(outputs.values())).numpy().ravel()
+
+
+def save_decision_threshold(threshold: float, f1: float,
+                            model_dir: Path = FLASK_APP_DIR,
+                            filename: str = "decision_threshold.json") -> Path:
+    """
+    Save the tuned decision threshold served by the Flask API.
+
+    Parameters
+    ----------
+    threshold : float
+        Probability threshold (fraud if probability >= threshold).
+    f1 : float
+        F1-score reached at this threshold on the test set.
+    model_dir : Path
+        Directory where the JSON file will be saved.
+    filename : str
+        File name for the threshold artifact.
+
+    Returns
+    -------
+    Path
+        Full path of the saved JSON file.
+    """
+    model_dir.mkdir(parents=True, exist_ok=True)
+    save_path = model_dir / filename
+    with open(save_path, "w") as f:
+        json.dump(
+            {
+                "threshold": float(threshold),
+                "metric": "f1",
+                "f1": float(f1),
+                "version": datetime.datetime.utcnow().strftime("%Y%m%d%H%M%S"),
+            },
+            f,
+            indent=2,
+        )
+    print(f"Saved decision threshold {threshold:.4f} → {save_path.resolve()}")
+
+    return save_path
+
+
 # -------- EXECUTION PIPELINE -------- #
 
 # Save model in Keras format
 keras_model_path = save_keras_model(model)
 
+# Save the tuned threshold for serving
+threshold_path = save_decision_threshold(best_threshold, best_f1)
+
 # Reload (sanity check)
 loaded_model = tf.keras.models.load_model(keras_model_path)
 print("Model reloaded successfully for sanity check.")
 
-# Export SavedModel
-saved_model_path = export_saved_model(loaded_model)
+# Export SavedModel with the raw-input signature
+saved_model_path = export_saved_model(
+    loaded_model, scaler=scaler, feature_names=FEATURE_COLS
+)
+
+# Parity check: raw test rows through serving_raw vs scaled rows through
+# serving_default
+reloaded_signatures = tf.saved_model.load(str(saved_model_path)).signatures
+default_test_probs = call_signature(
+    reloaded_signatures["serving_default"],
+    X_test_scaled[FEATURE_COLS].values.astype("float32"),
+)
+raw_test_probs = call_signature(
+    reloaded_signatures["serving_raw"],
+    X_test[RAW_COLUMNS].to_numpy(dtype="float64"),
+)
+max_abs_diff = float(np.max(np.abs(default_test_probs - raw_test_probs)))
+print(f"serving_raw vs serving_default max |Δp| on X_test: {max_abs_diff:.2e}")
+assert np.allclose(default_test_probs, raw_test_probs, atol=1e-5), (
+    "In-graph preprocessing does not match feature_engineering + scaler"
+)
+
+"""### 29.5 NumPy Inference Export with BatchNorm Folding
+
+At inference time the main DNN is a plain stack of affine transforms and activations: Dropout is the identity and each BatchNormalization layer applies a fixed per-feature scale and shift. This makes it possible to serve the model **without TensorFlow**.
+
+In `build_dnn_model` each `BatchNormalization` (`bn_1`, `bn_2`) sits *after* the ReLU of its Dense block, so it cannot be merged into the preceding kernel (the ReLU is in between). It is instead folded into the **next** Dense layer:
+
+- `BN(h) = h * s + t` with `s = gamma / sqrt(moving_variance + epsilon)` and `t = beta - moving_mean * s`,
+- `W' = diag(s) @ W` and `b' = t @ W + b` for the Dense layer that follows.
+
+The folded kernels, biases and activation names are written to a compressed `fraud_model.npz`, which the Flask API scores with NumPy only (`INFERENCE_BACKEND=numpy`). Like the other serving artifacts (`baseline_model.npz`, `decision_threshold.json`, `reference_histogram.json`, `scaler.json`), it is written to `FLASK_APP_DIR` (`flask/` relative to the launch directory, overridable by the environment variable), the default location the API loads it from. A parity check scores `X_test_scaled` with the API's own `NumpyModel` (imported from `flask/numpy_model.py`) and compares it with `loaded_model.predict`, confirming that the folded weights reproduce the Keras probabilities with the code that actually serves requests.
+
+The logistic-regression `baseline_model` from section 17 is exported the same way as `baseline_model.npz` (a single sigmoid Dense layer, nothing to fold). The Flask API loads it as an in-process **fallback model**: when TF Serving misses its deadline or the circuit breaker is open, requests are answered by the baseline and flagged as `degraded` instead of failing.
+"""
+
+# ========================================
+# 29.5 NumPy Inference Export (BatchNorm Folding)
+# ========================================
+
+def fold_batchnorm_weights(
+    model: tf.keras.Model
+) -> Tuple[List[np.ndarray], List[np.ndarray], List[str]]:
+    """
+    Fold BatchNormalization layers into the following Dense layer.
+
+    Dropout layers are skipped (identity at inference time).
+
+    Parameters
+    ----------
+    model : tf.keras.Model
+        Trained sequential-style model (Dense / BatchNormalization /
+        Dropout layers only).
+
+    Returns
+    -------
+    kernels, biases, activations
+        Folded float32 kernels and biases, and the activation name of each
+        Dense layer.
+    """
+    kernels, biases, activations = [], [], []
+    pending_scale, pending_shift = None, None
+
+    for layer in model.layers:
+        if isinstance(layer, (layers.InputLayer, layers.Dropout)):
+            continue
+
+        if isinstance(layer, layers.BatchNormalization):
+            gamma, beta, moving_mean, moving_var = [
+                w.astype("float64") for w in layer.get_weights()
+            ]
+            scale = gamma / np.sqrt(moving_var + layer.epsilon)
+            shift = beta - moving_mean * scale
+            if pending_scale is not None:
+                shift = pending_shift * scale + shift
+                scale = pending_scale * scale
+            pending_scale, pending_shift = scale, shift
+            continue
+
+        if isinstance(layer, layers.Dense):
+            kernel, bias = [w.astype("float64") for w in layer.get_weights()]
+            if pending_scale is not None:
+                bias = pending_shift @ kernel + bias
+                kernel = pending_scale[:, None] * kernel
+                pending_scale, pending_shift = None, None
+            kernels.append(kernel.astype("float32"))
+            biases.append(bias.astype("float32"))
+            activations.append(layer.get_config()["activation"])
+            continue
+
+        raise ValueError(f"Unsupported layer for NumPy export: {layer.name}")
+
+    if pending_scale is not None:
+        raise ValueError("BatchNormalization must be followed by a Dense layer.")
+
+    return kernels, biases, activations
+
+
+def export_numpy_weights(model: tf.keras.Model,
+                         model_dir: Path = FLASK_APP_DIR,
+                         filename: str = "fraud_model.npz") -> Path:
+    """
+    Export BatchNorm-folded Dense weights as a compressed .npz archive.
+
+    Parameters
+    ----------
+    model : tf.keras.Model
+        Trained Keras model.
+    model_dir : Path
+        Directory where the archive will be saved.
+    filename : str
+        File name for the exported .npz archive.
+
+    Returns
+    -------
+    Path
+        Full path of the saved archive.
+    """
+    kernels, biases, activations = fold_batchnorm_weights(model)
+
+    arrays = {"activations": np.array(activations)}
+    for i, (kernel, bias) in enumerate(zip(kernels, biases)):
+        arrays[f"kernel_{i}"] = kernel
+        arrays[f"bias_{i}"] = bias
+
+    model_dir.mkdir(parents=True, exist_ok=True)
+    save_path = model_dir / filename
+    np.savez_compressed(save_path, **arrays)
+    print(f"Saved NumPy weights → {save_path.resolve()}")
+
+    return save_path
+
+
+def predict_probabilities_numpy(weights_path: Path,
+                                X: pd.DataFrame) -> np.ndarray:
+    """
+    Score features with the exported .npz weights (NumPy only).
+
+    Uses the Flask API's own `numpy` backend scorer
+    (`flask/numpy_model.py`), so the parity check covers the code that
+    serves requests.
+    """
+    if str(FLASK_APP_DIR) not in sys.path:
+        sys.path.insert(0, str(FLASK_APP_DIR))
+    from numpy_model import NumpyModel
+
+    return NumpyModel(weights_path).predict(X.values.astype("float32"))
+
+
+# -------- EXECUTION PIPELINE -------- #
+
+# Export folded weights for TensorFlow-free serving
+numpy_weights_path = export_numpy_weights(loaded_model)
+
+# Parity check against the reloaded Keras model
+keras_test_probs = loaded_model.predict(
+    X_test_scaled.values.astype("float32"), batch_size=2048, verbose=0
+).ravel()
+numpy_test_probs = predict_probabilities_numpy(numpy_weights_path, X_test_scaled)
+
+max_abs_diff = float(np.max(np.abs(keras_test_probs - numpy_test_probs)))
+print(f"NumPy vs Keras max |Δp| on X_test_scaled: {max_abs_diff:.2e}")
+assert np.allclose(keras_test_probs, numpy_test_probs, atol=1e-5), (
+    "NumPy export does not match loaded_model.predict"
+)
+
+# Baseline logistic regression as the API's degraded-mode fallback model
+baseline_weights_path = export_numpy_weights(
+    baseline_model, filename="baseline_model.npz"
+)
+baseline_keras_probs = baseline_model.predict(
+    X_test_scaled.values.astype("float32"), batch_size=2048, verbose=0
+).ravel()
+baseline_numpy_probs = predict_probabilities_numpy(
+    baseline_weights_path, X_test_scaled
+)
+assert np.allclose(baseline_keras_probs, baseline_numpy_probs, atol=1e-5), (
+    "NumPy export does not match baseline_model.predict"
+)
 
 """### 30. Monitoring and Prediction Drift Simulation
 
@@ -2297,6 +2698,10 @@ This monitoring step includes:
      - **High-risk ratio**: proportion of predictions above the chosen fraud threshold.
    - These summary statistics can be tracked over time to detect **prediction drift** even when ground truth labels are not yet known.
 
+6. **Reference histogram for the serving API**
+   - `save_reference_histogram` bins the test-set `y_probabilities` into equal-mass bins and saves the edges and counts as `reference_histogram.json`.
+   - The Flask API keeps a streaming histogram of served probabilities on the same bins and compares each time window against this reference with PSI and KS distance, raising drift alerts without labels.
+
 By adding this monitoring simulation, the project goes beyond pure model training and evaluation, demonstrating how the fraud detection model could be **observed and validated continuously** in a real-world deployment pipeline.
 
 """
@@ -2405,6 +2810,59 @@ def compute_probability_statistics(
     }
 
 
+def save_reference_histogram(y_prob: np.ndarray,
+                             model_dir: Path = FLASK_APP_DIR,
+                             filename: str = "reference_histogram.json",
+                             bins: int = 20) -> Path:
+    """
+    Save the reference probability histogram used for drift monitoring.
+
+    Bin edges are quantiles of `y_prob`, so each bin holds a similar share
+    of the reference scores (fixed-width bins would put almost every
+    transaction into the first bin). Repeated quantiles are merged and the
+    outer edges are pinned to 0 and 1.
+
+    Parameters
+    ----------
+    y_prob : np.ndarray
+        Reference predicted probabilities (e.g. on the test set).
+    model_dir : Path
+        Directory where the JSON file will be saved.
+    filename : str
+        File name for the reference histogram.
+    bins : int
+        Target number of bins.
+
+    Returns
+    -------
+    Path
+        Full path of the saved JSON file.
+    """
+    inner = np.unique(np.quantile(y_prob, np.linspace(0, 1, bins + 1))[1:-1])
+    inner = inner[(inner > 0.0) & (inner < 1.0)]
+    edges = np.concatenate([[0.0], inner, [1.0]])
+    counts = np.bincount(
+        np.searchsorted(inner, y_prob, side="right"), minlength=len(edges) - 1
+    )
+
+    model_dir.mkdir(parents=True, exist_ok=True)
+    save_path = model_dir / filename
+    with open(save_path, "w") as f:
+        json.dump(
+            {
+                "bin_edges": edges.tolist(),
+                "counts": counts.tolist(),
+                "num_samples": int(len(y_prob)),
+                "created": datetime.datetime.utcnow().isoformat(),
+            },
+            f,
+            indent=2,
+        )
+    print(f"Saved reference histogram ({len(edges) - 1} bins) → {save_path.resolve()}")
+
+    return save_path
+
+
 def plot_probability_distribution(y_prob: np.ndarray) -> None:
     """Plot the histogram of predicted probabilities."""
     plt.figure(figsize=(7, 4))
@@ -2446,6 +2904,9 @@ print("\nMonitoring Statistics:")
 for key, value in monitor_stats.items():
     print(f"  {key.replace('_',' ').title()}: {value:.4f}")
 
+# 6. Save the reference histogram for streaming drift detection in the API
+reference_histogram_path = save_reference_histogram(y_probabilities)
+
 """### Interpretation of Drift Simulation and Monitoring Statistics
 
 In this simulated production batch of 500 transactions, the **AUC is reported as undefined** because the batch happens to contain only one class (either all legitimate or effectively no fraud cases). This situation is entirely realistic in production fraud detection, where fraud is extremely rare and short time windows (e.g., hourly batches) may easily contain **zero or very few fraud labels**. It also highlights why relying solely on labeled metrics for real-time monitoring is risky—labels may be delayed, sparse, or unavailable.
@@ -4,6 +4,8 @@ import os
 
 import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.ipc
 import requests
 from google.cloud import storage
 from google.oauth2 import service_account
@@ -16,8 +18,12 @@ import streamlit as st
 logging.basicConfig(level=logging.DEBUG)
 
 FLASK_URL = "https://fraud-api-447240734112.us-central1.run.app/predict"
+# Raw Time, V1..V28, Amount rows: the API engineers and scales features
+FLASK_RAW_URL = FLASK_URL + "/raw"
+RAW_COLUMNS = ["Time"] + [f"V{i}" for i in range(1, 29)] + ["Amount"]
 GCS_BUCKET = "credit2025-batch-uploads"
 GCS_SECRET_PATH = "/secrets/gcs_service_account.json"  # mounted secret
+ARROW_CONTENT_TYPE = "application/vnd.apache.arrow.stream"
 
 # -----------------------------
 # Initialize GCS client using service account secret
@@ -51,23 +57,33 @@ default_values = (
     "0.405797,0.371406,1.251474,-1.716841,3.293063"
 )
 
-user_input = st.text_area("Paste 33 feature values separated by commas", default_values)
+user_input = st.text_area(
+    "Paste 33 scaled feature values, or 30 raw values "
+    "(Time, V1..V28, Amount), separated by commas",
+    default_values,
+)
 true_class_input = st.selectbox("True class (optional)", options=[None, 0, 1])
 
 if st.button("Predict Single Transaction"):
     try:
         values = [float(x.strip()) for x in user_input.split(",") if x.strip()]
-        if len(values) != 33:
-            st.error(f"You must enter exactly 33 values! You entered {len(values)}.")
+        if len(values) not in (33, len(RAW_COLUMNS)):
+            st.error(
+                f"You must enter exactly 33 (scaled) or {len(RAW_COLUMNS)} "
+                f"(raw) values! You entered {len(values)}."
+            )
         else:
-            x = np.array(values).reshape(1, -1).astype(np.float32)
+            url = FLASK_URL if len(values) == 33 else FLASK_RAW_URL
+            x = np.array(values).reshape(1, -1)
+            if url == FLASK_URL:
+                x = x.astype(np.float32)
             x = np.nan_to_num(x)
             payload = {"instances": x.tolist()}
             if true_class_input is not None:
                 payload["true_class"] = int(true_class_input)
 
             logging.debug(f"Sending single transaction payload to Flask: {payload}")
-            response = requests.post(FLASK_URL, json=payload)
+            response = requests.post(url, json=payload)
             logging.debug(
                 f"Flask response status: {response.status_code}, content: {response.text}"
             )
@@ -145,19 +161,39 @@ if st.button("Predict CSV"):
             # Only show predictions, not preview
             if "Class" in df.columns:
                 X = df.drop(columns=["Class"])
-                y = df["Class"].astype(int).tolist()
             else:
                 X = df.copy()
-                y = None
 
-            X = X.apply(pd.to_numeric, errors="coerce").dropna().astype(np.float32)
-            payload = {"instances": X.values.tolist()}
-            if y is not None:
-                payload["true_class"] = y
+            # Raw transactions (no engineered columns) are preprocessed by
+            # the API; the named Arrow columns are matched by the server
+            raw = "log_amount" not in X.columns and set(RAW_COLUMNS) <= set(X.columns)
+            if raw:
+                X = X[RAW_COLUMNS]
+            url = FLASK_RAW_URL if raw else FLASK_URL
+
+            X = X.apply(pd.to_numeric, errors="coerce").dropna()
+            X = X.astype(np.float64 if raw else np.float32)
+
+            # Send as an Arrow IPC stream: binary float32 columns instead of
+            # a JSON list of lists
+            table = pa.Table.from_pandas(X, preserve_index=False)
+            if "Class" in df.columns:
+                y = df.loc[X.index, "Class"].astype(np.int64)
+                table = table.append_column("true_class", pa.array(y))
+            sink = pa.BufferOutputStream()
+            with pa.ipc.new_stream(sink, table.schema) as writer:
+                writer.write_table(table)
 
             # Send to Flask API
             logging.debug(f"Sending batch payload to Flask: {len(X)} instances")
-            response = requests.post(FLASK_URL, json=payload)
+            response = requests.post(
+                url,
+                data=sink.getvalue().to_pybytes(),
+                headers={
+                    "Content-Type": ARROW_CONTENT_TYPE,
+                    "Accept": "application/json",
+                },
+            )
             result = response.json()
 
             if "error" in result:
@@ -0,0 +1,6 @@
+import sys
+from pathlib import Path
+
+# The API modules import each other as top-level modules (see flask/)
+FLASK_DIR = Path(__file__).resolve().parent.parent / "flask"
+sys.path.insert(0, str(FLASK_DIR))
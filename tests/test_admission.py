@@ -0,0 +1,43 @@
+import threading
+
+import pytest
+from admission import BULK, INTERACTIVE, Admission, Overloaded
+
+
+def test_full_bulk_lane_is_rejected_and_leaves_interactive_a_thread():
+    admission = Admission(enabled=True, threads=4, queue_timeout=5)
+    release = threading.Event()
+    started = threading.Semaphore(0)
+
+    def slow_predict(data):
+        started.release()
+        release.wait(10)
+        return data
+
+    # Bulk requests take every thread but the reserved one
+    holders = [
+        threading.Thread(
+            target=admission.score, args=(slow_predict, [0.0], BULK)
+        )
+        for _ in range(admission.bulk_threads)
+    ]
+    for holder in holders:
+        holder.start()
+    for _ in holders:
+        assert started.acquire(timeout=5)
+
+    try:
+        # Another bulk request is turned away instead of parked on a thread
+        with pytest.raises(Overloaded):
+            admission.score(slow_predict, [0.0], BULK)
+
+        # The reserved thread still scores an interactive request
+        assert admission.score(lambda data: data, [1.0], INTERACTIVE) == [1.0]
+    finally:
+        release.set()
+        for holder in holders:
+            holder.join(5)
+
+    lanes = admission.stats()["lanes"]
+    assert lanes[BULK]["rejected"] == {"threads_full": 1}
+    assert lanes[INTERACTIVE]["admitted"] == 1
@@ -0,0 +1,76 @@
+import json
+import os
+import subprocess
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from conftest import FLASK_DIR
+from shared import StepCounter
+
+# One monitor in a process of its own (not forked from the other one):
+# reports its summary role, waits for "go", records labelled batches and
+# prints the TensorBoard steps it used
+MONITOR_SCRIPT = """
+import json, sys
+import numpy as np
+from monitoring import PredictionMonitor
+
+monitor = PredictionMonitor(sys.argv[1])
+monitor.start()
+steps = []
+next_step = monitor._steps.next
+monitor._steps.next = lambda: steps.append(next_step()) or steps[-1]
+print(monitor.summaries.stats()["role"], flush=True)
+sys.stdin.readline()
+for _ in range(20):
+    monitor.record(np.array([0.9, 0.1], np.float32), 0.01, [1, 0])
+monitor.close()
+print(json.dumps(steps), flush=True)
+"""
+
+
+def _draw(path, n):
+    counter = StepCounter(path)
+    return [counter.next() for _ in range(n)]
+
+
+def test_step_counter_is_unique_across_unrelated_processes(tmp_path):
+    path = str(tmp_path / "monitoring.db.steps")
+    with ProcessPoolExecutor(4) as pool:
+        draws = list(pool.map(_draw, [path] * 4, [250] * 4))
+    steps = [step for draw in draws for step in draw]
+    assert sorted(steps) == list(range(1000))
+
+
+def test_non_inherited_monitors_share_steps_and_one_event_file(tmp_path):
+    logdir = tmp_path / "tensorboard"
+    env = {
+        **os.environ,
+        "TENSORBOARD_LOGDIR": str(logdir),
+        "SUMMARY_WRITER": "native",
+        "ALERT_EVAL_SECS": "0",
+        "ROLLUP_INTERVAL_SECS": "0",
+    }
+    db = str(tmp_path / "monitoring.db")
+    procs = []
+    for _ in range(2):
+        proc = subprocess.Popen(
+            [sys.executable, "-c", MONITOR_SCRIPT, db],
+            cwd=FLASK_DIR,
+            env=env,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            text=True,
+        )
+        procs.append((proc, proc.stdout.readline().strip()))
+
+    steps = []
+    for proc, _ in procs:
+        out, _ = proc.communicate("go\n", timeout=60)
+        assert proc.returncode == 0
+        steps += json.loads(out.strip().splitlines()[-1])
+
+    assert sorted(role for _, role in procs) == ["discarding", "writer"]
+    assert len(steps) == 40
+    assert len(set(steps)) == len(steps)
+    assert len(list(logdir.glob("events.out.tfevents.*"))) == 1